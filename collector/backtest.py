@@ -0,0 +1,306 @@
+# -*- coding: utf-8 -*-
+"""
+임계값 백테스트 / 그리드 스윕
+
+public/data/YYYY-MM-DD/ 에 쌓인 날짜별 metrics_all 스냅샷을 모두 읽어
+(날짜, 종목) 패널을 만들고, 임계값 조합 그리드 전체를 벡터 마스크로 평가한다.
+  - 조건 : 공매도 비중 ≥ TH_SHORT_RATIO, ret14_pct ≥ TH_RET14, rsi14 ≥ TH_RSI,
+           외인·기관 동시 순매도 최장 연속일 ≥ STREAK (0이면 투자자 조건 없음)
+  - 점수 : 일봉 캐시(price_cache)의 종가로 계산한 기준일 이후 N거래일 수익률
+조합 묶음을 프로세스 풀에 나눠 보내 코어 수만큼 병렬로 계산한다. 키움 접속은 필요 없다.
+
+주의
+  - metrics_all 은 step2의 공매도 압력 필터(스크린 열 규칙) 통과 종목만 담고 있으므로
+    그보다 낮은 공매도 비중 임계값은 실제 운영값과 같은 결과가 된다.
+  - 연속 순매도 일수는 해당 날짜 투자자 원자료(통합 아카이브, 없으면 per_stock/investors/ CSV)가 있는
+    종목(당시 1차 필터 통과 종목)만 계산된다. 원자료가 없는 종목은 STREAK ≥ 1 조합에서 제외된다.
+
+사용 예: python backtest.py --horizons 5 10 20 --workers 8 --top 30
+"""
+
+import argparse
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from common import DATA_ROOT, DATE_DIR_RE, read_typed
+from price_cache import DailyBarCache
+from flow_engine import flow_metrics
+from screen import load_screen, threshold
+from snapshot import read_snapshot
+from stock_archive import ARCHIVE_PATH, StockArchive
+
+# ====== 경로 ======
+OUT_DIR = r"digger-25-short-reco-site\backtest"
+
+# 패널/연속 순매도 계산에 필요한 열만 읽음
+PANEL_COLS = ("종목코드", "종목명", "공매도 비중", "ret14_pct", "rsi14")
+INVESTOR_COLS = ("일자", "외국인투자자", "기관계")
+
+# ====== 평가 설정 ======
+# 기준일 이후 몇 거래일 수익률로 평가할지
+HORIZONS = (5, 10, 20)
+
+# 현재 운영 임계값 (step2/step3 와 같은 스크린 규칙에서 읽음) — 결과에 표시용
+_LIVE = load_screen()
+LIVE_THRESHOLDS = {"short_ratio": threshold(_LIVE, "공매도 비중"), "ret14": threshold(_LIVE, "ret14_pct"),
+                   "rsi": threshold(_LIVE, "rsi14"), "streak": threshold(_LIVE, "netsell_streak")}
+
+# 기본 그리드: 16 × 21 × 21 × 6 = 42,336 조합
+GRID = {
+    "short_ratio": np.round(np.arange(2.5, 10.01, 0.5), 2),
+    "ret14": np.round(np.arange(0.0, 50.01, 2.5), 2),
+    "rsi": np.round(np.arange(40.0, 90.01, 2.5), 2),
+    "streak": np.array([0, 1, 2, 3, 4, 5]),
+}
+
+# 워커 1회 작업 단위 조합 수 / 조합 × 패널 행 마스크 블록 크기
+CHUNK_COMBOS = 2000
+MASK_BLOCK = 256
+
+
+# ====== 패널 구성 ======
+def list_snapshot_dates(data_root: str = DATA_ROOT):
+    """metrics_all 스냅샷이 있는 날짜 폴더 목록 (오름차순)"""
+    if not os.path.isdir(data_root):
+        return []
+    dates = []
+    for name in sorted(os.listdir(data_root)):
+        folder = os.path.join(data_root, name)
+        if DATE_DIR_RE.match(name) and any(
+            os.path.exists(os.path.join(folder, f"metrics_all.{ext}")) for ext in ("parquet", "csv")
+        ):
+            dates.append(name)
+    return dates
+
+
+def load_streaks(folder: str, codes, archive: StockArchive = None) -> pd.Series:
+    """
+    종목별 최장 연속 순매도 일수 (없으면 NaN).
+    원자료는 통합 아카이브의 그 날짜 스냅샷, 아카이브에 없는 종목은 날짜 폴더의 per_stock/investors/{code}_investors.csv
+    그날 원자료를 모두 모은 뒤 수급 배치 엔진(flow_metrics)을 한 번만 호출한다.
+    """
+    inv_dir = os.path.join(folder, "per_stock", "investors")
+    asof = os.path.basename(os.path.normpath(folder))
+    archived = set(archive.codes("investors", asof)) if archive is not None else set()
+    histories = {}
+    for code in codes:
+        if code in archived:
+            histories[code] = archive.read("investors", code, asof)
+            continue
+        path = os.path.join(inv_dir, f"{code}_investors.csv")
+        if not os.path.exists(path):
+            continue
+        try:
+            histories[code] = read_typed(path, "investors", usecols=INVESTOR_COLS)
+        except Exception as e:
+            print(f"[WARN] 투자자 원자료 읽기 실패 ({path}): {e}")
+    streak = flow_metrics(histories)["netsell_streak"].astype("float64")
+    return streak.reindex(list(codes))
+
+
+def load_panel(data_root: str = DATA_ROOT, dates=None) -> pd.DataFrame:
+    """
+    날짜별 metrics_all → 하나의 패널
+    열: 날짜, 종목코드, 종목명, 공매도 비중, ret14_pct, rsi14, streak
+    """
+    frames = []
+    path = os.path.join(data_root, os.path.basename(ARCHIVE_PATH))
+    archive = StockArchive(path) if os.path.exists(path) else None
+    for d in dates or list_snapshot_dates(data_root):
+        folder = os.path.join(data_root, d)
+        try:
+            met = read_snapshot(folder, "metrics_all", usecols=PANEL_COLS)
+        except Exception as e:
+            print(f"[WARN] {d} metrics_all 읽기 실패: {e}")
+            continue
+        need = ["종목코드", "공매도 비중", "ret14_pct", "rsi14"]
+        if any(c not in met.columns for c in need):
+            print(f"[SKIP] {d} metrics_all 필수 컬럼 없음")
+            continue
+        part = met[need + (["종목명"] if "종목명" in met.columns else [])].copy()
+        part.insert(0, "날짜", d)
+        part["streak"] = load_streaks(folder, part["종목코드"], archive).to_numpy()
+        frames.append(part)
+    if not frames:
+        return pd.DataFrame(columns=["날짜", "종목코드", "공매도 비중", "ret14_pct", "rsi14", "streak"])
+    return pd.concat(frames, ignore_index=True)
+
+
+def attach_forward_returns(panel: pd.DataFrame, cache: DailyBarCache = None,
+                           horizons=HORIZONS) -> pd.DataFrame:
+    """
+    기준일 종가(기준일 이하 마지막 봉) 대비 h거래일 뒤 종가 수익률[%] 열 fwd{h}_pct 추가.
+    캐시에 이후 봉이 아직 없으면 NaN.
+    """
+    cache = cache or DailyBarCache()
+    out = panel.copy()
+    for h in horizons:
+        out[f"fwd{h}_pct"] = np.nan
+    day_keys = out["날짜"].str.replace("-", "").to_numpy()
+
+    for code, idx in out.groupby("종목코드").indices.items():
+        bars = cache.load(code)
+        if bars.empty:
+            continue
+        bars = bars.iloc[::-1]   # 과거→최신
+        dates = bars["일자"].to_numpy().astype(str)
+        close = bars["현재가"].to_numpy(dtype="float64")
+        entry = np.searchsorted(dates, day_keys[idx], side="right") - 1
+        for h in horizons:
+            exit_ = entry + h
+            ok = (entry >= 0) & (exit_ < len(close))
+            ret = np.full(len(idx), np.nan)
+            ret[ok] = (close[exit_[ok]] / close[entry[ok]] - 1.0) * 100.0
+            out.loc[out.index[idx], f"fwd{h}_pct"] = ret
+    return out
+
+
+# ====== 그리드 평가 (워커) ======
+_PANEL = {}
+
+
+def _init_worker(arrays: dict):
+    """프로세스 풀 초기화: 패널 배열을 워커마다 한 번만 전달받음"""
+    _PANEL.clear()
+    _PANEL.update(arrays)
+
+
+def evaluate_combos(combos: np.ndarray, arrays: dict = None) -> np.ndarray:
+    """
+    combos: shape (C, 4) [short_ratio, ret14, rsi, streak]
+    반환: shape (C, 2 + 3 * H) [종목수, 편입일수, (평균수익률, 적중률, 평가건수) × H]
+    """
+    a = arrays if arrays is not None else _PANEL
+    sr, ret, rsi, streak = a["short_ratio"], a["ret14"], a["rsi"], a["streak"]
+    day_starts, fwd = a["day_starts"], a["fwd"]          # (D,) 날짜 구간 시작 행, (N, H)
+    fwd_ok = ~np.isnan(fwd)
+    fwd0 = np.where(fwd_ok, fwd, 0.0)
+    hit = (fwd0 > 0).astype("float64")
+    n_h = fwd.shape[1]
+
+    out = np.empty((len(combos), 2 + 3 * n_h), dtype="float64")
+    for start in range(0, len(combos), MASK_BLOCK):
+        c = combos[start:start + MASK_BLOCK]
+        # (블록, N) 불리언 마스크 — NaN 비교는 False 이므로 지표 결측 종목은 자동 제외
+        mask = (
+            (sr[None, :] >= c[:, 0:1])
+            & (ret[None, :] >= c[:, 1:2])
+            & (rsi[None, :] >= c[:, 2:3])
+            & ((c[:, 3:4] <= 0) | (streak[None, :] >= c[:, 3:4]))
+        )
+        m = mask.astype("float64")
+        n_picks = m.sum(axis=1)
+        # 행이 날짜순이므로 날짜 구간별 OR 로 편입일수 계산 (O(블록 × N))
+        n_days = np.logical_or.reduceat(mask, day_starts, axis=1).sum(axis=1) if len(day_starts) else 0
+        cnt = m @ fwd_ok.astype("float64")
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = (m @ fwd0) / cnt
+            hits = (m @ (hit * fwd_ok)) / cnt
+        block = out[start:start + len(c)]
+        block[:, 0], block[:, 1] = n_picks, n_days
+        block[:, 2::3], block[:, 3::3], block[:, 4::3] = mean, hits, cnt
+    return out
+
+
+def panel_arrays(panel: pd.DataFrame, horizons=HORIZONS) -> dict:
+    """
+    패널 DataFrame → 워커에 넘길 float 배열 묶음.
+    행은 날짜순으로 정렬하고 날짜마다 첫 행 위치(day_starts)만 넘긴다 (행 × 날짜 행렬 없음)
+    """
+    _, day_idx = np.unique(panel["날짜"].to_numpy().astype(str), return_inverse=True)
+    order = np.argsort(day_idx, kind="stable")
+    day_idx = day_idx[order]
+    day_starts = np.flatnonzero(np.r_[True, day_idx[1:] != day_idx[:-1]]) if len(day_idx) else np.zeros(0, "int64")
+    num = lambda c: pd.to_numeric(panel[c], errors="coerce").to_numpy(dtype="float64")[order]
+    return {
+        "short_ratio": num("공매도 비중"),
+        "ret14": num("ret14_pct"),
+        "rsi": num("rsi14"),
+        "streak": num("streak"),
+        "day_starts": day_starts,
+        "fwd": np.column_stack([num(f"fwd{h}_pct") for h in horizons]) if horizons else np.zeros((len(panel), 0)),
+    }
+
+
+def build_grid(grid: dict = None) -> np.ndarray:
+    g = grid or GRID
+    return np.array(list(itertools.product(g["short_ratio"], g["ret14"], g["rsi"], g["streak"])), dtype="float64")
+
+
+def sweep(panel: pd.DataFrame, grid: dict = None, horizons=HORIZONS, workers: int = None) -> pd.DataFrame:
+    """그리드 전체 평가 → 조합별 결과 DataFrame"""
+    combos = build_grid(grid)
+    arrays = panel_arrays(panel, horizons)
+    chunks = [combos[i:i + CHUNK_COMBOS] for i in range(0, len(combos), CHUNK_COMBOS)]
+    workers = workers or os.cpu_count() or 1
+    print(f"[BT] 패널 {len(panel)}행 × 조합 {len(combos)}개 → 작업 {len(chunks)}개 / 워커 {workers}개")
+
+    if workers <= 1 or len(chunks) <= 1:
+        parts = [evaluate_combos(ch, arrays) for ch in chunks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(arrays,)) as pool:
+            parts = list(pool.map(evaluate_combos, chunks))
+
+    cols = ["종목수", "편입일수"]
+    for h in horizons:
+        cols += [f"fwd{h}_평균", f"fwd{h}_적중률", f"fwd{h}_평가건수"]
+    res = pd.DataFrame(np.vstack(parts) if parts else np.zeros((0, len(cols))), columns=cols)
+    res.insert(0, "TH_SHORT_RATIO", combos[:, 0])
+    res.insert(1, "TH_RET14", combos[:, 1])
+    res.insert(2, "TH_RSI", combos[:, 2])
+    res.insert(3, "STREAK", combos[:, 3].astype("int64"))
+    live = LIVE_THRESHOLDS
+    res["운영값"] = (
+        (res["TH_SHORT_RATIO"] == live["short_ratio"]) & (res["TH_RET14"] == live["ret14"])
+        & (res["TH_RSI"] == live["rsi"]) & (res["STREAK"] == live["streak"])
+    )
+    return res
+
+
+# ====== 실행 ======
+def parse_args():
+    p = argparse.ArgumentParser(description="날짜별 스냅샷 임계값 백테스트")
+    p.add_argument("--data-root", default=DATA_ROOT)
+    p.add_argument("--from", dest="date_from", default=None, help="YYYY-MM-DD (포함)")
+    p.add_argument("--to", dest="date_to", default=None, help="YYYY-MM-DD (포함)")
+    p.add_argument("--horizons", type=int, nargs="+", default=list(HORIZONS))
+    p.add_argument("--workers", type=int, default=None, help="프로세스 수 (기본: CPU 코어 수)")
+    p.add_argument("--min-picks", type=int, default=5, help="순위 집계에 필요한 최소 평가건수")
+    p.add_argument("--top", type=int, default=20)
+    p.add_argument("--out", default=None, help="결과 CSV 경로 (기본: backtest/sweep_{마지막날짜}.csv)")
+    return p.parse_args()
+
+
+def main():
+    args = parse_args()
+    dates = [d for d in list_snapshot_dates(args.data_root)
+             if (not args.date_from or d >= args.date_from) and (not args.date_to or d <= args.date_to)]
+    if not dates:
+        print(f"[종료] 스냅샷 없음: {args.data_root}")
+        return
+    print(f"[BT] 스냅샷 {len(dates)}일: {dates[0]} ~ {dates[-1]}")
+
+    panel = load_panel(args.data_root, dates)
+    panel = attach_forward_returns(panel, horizons=args.horizons)
+    res = sweep(panel, horizons=args.horizons, workers=args.workers)
+
+    out = args.out or os.path.join(OUT_DIR, f"sweep_{dates[-1]}.csv")
+    os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+    res.to_csv(out, index=False, encoding="utf-8-sig")
+    print(f"[SAVED] {out} (rows={len(res)})")
+
+    key = f"fwd{args.horizons[0]}"
+    ranked = res.loc[res[f"{key}_평가건수"] >= args.min_picks].sort_values(f"{key}_평균", ascending=False)
+    with pd.option_context("display.width", 200, "display.max_columns", None):
+        print(f"\n[TOP {args.top}] {key}_평균 기준 (평가건수 ≥ {args.min_picks})")
+        print(ranked.head(args.top).to_string(index=False))
+        print("\n[운영값]")
+        print(res.loc[res["운영값"]].to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
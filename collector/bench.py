@@ -0,0 +1,377 @@
+# -*- coding: utf-8 -*-
+"""
+합성 시장 벤치마크
+
+종목 100 / 1,000 / 3,000개짜리 합성 시장(수년치 일봉 + 투자자 순매수)을 만들어
+크롬·실제 KRX·키움 로그인 없이 수집기 전체를 돌리고 처리량/지연시간/메모리를 잰다.
+  - KRX    : krx_stub_server 핸들러를 프로세스 안 스레드로 띄워 합성 kospi/kosdaq CSV 를 응답
+  - 키움   : fake_entrypoint.FakeKiwoomEntrypoint 를 koapy.KiwoomOpenApiPlusEntrypoint 자리에 끼움
+  - 지연   : --tr-latency / --krx-latency 로 응답 지연, --tr-rate 로 초당 TR 제한 조절
+             (가짜 키움은 응답마다 합성 이력을 새로 만들므로 그 시간도 TR 지연에 포함된다)
+측정 항목 (규모마다 새 프로세스 / 새 작업 폴더 → 캐시·메모리가 섞이지 않음)
+  - filter_by_short_pressure           : 행/초
+  - calc_ret14_and_rsi_from_chart      : 종목별 지연시간 분포, 종목/초 (batch_indicators 와 비교)
+  - opt10059 연속 순매도 판단(step3)   : 종목별 지연시간 분포 (원자료 저장 포함, flow_metrics 배치 계산과 비교)
+  - main.py 오케스트레이션             : 캐시 없는 첫 실행(cold) / 캐시가 찬 재실행(warm)의
+                                         벽시계 시간, 종목/초, run_report 의 스테이지·TR 지연시간
+  - 메모리 : 구간별 tracemalloc 최대치, 프로세스 peak RSS
+결과는 bench/bench_{날짜}_{시각}.json 으로 저장하고, --baseline 을 주면 처리량이
+REGRESSION_TOLERANCE 이상 떨어진 항목을 표시한다 (종료 코드 1).
+
+사용 예: python bench.py --sizes 100 1000 3000 --years 3 --tr-latency 0.01
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import types
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from http.server import ThreadingHTTPServer
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from fake_entrypoint import FakeKiwoomEntrypoint
+from run_report import LatencyStats, peak_rss_mb
+from screen import parse_screen
+
+# ====== 경로 ======
+OUT_DIR = r"digger-25-short-reco-site\bench"
+
+# ====== 기본 설정 ======
+SIZES = (100, 1000, 3000)
+BENCH_DATE = "2025-08-27"
+TRADING_DAYS_PER_YEAR = 250
+
+# 마이크로 벤치마크 반복/표본 수
+FILTER_REPEAT = 20
+MAX_SAMPLES = 500   # 종목별 지연시간 표본 (규모가 커도 이 수만 측정)
+
+# 오케스트레이션에서 step3 까지 부하가 가도록 chart 규칙을 완화한 스크린
+BENCH_SCREEN = [
+    {"field": "공매도 비중", "op": ">=", "value": 2.5},
+    {"field": "ret14_pct", "op": ">=", "value": 0.0},
+    {"field": "rsi14", "op": ">=", "value": 50.0},
+    {"field": "netsell_streak", "op": ">=", "value": 3},
+]
+
+# 기준 결과 대비 처리량 하락 허용 비율
+REGRESSION_TOLERANCE = 0.2
+
+# KRX 다운로드 CSV 열 (순서 그대로)
+KRX_COLUMNS = ["순위", "종목코드", "종목명", "공매도 거래대금", "거래대금", "공매도 비중",
+               "공매도 거래대금 증가배율", "직전40거래일 공매도 비중 평균", "공매도 비중 증가배율", "주가 수익률"]
+
+
+# ====== 합성 시장 ======
+def synthetic_codes(n: int):
+    """서로 다른 6자리 종목코드 n개 (앞자리 0 포함)"""
+    return [f"{(i * 37) % 1000000:06d}" for i in range(1, n + 1)]
+
+
+def synthetic_krx(n: int, seed: int = 0) -> dict:
+    """{시장: KRX 공매도 상위 화면과 같은 열의 DataFrame} — 종목을 KOSPI/KOSDAQ 에 반씩 나눔"""
+    rng = np.random.default_rng(seed)
+    codes = synthetic_codes(n)
+    out = {}
+    for m, market in enumerate(("KOSPI", "KOSDAQ")):
+        part = codes[m::2]
+        k = len(part)
+        value = rng.integers(1_000_000_000, 500_000_000_000, k)
+        ratio = np.round(rng.gamma(2.0, 3.0, k), 2)
+        prev_avg = np.round(ratio / rng.uniform(0.5, 4.0, k), 2)
+        df = pd.DataFrame({
+            "종목코드": part,
+            "종목명": [f"종목{c}" for c in part],
+            "공매도 거래대금": np.round(value * ratio / 100).astype("int64"),
+            "거래대금": value,
+            "공매도 비중": ratio,
+            "공매도 거래대금 증가배율": np.round(rng.uniform(0.2, 6.0, k), 2),
+            "직전40거래일 공매도 비중 평균": prev_avg,
+            "공매도 비중 증가배율": np.round(ratio / np.maximum(prev_avg, 0.01), 2),
+            "주가 수익률": np.round(rng.normal(0, 3, k), 2),
+        }).sort_values("공매도 비중", ascending=False)
+        df.insert(0, "순위", np.arange(1, k + 1))
+        out[market] = df[KRX_COLUMNS].reset_index(drop=True)
+    return out
+
+
+def write_krx_csvs(markets: dict, data_root: str, date: str):
+    """krx_stub_server 가 읽는 public/data/{date}/kospi.csv·kosdaq.csv (EUC-KR, 전 열 따옴표)"""
+    folder = os.path.join(data_root, date)
+    os.makedirs(folder, exist_ok=True)
+    for market, df in markets.items():
+        df.to_csv(os.path.join(folder, f"{market.lower()}.csv"), index=False, encoding="euc-kr",
+                  quoting=1)  # csv.QUOTE_ALL
+
+
+def combined_candidates(markets: dict) -> pd.DataFrame:
+    """step1 결과와 같은 형태 (market 열 추가, 종목코드 문자열)"""
+    dfs = [df.assign(market=market) for market, df in markets.items()]
+    return pd.concat(dfs, ignore_index=True)
+
+
+# ====== 인프로세스 가짜 백엔드 ======
+@contextlib.contextmanager
+def krx_server(data_root: str, latency: float):
+    """krx_stub_server 핸들러를 임의 포트로 띄우고 krx_http.KRX_BASE_URL 을 가리킴"""
+    import krx_http
+    from krx_stub_server import make_handler
+
+    class QuietHandler(make_handler(data_root, latency)):
+        def log_message(self, fmt, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), QuietHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    krx_http.KRX_BASE_URL = f"http://127.0.0.1:{server.server_address[1]}"
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def install_fake_koapy(factory):
+    """step 모듈 import 전에 koapy.KiwoomOpenApiPlusEntrypoint 를 가짜로 교체"""
+    sys.modules["koapy"] = types.SimpleNamespace(KiwoomOpenApiPlusEntrypoint=factory)
+
+
+# ====== 측정 도구 ======
+# tracemalloc 은 할당마다 추적해 pandas 가 몇 배 느려지므로 --tracemalloc 일 때만 사용
+TRACE_MEMORY = False
+
+
+@contextlib.contextmanager
+def measure(result: dict):
+    """벽시계 시간 + 구간 종료 시 프로세스 peak RSS (+ TRACE_MEMORY 면 tracemalloc 최대치)를 result 에 기록"""
+    if TRACE_MEMORY:
+        tracemalloc.start()
+    t0 = time.perf_counter()
+    try:
+        yield result
+    finally:
+        result["wall_s"] = round(time.perf_counter() - t0, 4)
+        peak = peak_rss_mb()
+        result["peak_rss_mb"] = None if peak is None else round(peak, 1)
+        if TRACE_MEMORY:
+            result["tracemalloc_peak_mb"] = round(tracemalloc.get_traced_memory()[1] / 2**20, 2)
+            tracemalloc.stop()
+
+
+def per_item(fn, items, result: dict, unit: str = "tickers"):
+    """items 마다 fn(item) 지연시간 분포 + 처리량"""
+    stats = LatencyStats()
+    with measure(result):
+        for item in items:
+            t0 = time.perf_counter()
+            fn(item)
+            stats.add(time.perf_counter() - t0)
+    result.update({k: v for k, v in stats.summary().items() if k != "histogram_ms"})
+    result[f"{unit}_per_s"] = round(len(items) / max(result["wall_s"], 1e-9), 1)
+    return result
+
+
+# ====== 규모별 벤치마크 (새 프로세스에서 실행) ======
+def bench_size(n: int, opts: dict) -> dict:
+    global TRACE_MEMORY
+    TRACE_MEMORY = opts["tracemalloc"]
+    date = opts["date"]
+    until = date.replace("-", "")
+    workdir = tempfile.mkdtemp(prefix=f"bench{n}_")
+    os.makedirs(os.path.join(workdir, "collector"))   # main.import_steps 가 이 폴더로 chdir
+    os.chdir(workdir)
+    history = int(opts["years"] * TRADING_DAYS_PER_YEAR)
+
+    def make_ep():
+        return FakeKiwoomEntrypoint(latency=opts["tr_latency"], per_second=int(opts["tr_rate"]),
+                                    history_days=history, as_of=date, seed=opts["seed"])
+
+    install_fake_koapy(make_ep)
+    markets = synthetic_krx(n, seed=opts["seed"])
+    candidates = combined_candidates(markets)
+    codes = candidates["종목코드"].tolist()
+    sample = codes[:MAX_SAMPLES]
+    out = {"tickers": n, "history_days": history}
+    quiet = contextlib.redirect_stdout(io.StringIO()) if not opts["verbose"] else contextlib.nullcontext()
+
+    krx_root = os.path.join(workdir, "krx")
+    write_krx_csvs(markets, krx_root, date)
+    try:
+        with quiet, krx_server(krx_root, opts["krx_latency"]):
+            import main
+            main.PROJECT_ROOT = Path(workdir)
+            step1, step2, step3 = main.import_steps(date)
+            from flow_engine import flow_metrics
+            from indicators import batch_indicators
+            import tr_scheduler
+            from run_report import REPORT
+
+            # 지연 없는 엔트리포인트로 원자료 준비 (마이크로 벤치마크용)
+            raw = FakeKiwoomEntrypoint(latency=0.0, per_second=10**9, history_days=history,
+                                       as_of=date, seed=opts["seed"])
+            charts = {c: raw.GetDailyStockDataAsDataFrame(c) for c in sample}
+
+            # --- filter_by_short_pressure ---
+            res = out["filter_by_short_pressure"] = {"rows": len(candidates), "repeat": FILTER_REPEAT}
+            with measure(res):
+                for _ in range(FILTER_REPEAT):
+                    step2.filter_by_short_pressure(candidates)
+            res["rows_per_s"] = round(len(candidates) * FILTER_REPEAT / max(res["wall_s"], 1e-9), 1)
+
+            # --- calc_ret14_and_rsi_from_chart (종목별) / batch_indicators (한 번에) ---
+            per_item(lambda c: step2.calc_ret14_and_rsi_from_chart(charts[c]), sample,
+                     out.setdefault("calc_ret14_and_rsi_from_chart", {"samples": len(sample)}))
+            res = out["batch_indicators"] = {"samples": len(sample)}
+            with measure(res):
+                batch_indicators(charts, windows=step2.INDICATOR_WINDOWS)
+            res["tickers_per_s"] = round(len(sample) / max(res["wall_s"], 1e-9), 1)
+
+            # --- opt10059 연속 순매도 판단 (캐시 없이, CSV 저장 포함) ---
+            inv_dir = os.path.join(workdir, "bench_investors")
+            per_item(lambda c: step3.check_fi_3day_netsell_and_save(raw, c, until, None, [inv_dir]), sample,
+                     out.setdefault("opt10059_streak", {"samples": len(sample)}))
+            del charts
+
+            # --- 수급 배치 엔진 (step3 가 전 종목을 모아 한 번에 계산하는 부분) ---
+            histories = {c: step3.fetch_investors(raw, c, until) for c in sample}
+            res = out["flow_metrics"] = {"samples": len(sample)}
+            with measure(res):
+                flow_metrics(histories)
+            res["tickers_per_s"] = round(len(sample) / max(res["wall_s"], 1e-9), 1)
+            del histories
+
+            # --- main.py 오케스트레이션 (cold: 빈 캐시 / warm: 캐시가 찬 재실행) ---
+            rate = float(opts["tr_rate"])
+            tr_scheduler.TR_LIMITS = [(rate, 1.0, 1), (rate * 3600, 3600.0, rate * 3600)]
+            step2.SCREEN = step3.SCREEN = parse_screen(BENCH_SCREEN)
+            # 오늘 날짜 대신 합성 시장 기준일로 수집
+            base_date = datetime.strptime(date, "%Y-%m-%d")
+            step1.collect = lambda: step1.collect_http(base_date, lookback=0)
+            for phase in ("cold", "warm"):
+                REPORT.reset(date, mode=f"bench-{phase}")
+                res = out[f"pipeline_{phase}"] = {}
+                with measure(res):
+                    main.run_inprocess(date, fresh=True)
+                    main.update_index_json(date)
+                report = REPORT.to_dict()
+                res["tickers_per_s"] = round(n / max(res["wall_s"], 1e-9), 1)
+                res["stages"] = {k: {"wall_s": v["wall_s"], "cpu_s": v["cpu_s"]}
+                                 for k, v in report["stages"].items()}
+                res["latency"] = {k: {m: v.get(m) for m in ("count", "errors", "p50_ms", "p90_ms", "p99_ms")}
+                                  for k, v in report["latency"].items()}
+                res["counters"] = report["counters"]
+                res["rows"] = report["rows"]
+        out["peak_rss_mb"] = peak_rss_mb()
+    finally:
+        os.chdir(tempfile.gettempdir())
+        if not opts["keep"]:
+            shutil.rmtree(workdir, ignore_errors=True)
+        else:
+            out["workdir"] = workdir
+    return out
+
+
+# ====== 결과 출력 / 비교 ======
+# 회귀 비교 대상: (항목, 처리량 키)
+THROUGHPUT_KEYS = [
+    ("filter_by_short_pressure", "rows_per_s"),
+    ("calc_ret14_and_rsi_from_chart", "tickers_per_s"),
+    ("batch_indicators", "tickers_per_s"),
+    ("opt10059_streak", "tickers_per_s"),
+    ("flow_metrics", "tickers_per_s"),
+    ("pipeline_cold", "tickers_per_s"),
+    ("pipeline_warm", "tickers_per_s"),
+]
+
+
+def summary_frame(results: list) -> pd.DataFrame:
+    rows = []
+    for r in results:
+        for name, key in THROUGHPUT_KEYS:
+            m = r.get(name, {})
+            rows.append({"종목수": r["tickers"], "항목": name, "처리량": m.get(key), "단위": key,
+                         "p50_ms": m.get("p50_ms"), "p99_ms": m.get("p99_ms"), "wall_s": m.get("wall_s"),
+                         "peak_rss_mb": m.get("peak_rss_mb"), "tracemalloc_mb": m.get("tracemalloc_peak_mb")})
+    return pd.DataFrame(rows)
+
+
+def compare(results: list, baseline: dict, tolerance: float = REGRESSION_TOLERANCE):
+    """기준 결과 대비 처리량이 tolerance 이상 떨어진 (종목수, 항목, 기준, 현재) 목록"""
+    base = {r["tickers"]: r for r in baseline.get("results", [])}
+    regressions = []
+    for r in results:
+        b = base.get(r["tickers"])
+        if b is None:
+            continue
+        for name, key in THROUGHPUT_KEYS:
+            old, new = b.get(name, {}).get(key), r.get(name, {}).get(key)
+            if old and new is not None and new < old * (1 - tolerance):
+                regressions.append((r["tickers"], name, old, new))
+    return regressions
+
+
+def parse_args():
+    p = argparse.ArgumentParser(description="합성 시장 벤치마크 (가짜 KRX / 키움)")
+    p.add_argument("--sizes", type=int, nargs="+", default=list(SIZES), help="종목 수 목록")
+    p.add_argument("--years", type=float, default=3.0, help="합성 일봉/투자자 이력 길이(년)")
+    p.add_argument("--date", default=BENCH_DATE, help="기준일 YYYY-MM-DD")
+    p.add_argument("--tr-latency", type=float, default=0.01, help="가짜 키움 TR 응답 지연(초)")
+    p.add_argument("--tr-rate", type=float, default=200.0,
+                   help="초당 TR 제한 (스케줄러와 가짜 서버 모두; 실제 키움은 5)")
+    p.add_argument("--krx-latency", type=float, default=0.05, help="가짜 KRX 응답 지연(초)")
+    p.add_argument("--seed", type=int, default=0)
+    p.add_argument("--baseline", default=None, help="비교할 이전 결과 JSON")
+    p.add_argument("--out", default=None, help="결과 JSON 경로 (기본: bench/bench_{날짜}_{시각}.json)")
+    p.add_argument("--tracemalloc", action="store_true",
+                   help="구간별 파이썬 할당 최대치 측정 (느려지므로 처리량 비교에는 쓰지 말 것)")
+    p.add_argument("--keep", action="store_true", help="규모별 작업 폴더를 지우지 않음")
+    p.add_argument("--verbose", action="store_true", help="스텝 진행 로그 출력")
+    args, _ = p.parse_known_args()
+    return args
+
+
+def main():
+    args = parse_args()
+    opts = {"date": args.date, "years": args.years, "tr_latency": args.tr_latency, "tr_rate": args.tr_rate,
+            "krx_latency": args.krx_latency, "seed": args.seed, "tracemalloc": args.tracemalloc, "keep": args.keep, "verbose": args.verbose}
+    results = []
+    for n in args.sizes:
+        print(f"[BENCH] 종목 {n}개 / 이력 {args.years}년 ...")
+        # 규모마다 새 프로세스: 모듈 경로·캐시·peak RSS 가 앞 규모와 섞이지 않음
+        with ProcessPoolExecutor(max_workers=1) as pool:
+            results.append(pool.submit(bench_size, n, opts).result())
+
+    out = args.out or os.path.join(OUT_DIR, f"bench_{args.date}_{datetime.now():%Y%m%d_%H%M%S}.json")
+    os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump({"created_at": datetime.now().isoformat(timespec="seconds"), "options": opts,
+                   "results": results}, f, ensure_ascii=False, indent=2)
+
+    with pd.option_context("display.width", 200, "display.max_columns", None):
+        print(summary_frame(results).to_string(index=False))
+    print(f"[SAVED] {out}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f))
+        for n, name, old, new in regressions:
+            print(f"[REGRESSION] 종목 {n}개 {name}: {old} → {new} ({new / old - 1:+.0%})")
+        if regressions:
+            sys.exit(1)
+        print(f"[OK] 기준 대비 처리량 하락 {REGRESSION_TOLERANCE:.0%} 이내")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+"""
+날짜별 변경 피드 (changes.json)
+
+public/data/{date}/ 스냅샷을 바로 앞 날짜(추천 스냅샷이 있는 날짜)와 비교한 작은 JSON 을 만든다.
+  - added / removed : 새로 추천된 / 추천에서 빠진 종목
+  - transitions     : 단계(후보 → 지표 → 1차 필터 → 추천)가 바뀐 종목과 이전/이후 단계
+  - deltas          : 이틀 모두 metrics_all 에 있는 종목의 지표 변화량 (변화 없는 종목은 생략)
+전체 이력을 다시 훑지 않고, 이번 실행 날짜와 그 다음 날짜(앞 날짜가 바뀐 경우)만 다시 만든다.
+index.json 의 changes 에 날짜별 {file, prev, added, removed, bytes} 를 기록하고
+최신 날짜 파일은 latest/changes.json 으로 게시한다.
+"""
+
+import json
+import os
+
+import pandas as pd
+
+from checkpoint import atomic_write_text
+from common import CODE_COL
+from snapshot import has_snapshot, read_snapshot
+
+CHANGES_VERSION = 1
+CHANGES_FILE = "changes.json"
+
+# 단계: 뒤로 갈수록 좁은 목록 (종목의 단계 = 들어 있는 가장 뒤 스냅샷)
+STAGES = ("candidates", "metrics_all", "candidates_filtered1", "recommendations")
+
+# 변화량을 기록할 지표 열 (있는 열만)
+DELTA_COLUMNS = ["공매도 비중", "공매도 비중 증가배율", "공매도 거래대금 증가배율", "ret14_pct", "rsi14"]
+DELTA_DECIMALS = 2
+
+NAME_COL = "종목명"
+
+
+def _stages(folder: str) -> tuple:
+    """({종목코드: 단계 이름}, {종목코드: 종목명}) — folder 가 None 이면 빈 dict 둘"""
+    stage, names = {}, {}
+    if folder is None:
+        return stage, names
+    for name in STAGES:
+        if not has_snapshot(folder, name):
+            continue
+        df = read_snapshot(folder, name, usecols=[CODE_COL, NAME_COL])
+        for code in df[CODE_COL]:
+            stage[code] = name
+        if NAME_COL in df.columns:
+            names.update(zip(df[CODE_COL], df[NAME_COL]))
+    return stage, names
+
+
+def _metrics(folder: str) -> pd.DataFrame:
+    if folder is None or not has_snapshot(folder, "metrics_all"):
+        return pd.DataFrame(columns=[CODE_COL])
+    df = read_snapshot(folder, "metrics_all", usecols=[CODE_COL] + DELTA_COLUMNS)
+    return df.drop_duplicates(CODE_COL).set_index(CODE_COL)
+
+
+def _delta_rows(cur: pd.DataFrame, prev: pd.DataFrame):
+    cols = [c for c in DELTA_COLUMNS if c in cur.columns and c in prev.columns]
+    common = cur.index.intersection(prev.index)
+    if not cols or len(common) == 0:
+        return cols, []
+    diff = cur.loc[common, cols].apply(pd.to_numeric, errors="coerce") \
+        - prev.loc[common, cols].apply(pd.to_numeric, errors="coerce")
+    diff = diff.round(DELTA_DECIMALS)
+    moved = diff.fillna(0).ne(0).any(axis=1)
+    rows = []
+    for code, values in diff.loc[moved].sort_index().iterrows():
+        rows.append([code] + [None if pd.isna(v) else float(v) for v in values])
+    return cols, rows
+
+
+def build_changes(data_root: str, date: str, prev_date: str = None) -> dict:
+    """date 폴더 vs prev_date 폴더 → 변경 피드 dict (prev_date 가 None 이면 전부 신규)"""
+    folder = os.path.join(data_root, date)
+    prev_folder = os.path.join(data_root, prev_date) if prev_date else None
+    cur_stage, cur_names = _stages(folder)
+    prev_stage, prev_names = _stages(prev_folder)
+
+    recommended = {c for c, s in cur_stage.items() if s == "recommendations"}
+    was_recommended = {c for c, s in prev_stage.items() if s == "recommendations"}
+    transitions = [[code, prev_stage.get(code), cur_stage.get(code)]
+                   for code in sorted(set(cur_stage) | set(prev_stage))
+                   if prev_stage.get(code) != cur_stage.get(code)]
+
+    cols, deltas = _delta_rows(_metrics(folder), _metrics(prev_folder))
+
+    mentioned = {row[0] for row in transitions} | {row[0] for row in deltas}
+    names = {**prev_names, **cur_names}
+    return {
+        "version": CHANGES_VERSION,
+        "date": date,
+        "prev_date": prev_date,
+        "counts": {s: [sum(v == s for v in prev_stage.values()), sum(v == s for v in cur_stage.values())]
+                   for s in STAGES},
+        "added": sorted(recommended - was_recommended),
+        "removed": sorted(was_recommended - recommended),
+        "transitions": {"columns": [CODE_COL, "from", "to"], "rows": transitions},
+        "deltas": {"columns": [CODE_COL] + cols, "rows": deltas},
+        "names": {c: names[c] for c in sorted(mentioned) if c in names and isinstance(names[c], str)},
+    }
+
+
+def write_changes(folder: str, changes: dict) -> dict:
+    """changes.json 저장 (원자적 교체). 반환: index.json 에 넣을 항목"""
+    raw = json.dumps(changes, ensure_ascii=False, separators=(",", ":"))
+    atomic_write_text(os.path.join(folder, CHANGES_FILE), raw)
+    return {"file": CHANGES_FILE, "prev": changes["prev_date"], "added": len(changes["added"]),
+            "removed": len(changes["removed"]), "bytes": len(raw.encode("utf-8"))}
+
+
+def refresh_changes(data_root: str, dates, rebuild=(), previous: dict = None) -> dict:
+    """
+    날짜별 변경 피드 항목 갱신.
+    - 추천 스냅샷이 있는 날짜만 대상, 앞 날짜는 그 목록에서 바로 앞 날짜
+    - rebuild 에 있는 날짜, 앞 날짜가 rebuild 에 있거나 바뀐 날짜(사이에 백필된 날짜), 파일이 없는 날짜만 새로 만들고
+      나머지는 예전 index.json 항목(previous) 재사용
+    반환: {date: {"file": "{date}/changes.json", "prev", "added", "removed", "bytes"}}
+    """
+    previous = previous or {}
+    rebuild = set(rebuild)
+    feed_dates = [d for d in sorted(dates) if has_snapshot(os.path.join(data_root, d), "recommendations")]
+    out = {}
+    prev_date = None
+    for d in feed_dates:
+        prev = previous.get(d)
+        if (d not in rebuild and prev_date not in rebuild and prev and prev.get("prev") == prev_date
+                and os.path.exists(os.path.join(data_root, prev["file"]))):
+            out[d] = prev
+        else:
+            entry = write_changes(os.path.join(data_root, d), build_changes(data_root, d, prev_date))
+            entry["file"] = f"{d}/{entry['file']}"
+            out[d] = entry
+        prev_date = d
+    return out
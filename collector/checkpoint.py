@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+"""
+실행 날짜별 스테이지 체크포인트
+
+cache/checkpoints/{date}/manifest.json 에 스테이지마다
+  - input   : 입력 해시 (앞 스테이지 산출물 파일 해시 + 임계값 등 파라미터)
+  - outputs : 산출물 스냅샷 파일 해시 (같은 폴더에 {stage}_{name}.csv/.parquet 로 보관, 두 파일 모두 포함 —
+              재개 시 read_snapshot 이 Parquet 를 먼저 읽으므로)
+  - tickers : 종목별 완료 기록 (step2: 일봉 캐시 저장 완료, step3: 투자자 조건 결과)
+를 남긴다. 재실행 시
+  - 입력 해시가 같고 산출물 파일이 그대로면 스테이지를 건너뛰고 보관본을 읽고
+  - 중간에 끊긴 스테이지는 완료된 종목을 건너뛰고 나머지 종목만 조회한다.
+manifest 는 임시 파일에 쓴 뒤 os.replace 로 교체하므로 중간에 죽어도 깨지지 않는다.
+"""
+
+import hashlib
+import json
+import os
+from datetime import datetime
+
+from price_cache import CACHE_DIR
+from snapshot import read_snapshot, snapshot_paths, write_snapshot
+
+CHECKPOINT_ROOT = os.path.join(CACHE_DIR, "checkpoints")
+MANIFEST_NAME = "manifest.json"
+
+
+# ====== 해시 / 원자적 쓰기 ======
+def file_hash(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def snapshot_hash(folder: str, name: str):
+    """스냅샷 파일(.parquet / .csv 중 있는 것 전부)의 묶음 해시, 파일이 하나도 없으면 None"""
+    parts = [(os.path.basename(p), file_hash(p)) for p in snapshot_paths(folder, name) if os.path.exists(p)]
+    return params_hash(parts) if parts else None
+
+
+def params_hash(*parts) -> str:
+    """파라미터/상위 해시 묶음 → 입력 해시"""
+    raw = json.dumps(parts, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def atomic_write_text(path: str, text: str, encoding: str = "utf-8"):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding=encoding) as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+
+# ====== 종목별 진행 기록 ======
+class StageProgress:
+    """스테이지 하나의 종목별 완료 기록 (mark 할 때마다 manifest 저장)"""
+
+    def __init__(self, ckpt, stage: str):
+        self.ckpt = ckpt
+        self.stage = stage
+        self.tickers = ckpt.manifest["stages"][stage].setdefault("tickers", {})
+
+    def done(self, code: str) -> bool:
+        return code in self.tickers
+
+    def value(self, code: str):
+        return self.tickers.get(code)
+
+    def mark(self, code: str, value=True):
+        self.tickers[code] = value
+        self.ckpt.save()
+
+    def __len__(self):
+        return len(self.tickers)
+
+
+# ====== 체크포인트 ======
+class Checkpoint:
+    def __init__(self, date: str, root: str = CHECKPOINT_ROOT, fresh: bool = False):
+        self.date = date
+        self.dir = os.path.join(root, date)
+        self.path = os.path.join(self.dir, MANIFEST_NAME)
+        os.makedirs(self.dir, exist_ok=True)
+        self.manifest = None
+        if not fresh and os.path.exists(self.path):
+            try:
+                with open(self.path, encoding="utf-8") as f:
+                    self.manifest = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"[WARN] 체크포인트 읽기 실패 → 새로 시작: {e}")
+        if not self.manifest or self.manifest.get("date") != date:
+            self.manifest = {"date": date, "stages": {}}
+
+    def save(self):
+        self.manifest["updated_at"] = datetime.now().isoformat(timespec="seconds")
+        atomic_write_text(self.path, json.dumps(self.manifest, ensure_ascii=False, indent=2))
+
+    def _stage(self, stage: str) -> dict:
+        return self.manifest["stages"].get(stage) or {}
+
+    # ----- 스테이지 상태 -----
+    def is_complete(self, stage: str, input_hash: str) -> bool:
+        """입력 해시가 같고, 기록된 산출물 파일이 모두 그대로 있으면 True"""
+        st = self._stage(stage)
+        if st.get("status") != "done" or st.get("input") != input_hash:
+            return False
+        for name, digest in st.get("outputs", {}).items():
+            if digest is not None and snapshot_hash(self.dir, f"{stage}_{name}") != digest:
+                return False
+        return True
+
+    def begin(self, stage: str, input_hash: str) -> StageProgress:
+        """스테이지 시작. 입력이 바뀌었으면 종목별 기록도 초기화"""
+        st = self._stage(stage)
+        if st.get("input") != input_hash:
+            st = {"input": input_hash, "tickers": {}}
+        elif st.get("tickers"):
+            print(f"[RESUME] {stage}: 완료 종목 {len(st['tickers'])}개 재사용")
+        st["status"] = "running"
+        self.manifest["stages"][stage] = st
+        self.save()
+        return StageProgress(self, stage)
+
+    def complete(self, stage: str, outputs: dict, extra: dict = None):
+        """산출물(DataFrame 또는 None)을 체크포인트 폴더에 스냅샷으로 보관하고 완료 기록"""
+        st = self.manifest["stages"].setdefault(stage, {})
+        hashes = {}
+        for name, df in outputs.items():
+            if df is None:
+                hashes[name] = None
+                continue
+            write_snapshot(df, self.dir, f"{stage}_{name}")
+            hashes[name] = snapshot_hash(self.dir, f"{stage}_{name}")
+        st.update({"status": "done", "outputs": hashes, "extra": extra or {},
+                   "finished_at": datetime.now().isoformat(timespec="seconds")})
+        self.save()
+
+    # ----- 보관본 -----
+    def output_hash(self, stage: str, name: str):
+        return self._stage(stage).get("outputs", {}).get(name)
+
+    def load_output(self, stage: str, name: str):
+        if self.output_hash(stage, name) is None:
+            return None
+        return read_snapshot(self.dir, f"{stage}_{name}")
+
+    def extra(self, stage: str) -> dict:
+        return self._stage(stage).get("extra", {})
@@ -0,0 +1,286 @@
+# -*- coding: utf-8 -*-
+"""
+수집기 공통 모듈
+
+  - 키움 로그인 정보(credentials), 기준 날짜 인자(get_date_arg) — step2/step3 공용
+  - 날짜별 산출물 루트(DATA_ROOT)와 날짜 폴더명 규칙(DATE_DIR_RE, yyyymmdd)
+  - 캐시/아카이브/작업 큐 공용 SQLite 연결(connect_sqlite)
+  - 산출물별 CSV 스키마(인코딩, 열 타입, usecols, 천 단위 구분자, 종목코드 자리수)와
+    스키마대로 파싱 시점에 타입을 고정해 읽는 로더(read_typed)
+  - 프로세스 안 메모: 같은 파일(내용이 바뀌지 않은)은 한 번만 파싱하고 이후엔 복사본을 돌려준다
+
+파싱 단계에서 종목코드는 문자열(096770 유지), 수치는 숫자형으로 읽으므로
+읽은 뒤 astype(str).str.zfill(6) / str.replace(",", "") + to_numeric 같은 문자열 후처리가 필요 없다.
+"""
+
+import argparse
+import os
+import re
+import sqlite3
+import threading
+from collections import OrderedDict, namedtuple
+from datetime import datetime
+
+import pandas as pd
+
+from run_report import REPORT
+
+# ====== 로그인 정보 ======
+credentials = {
+    'user_id': os.getenv('KIWOOM_ID'),
+    'user_password': os.getenv('KIWOOM_PW'),
+    'cert_password': os.getenv('KIWOOM_CERT_PW'),
+    'is_simulation': True,
+    'account_passwords': { os.getenv('KIWOOM_ACCT','0000000000'): os.getenv('KIWOOM_ACCT_PW') }
+}
+
+
+# ====== 기준 날짜(데이터 보관 폴더명) ======
+def get_date_arg() -> str:
+    """--date 또는 환경변수 PIPELINE_DATE (둘 다 없으면 오늘)"""
+    p = argparse.ArgumentParser(add_help=False)
+    p.add_argument("--date", help="YYYY-MM-DD", default=None)
+    args, _ = p.parse_known_args()
+    date = args.date or os.environ.get("PIPELINE_DATE")
+    if not date:
+        # 기본: 오늘 날짜
+        date = datetime.now().strftime("%Y-%m-%d")
+    return date
+
+
+# ====== 날짜별 산출물 폴더 ======
+# step1 저장 루트: {DATA_ROOT}/{YYYY-MM-DD}/
+DATA_ROOT = r"digger-25-short-reco-site\public\data"
+
+DATE_DIR_RE = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+
+
+def yyyymmdd(day) -> str:
+    """'2025-08-27' / '20250827' / Timestamp → '20250827'"""
+    return str(day).replace("-", "")[:8]
+
+
+# ====== SQLite 연결 ======
+SQLITE_TIMEOUT = 60   # 다른 연결의 쓰기 잠금을 기다리는 최대 초 (백필 워커가 같은 파일에 동시에 씀)
+
+
+def connect_sqlite(path: str, **kwargs) -> sqlite3.Connection:
+    """
+    price_cache / investor_cache / stock_archive / work_queue 공용 연결 (WAL, 잠금 대기 SQLITE_TIMEOUT).
+    호출마다 새 연결: 스레드/프로세스 간 공유 문제 없음
+    """
+    con = sqlite3.connect(path, timeout=SQLITE_TIMEOUT, **kwargs)
+    con.execute("PRAGMA journal_mode=WAL")
+    return con
+
+
+# ====== 컬럼 타입 ======
+CODE_COL = "종목코드"
+CODE_WIDTH = 6
+
+COLUMN_TYPES = {
+    "순위": "Int64",
+    "종목코드": "code",
+    "종목명": "string",
+    "공매도 거래대금": "Int64",
+    "거래대금": "Int64",
+    "공매도 비중": "float64",
+    "공매도 거래대금 증가배율": "float64",
+    "직전40거래일 공매도 비중 평균": "float64",
+    "공매도 비중 증가배율": "float64",
+    "주가 수익률": "float64",
+    "market": "category",
+    "외인기관3일연속순매도": "boolean",
+    # step3 수급 배치 엔진 (flow_engine) 연속 순매도 일수
+    "netsell_streak": "Int64",
+    "foreign_netsell_streak": "Int64",
+    "inst_netsell_streak": "Int64",
+    "netsell_run": "Int64",
+    "foreign_netsell_run": "Int64",
+    "inst_netsell_run": "Int64",
+}
+
+# ret14_pct, rsi14, ret20_pct, netsell_share20 ... 처럼 기간이 붙는 계산열
+_FLOAT_PATTERNS = [re.compile(r"^ret\d+_pct$"), re.compile(r"^rsi\d+$"), re.compile(r"^netsell_share\d+$")]
+
+
+def column_type(col: str):
+    if col in COLUMN_TYPES:
+        return COLUMN_TYPES[col]
+    if any(p.match(col) for p in _FLOAT_PATTERNS):
+        return "float64"
+    return None
+
+
+def normalize_code(values: pd.Series) -> pd.Series:
+    """종목코드를 6자리 문자열로 (96770 / 96770.0 / '096770' 모두 '096770')"""
+    s = values.astype(str).str.strip().str.replace(r"\.0$", "", regex=True)
+    return s.str.zfill(CODE_WIDTH)
+
+
+def typed_codes(df: pd.DataFrame) -> pd.DataFrame:
+    """종목코드가 이미 문자열(로더/스냅샷으로 읽은 프레임)이면 그대로, 숫자로 들어온 외부 입력만 정규화"""
+    if pd.api.types.is_string_dtype(df[CODE_COL]):
+        return df
+    return df.assign(**{CODE_COL: normalize_code(df[CODE_COL])})
+
+
+def to_number(values: pd.Series) -> pd.Series:
+    """'12,345' / '+1,234' 같은 문자열 수치를 숫자로 (이미 숫자형이면 문자열 처리 생략)"""
+    if pd.api.types.is_numeric_dtype(values):
+        return values.astype("float64")
+    return pd.to_numeric(values.astype(str).str.replace(",", ""), errors="coerce")
+
+
+def _to_bool(values: pd.Series) -> pd.Series:
+    if pd.api.types.is_bool_dtype(values):
+        return values.astype("boolean")
+    mapped = values.map(lambda v: {"true": True, "false": False, "1": True, "0": False}.get(str(v).strip().lower()))
+    return mapped.astype("boolean")
+
+
+def apply_schema(df: pd.DataFrame) -> pd.DataFrame:
+    """메모리의 DataFrame 에 스키마 적용 — 스키마에 있는 열만 고정 타입으로 변환 (그 밖의 열은 그대로)"""
+    out = df.copy()
+    for col in out.columns:
+        kind = column_type(col)
+        if kind is None:
+            continue
+        if kind == "code":
+            out[col] = normalize_code(out[col])
+        elif kind == "string":
+            out[col] = out[col].astype(str)
+        elif kind == "category":
+            out[col] = out[col].astype("category")
+        elif kind == "boolean":
+            out[col] = _to_bool(out[col])
+        else:
+            out[col] = to_number(out[col]).astype(kind)
+    return out
+
+
+# ====== 산출물 스키마 ======
+# encoding  : 파일 인코딩
+# dtype     : 파싱 시점 열 타입 (파일에 없는 열은 무시)
+# usecols   : 읽을 열 (None 이면 전체, 호출 시 usecols 로 더 좁힐 수 있음)
+# thousands : 천 단위 구분자 ('1,234' → 1234 를 파서가 직접 처리)
+# code_cols : 6자리로 채울 종목코드 열
+Schema = namedtuple("Schema", ["encoding", "dtype", "usecols", "thousands", "code_cols"])
+
+# read_csv 는 Int64 에 천 단위 구분자를 적용하지 않으므로 float64 로 읽은 뒤 숫자 간 변환
+_PARSE_DTYPES = {"code": str, "string": str, "Int64": "float64"}
+
+
+def _parse_dtypes(types: dict) -> dict:
+    return {col: _PARSE_DTYPES.get(kind, kind) for col, kind in types.items()}
+
+
+# 단계 산출물 스냅샷 (candidates / metrics_all / candidates_filtered1 / recommendations, 체크포인트 출력)
+SNAPSHOT_SCHEMA = Schema("utf-8-sig", _parse_dtypes(COLUMN_TYPES), None, ",", (CODE_COL,))
+
+SCHEMAS = {
+    # KRX 공매도 거래 상위 50 CSV (step1 원본 kospi.csv / kosdaq.csv)
+    "krx": Schema("euc-kr", _parse_dtypes(COLUMN_TYPES), None, ",", (CODE_COL,)),
+    "candidates": SNAPSHOT_SCHEMA,
+    "metrics_all": SNAPSHOT_SCHEMA,
+    "candidates_filtered1": SNAPSHOT_SCHEMA,
+    "recommendations": SNAPSHOT_SCHEMA,
+    "recommendations_intraday": SNAPSHOT_SCHEMA,
+    # opt10059 종목별 투자자 원자료 (per_stock/investors/{code}_investors.csv)
+    "investors": Schema("utf-8-sig", {"일자": str, "외국인투자자": "float64", "기관계": "float64"},
+                        None, ",", ()),
+    # 장중 틱 기록 (stream.py --replay / --record)
+    "ticks": Schema("utf-8-sig", {"time": str, "code": str, "price": "float64", "foreign": "float64",
+                                  "inst": "float64"}, None, ",", ("code",)),
+}
+
+
+def _finish(df: pd.DataFrame, schema: Schema) -> pd.DataFrame:
+    """파싱 후 숫자 간 변환(float64 → Int64)과 종목코드 자리수 채우기"""
+    dtype = schema.dtype or {}
+    for col in df.columns:
+        if col in schema.code_cols:
+            df[col] = normalize_code(df[col])
+        elif col in dtype and column_type(col) == "Int64":
+            df[col] = df[col].astype("Int64")
+    return df
+
+
+def _parse(src, schema: Schema, usecols=None) -> pd.DataFrame:
+    keep = set(usecols or schema.usecols or ())
+    kwargs = {
+        "encoding": schema.encoding,
+        "thousands": schema.thousands,
+        # 파일에 없는 열이 있어도 오류 없이 있는 열만 읽도록 callable 로 전달
+        "usecols": (lambda c: c in keep) if keep else None,
+    }
+    try:
+        df = pd.read_csv(src, dtype=schema.dtype, **kwargs)
+    except (ValueError, TypeError):
+        # '--' 같은 값이 섞인 파일: 문자열로 읽고 열 단위로 변환 (변환 불가 값은 NaN)
+        if hasattr(src, "seek"):
+            src.seek(0)
+        df = pd.read_csv(src, dtype=str, **kwargs)
+        for col, kind in (schema.dtype or {}).items():
+            if col not in df.columns or kind is str:
+                continue
+            if kind == "boolean":
+                df[col] = _to_bool(df[col])
+            elif kind == "category":
+                df[col] = df[col].astype("category")
+            else:
+                df[col] = to_number(df[col]).astype(kind)
+    return _finish(df, schema)
+
+
+# ====== 프로세스 안 메모 ======
+# (파일 식별자, 수정시각, 크기, 스키마, usecols) → 파싱된 DataFrame
+# latest/ 하드링크와 날짜 폴더 원본은 같은 inode 라 한 항목을 공유한다
+MEMO_SIZE = 64
+
+_memo = OrderedDict()
+_memo_lock = threading.Lock()
+
+
+def _file_key(path: str):
+    st = os.stat(path)
+    ident = (st.st_dev, st.st_ino) if st.st_ino else os.path.abspath(path)
+    return ident, st.st_mtime_ns, st.st_size
+
+
+def memoized(path: str, key, parse) -> pd.DataFrame:
+    """path 가 바뀌지 않았으면 이전 parse() 결과의 복사본, 아니면 parse() 후 기억"""
+    k = (_file_key(path), key)
+    with _memo_lock:
+        df = _memo.get(k)
+        if df is not None:
+            _memo.move_to_end(k)
+    if df is not None:
+        REPORT.count("loader.memo_hit")
+        return df.copy()
+    df = parse()
+    REPORT.count("loader.parse")
+    with _memo_lock:
+        _memo[k] = df
+        while len(_memo) > MEMO_SIZE:
+            _memo.popitem(last=False)
+    return df.copy()
+
+
+def clear_memo():
+    with _memo_lock:
+        _memo.clear()
+
+
+def read_typed(src, schema, usecols=None) -> pd.DataFrame:
+    """
+    스키마대로 CSV 를 읽음. schema 는 SCHEMAS 의 이름 또는 Schema.
+    src 가 경로면 메모를 거치고, 버퍼(BytesIO 등)면 매번 파싱한다.
+    """
+    name = schema if isinstance(schema, str) else id(schema)
+    if isinstance(schema, str):
+        schema = SCHEMAS[schema]
+    if not isinstance(src, (str, os.PathLike)):
+        return _parse(src, schema, usecols)
+    key = (name, tuple(usecols) if usecols else None)
+    return memoized(src, key, lambda: _parse(src, schema, usecols))
@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+"""
+로컬 가짜 키움 엔트리포인트 (개발/검증용)
+
+KiwoomOpenApiPlusEntrypoint 대신 끼워 쓰는 인메모리 구현.
+  - GetDailyStockDataAsDataFrame : 종목코드별로 고정된 난수 일봉(최신→과거)
+  - TransactionCall("opt10059")   : 종목별 투자자 일별 순매수 이력
+  - 응답 지연(latency), 서버측 초당 TR 제한, 임의 과부하(-200) 오류를 흉내낸다.
+  - 장애 주입: 빈 응답(empty_prob), 응답 지연 폭주(stall_prob/stall_sec), 세션 끊김(disconnect())
+로그인/윈도우 없이 스케줄러·스텝 로직을 돌려볼 때 사용한다.
+"""
+
+import collections
+import random
+import threading
+import time
+import zlib
+from datetime import datetime
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+
+# opt10059 멀티데이터 컬럼
+INVESTOR_COLS = [
+    "일자", "현재가", "대비기호", "전일대비", "등락율", "누적거래량", "누적거래대금",
+    "개인투자자", "외국인투자자", "기관계", "금융투자", "보험", "투신", "기타금융",
+    "은행", "연기금등", "사모펀드", "국가", "기타법인", "내외국인",
+]
+
+
+class FakeThrottleError(RuntimeError):
+    pass
+
+
+class FakeDisconnectedError(RuntimeError):
+    pass
+
+
+class FakeKiwoomEntrypoint:
+    def __init__(self, latency: float = 0.05, jitter: float = 0.5, per_second: int = 5,
+                 throttle_prob: float = 0.0, history_days: int = 600, as_of: str = None, seed: int = 0,
+                 empty_prob: float = 0.0, stall_prob: float = 0.0, stall_sec: float = 60.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.per_second = per_second
+        self.throttle_prob = throttle_prob
+        self.empty_prob = empty_prob
+        self.stall_prob = stall_prob
+        self.stall_sec = stall_sec
+        self.history_days = history_days
+        self.as_of = pd.Timestamp(as_of or datetime.now().strftime("%Y-%m-%d"))
+        self.seed = seed
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.recent = collections.deque()
+        self.calls = collections.Counter()
+        self.connected = True   # 로그인 없이도 바로 호출 가능 (disconnect() 로 끊김 흉내)
+
+    # ----- 컨텍스트/로그인 -----
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.connected = False
+        return False
+
+    def EnsureConnected(self, credentials=None):
+        self.connected = True
+        self.calls["login"] += 1
+        return True
+
+    def disconnect(self):
+        """세션 끊김 흉내: 다음 EnsureConnected 까지 모든 TR 이 -106 오류"""
+        self.connected = False
+
+    # ----- 내부 -----
+    def _tr(self, kind: str) -> bool:
+        """TR 1건: 세션/서버측 초당 제한/임의 과부하 검사 후 지연. 반환: 빈 응답으로 돌려줄지"""
+        with self.lock:
+            if not self.connected:
+                self.calls["disconnected"] += 1
+                raise FakeDisconnectedError("[-106] 통신 연결 종료")
+            now = time.monotonic()
+            while self.recent and now - self.recent[0] >= 1.0:
+                self.recent.popleft()
+            overflow = len(self.recent) >= self.per_second or self.rng.random() < self.throttle_prob
+            self.recent.append(now)
+            self.calls[kind] += 1
+            delay = self.latency * (1.0 + self.jitter * (self.rng.random() * 2 - 1))
+            if self.rng.random() < self.stall_prob:
+                self.calls["stalled"] += 1
+                delay = self.stall_sec
+            empty = self.rng.random() < self.empty_prob
+        time.sleep(max(0.0, delay))
+        if overflow:
+            self.calls["throttled"] += 1
+            raise FakeThrottleError("[-200] 시세조회 과부하")
+        if empty:
+            self.calls["empty"] += 1
+        return empty
+
+    def _rng_for(self, code: str, salt: str):
+        return np.random.default_rng([self.seed, zlib.crc32(f"{code}:{salt}".encode())])
+
+    def _dates(self):
+        return pd.bdate_range(end=self.as_of, periods=self.history_days)
+
+    # ----- 일봉 -----
+    def daily_frame(self, code: str) -> pd.DataFrame:
+        """전체 이력(과거→최신) 숫자 프레임"""
+        rng = self._rng_for(code, "day")
+        n = self.history_days
+        close = np.round(rng.uniform(2000, 200000) * np.exp(np.cumsum(rng.normal(0, 0.02, n))))
+        open_ = np.round(close * (1 + rng.normal(0, 0.005, n)))
+        high = np.maximum(close, open_) * (1 + np.abs(rng.normal(0, 0.01, n)))
+        low = np.minimum(close, open_) * (1 - np.abs(rng.normal(0, 0.01, n)))
+        vol = rng.integers(10_000, 5_000_000, n)
+        return pd.DataFrame({
+            "일자": self._dates().strftime("%Y%m%d"), "현재가": close, "거래량": vol,
+            "거래대금": np.round(close * vol / 1e6), "시가": open_, "고가": np.round(high), "저가": np.round(low),
+        })
+
+    def GetDailyStockDataAsDataFrame(self, code, start_date=None, end_date=None, include_end=False,
+                                     adjusted_price=False):
+        empty = self._tr("daily")
+        df = self.daily_frame(code)
+        if empty:
+            df = df.iloc[:0]
+        if start_date:
+            df = df[df["일자"] <= pd.Timestamp(start_date).strftime("%Y%m%d")]
+        if end_date:
+            end = pd.Timestamp(end_date).strftime("%Y%m%d")
+            df = df[df["일자"] >= end] if include_end else df[df["일자"] > end]
+        df = df.iloc[::-1].reset_index(drop=True)
+        for c in ["현재가", "거래량", "거래대금", "시가", "고가", "저가"]:
+            df[c] = df[c].astype("int64").astype(str)
+        return df
+
+    # ----- 투자자 (opt10059) -----
+    def investor_frame(self, code: str) -> pd.DataFrame:
+        """전체 이력(과거→최신) 숫자 프레임"""
+        rng = self._rng_for(code, "inv")
+        n = self.history_days
+        day = self.daily_frame(code)
+        frame = pd.DataFrame({c: np.zeros(n, dtype="int64") for c in INVESTOR_COLS[1:]})
+        frame.insert(0, "일자", day["일자"].to_numpy())
+        frame["현재가"] = day["현재가"].astype("int64").to_numpy()
+        frame["누적거래량"] = day["거래량"].to_numpy()
+        # 외국인/기관 순매수: 음수 구간이 이어지도록 자기상관 부여
+        for col in ("외국인투자자", "기관계"):
+            base = rng.normal(0, 1, n)
+            smooth = np.convolve(base, np.ones(3) / 3, mode="same")
+            frame[col] = np.round(smooth * day["거래량"].to_numpy() * 0.05).astype("int64")
+        frame["개인투자자"] = -(frame["외국인투자자"] + frame["기관계"])
+        return frame
+
+    def TransactionCall(self, rqname, trcode, scrnno, inputs, *args, **kwargs):
+        if trcode != "opt10059":
+            raise NotImplementedError(f"FakeKiwoomEntrypoint: 지원하지 않는 TR {trcode}")
+        if self._tr(trcode):
+            return
+        code = inputs["종목코드"]
+        until = pd.Timestamp(inputs.get("일자") or self.as_of).strftime("%Y%m%d")
+        df = self.investor_frame(code)
+        df = df[df["일자"] <= until].iloc[::-1].head(100)   # 최신→과거, 1회 응답 100행
+        values = [SimpleNamespace(values=[str(v) for v in row]) for row in df.itertuples(index=False, name=None)]
+        yield SimpleNamespace(multi_data=SimpleNamespace(names=list(df.columns), values=values))
@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+"""
+투자자 수급 배치 엔진
+
+여러 종목의 opt10059 원자료를 공통 일자 축의 (종목 × 일자) 행렬로 쌓은 뒤
+연속 순매도 일수 / 누적 순매도 비중을 종목 루프 없이 한 번의 벡터 연산으로 계산한다.
+  - 행 순서는 응답 순서가 아니라 일자 열로 정렬 (과거→최신, 오른쪽 끝이 최신)
+  - 그 종목에 없는 일자(거래정지 등)는 NaN 칸 → 순매도 아님으로 보고 연속 구간이 끊긴다
+계산 열 (종목코드 인덱스):
+  - netsell_streak / foreign_netsell_streak / inst_netsell_streak : 외인·기관 동시 / 외국인 / 기관 순매도(<0) 최장 연속 일수
+  - netsell_run / foreign_netsell_run / inst_netsell_run          : 종목의 마지막 일자에서 끝나는 연속 순매도 일수
+  - netsell_share{n}  : 최근 n일 (외국인+기관) 순매도 합 / 거래량 합 × 100 (음수면 순매수)
+"""
+
+import numpy as np
+import pandas as pd
+
+from common import to_number
+
+DATE_COL = "일자"
+FOREIGN_COL = "외국인투자자"
+INST_COL = "기관계"
+VOLUME_COL = "누적거래량"
+
+# 누적 순매도 비중 기간
+SHARE_WINDOWS = (5, 20)
+
+# 연속 순매도 열 접두어 → 대상 (both: 외국인·기관 동시)
+STREAK_FLOWS = {"": "both", "foreign_": "foreign", "inst_": "inst"}
+
+
+def metric_names(share_windows=SHARE_WINDOWS) -> list:
+    """flow_metrics 가 만드는 열 이름 (스크린 investor 지표 목록)"""
+    names = []
+    for prefix in STREAK_FLOWS:
+        names += [f"{prefix}netsell_streak", f"{prefix}netsell_run"]
+    return names + [f"netsell_share{n}" for n in share_windows]
+
+
+def stack_flows(histories: dict, depth: int = None):
+    """
+    {종목코드: opt10059 DataFrame} → (codes, days, foreign, inst, volume)
+
+    - days   : 공통 일자 축 (YYYYMMDD 문자열, 과거→최신) — 전 종목 일자의 합집합 (depth 를 주면 최근 depth 일)
+    - foreign / inst / volume : shape (종목 수, len(days)) float64 행렬, 그 종목에 없는 일자는 NaN
+    수치 문자열 파싱은 전 종목을 이어붙여 열마다 한 번만 수행한다. 같은 일자가 두 번 있으면 한 값만 남는다.
+    """
+    codes = list(histories.keys())
+    frames = [histories[c] for c in codes]
+    lengths = np.array([len(f) for f in frames], dtype="int64")
+    if not codes or lengths.sum() == 0:
+        days = np.zeros(0, dtype="U8")
+        empty = np.full((len(codes), 0), np.nan)
+        return codes, days, empty, empty.copy(), empty.copy()
+
+    # 한 번에 이어붙임 (열이 없는 종목은 NaN, 응답에 없는 열은 전부 NaN)
+    raw = pd.concat(frames, ignore_index=True)
+
+    def column(name):
+        return raw[name] if name in raw.columns else pd.Series(np.nan, index=raw.index)
+
+    day = column(DATE_COL).astype(str).str.replace("-", "").str.slice(0, 8).to_numpy(dtype="U8")
+    group = np.repeat(np.arange(len(codes)), lengths)
+    has_day = (day != "") & (day != "nan") & (day != "None")
+
+    days = np.unique(day[has_day])
+    if depth is not None:
+        days = days[-depth:]
+    col = np.searchsorted(days, day)
+    ok = has_day & (col < len(days))
+    ok[ok] = days[col[ok]] == day[ok]
+
+    out = []
+    for name in (FOREIGN_COL, INST_COL, VOLUME_COL):
+        values = to_number(column(name)).to_numpy(dtype="float64")
+        mat = np.full((len(codes), len(days)), np.nan)
+        mat[group[ok], col[ok]] = values[ok]
+        out.append(mat)
+    return (codes, days) + tuple(out)
+
+
+def run_lengths(flags: np.ndarray) -> np.ndarray:
+    """(종목 × 일자) 불리언 → 각 칸에서 끝나는 True 연속 길이 (False 위치마다 누적합을 끊음)"""
+    run = np.cumsum(flags, axis=1)
+    reset = np.maximum.accumulate(np.where(~flags, run, 0), axis=1)
+    return run - reset
+
+
+def compute_flows(foreign: np.ndarray, inst: np.ndarray, volume: np.ndarray,
+                  share_windows=SHARE_WINDOWS) -> dict:
+    """
+    stack_flows 결과 행렬에 대해 연속 순매도 / 누적 순매도 비중을 일괄 계산.
+    반환: {"netsell_streak": ndarray, ...} (일자가 없는 종목은 연속 0, 비중 NaN)
+    """
+    n, d = foreign.shape
+    out = {}
+    if d == 0:
+        for prefix in STREAK_FLOWS:
+            out[f"{prefix}netsell_streak"] = out[f"{prefix}netsell_run"] = np.zeros(n, dtype="int64")
+        out.update({f"netsell_share{w}": np.full(n, np.nan) for w in share_windows})
+        return out
+
+    sell = {"foreign": foreign < 0, "inst": inst < 0}   # NaN 비교는 False
+    sell["both"] = sell["foreign"] & sell["inst"]
+
+    # 종목별 마지막 관측 칸 (외국인·기관 중 하나라도 값이 있는 일자)
+    observed = ~(np.isnan(foreign) & np.isnan(inst))
+    any_obs = observed.any(axis=1)
+    last = d - 1 - np.argmax(observed[:, ::-1], axis=1)
+
+    rows = np.arange(n)
+    for prefix, key in STREAK_FLOWS.items():
+        runs = run_lengths(sell[key])
+        out[f"{prefix}netsell_streak"] = runs.max(axis=1)
+        out[f"{prefix}netsell_run"] = np.where(any_obs, runs[rows, last], 0)
+
+    net_sell = -(np.nan_to_num(foreign) + np.nan_to_num(inst))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        for w in share_windows:
+            vol = np.nansum(volume[:, -w:], axis=1)
+            share = net_sell[:, -w:].sum(axis=1) / vol * 100.0
+            share[~np.isfinite(share) | ~any_obs] = np.nan
+            out[f"netsell_share{w}"] = share
+    return out
+
+
+def flow_metrics(histories: dict, share_windows=SHARE_WINDOWS, depth: int = None) -> pd.DataFrame:
+    """
+    투자자 원자료 묶음 → 종목코드 인덱스의 수급 지표 DataFrame (열: metric_names())
+    """
+    codes, _, foreign, inst, volume = stack_flows(histories, depth=depth)
+    cols = compute_flows(foreign, inst, volume, share_windows)
+    return pd.DataFrame(cols, index=pd.Index(codes, name="종목코드"))[metric_names(share_windows)]
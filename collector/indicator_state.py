@@ -0,0 +1,266 @@
+# -*- coding: utf-8 -*-
+"""
+종목별 지표 상태 저장소 (배열 기반, .npz)
+
+종목마다 최근 depth(=최대 기간+1)개 종가 링 버퍼, 마지막 봉 일자, 기간별 최근 N개 변화량의
+상승/하락 합을 저장해 두고, 다음 실행에서는 새로 생긴 봉(보통 하루 1개)만큼만 전진시켜
+retN / RSI(N)을 구한다. 정의는 indicators.compute_indicators 와 같다.
+  - advance : 일봉 캐시에서 저장된 마지막 봉 이후(last_days 일자부터)만 읽어 넘기면 전진하고,
+              이어지지 않는 종목 목록을 돌려준다 → 그 종목만 전체 구간 일봉으로 update
+  - 전진: 새 변화량을 더하고 구간 밖으로 밀려난 가장 오래된 변화량을 빼는 O(1) 갱신
+  - 원화 종가는 정수라 합의 가감에 부동소수 누적 오차가 없다
+  - 저장된 마지막 봉이 새 일봉에 없거나 종가가 다르면(수정주가 등) 그 종목만 일봉으로 다시 구성
+  - 저장 상태보다 과거 날짜(백필)는 상태를 건드리지 않고 일봉으로 계산
+전 종목이 한 행렬의 행이라, 수천 종목도 행렬 연산 몇 번으로 갱신된다.
+
+검증: update(..., verify=True) 또는 VERIFY_INDICATOR_STATE=1 이면 같은 일봉의 전체 재계산
+(batch_indicators)과 비교해 다른 종목을 경고하고 재계산 값을 쓴다.
+  python indicator_state.py --verify   # 저장된 전 종목을 일봉 캐시로 전체 재계산해 비교
+"""
+
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+from indicators import DEFAULT_WINDOWS, batch_indicators, compute_indicators, stack_closes
+from price_cache import CACHE_DIR, DailyBarCache
+from run_report import REPORT
+
+STATE_PATH = os.path.join(CACHE_DIR, "indicator_state.npz")
+
+VERIFY_ENV = "VERIFY_INDICATOR_STATE"
+
+# 저장 배열 (종목 수 × ...)
+_ARRAYS = ("codes", "dates", "closes", "n_valid", "gain", "loss")
+
+
+class IndicatorState:
+    def __init__(self, windows=DEFAULT_WINDOWS, path: str = STATE_PATH):
+        self.windows = tuple(sorted(set(windows)))
+        self.depth = max(self.windows) + 1
+        self.path = path
+        self._empty()
+        if os.path.exists(path):
+            self._load()
+
+    # ----- 저장/로드 -----
+    def _empty(self):
+        self.codes = np.empty(0, dtype="U6")
+        self.dates = np.empty(0, dtype="U8")                       # 마지막 봉 일자
+        self.closes = np.empty((0, self.depth), dtype="float64")   # 과거→최신 링 버퍼 (앞쪽 NaN)
+        self.n_valid = np.empty(0, dtype="int64")
+        self.gain = np.empty((0, len(self.windows)), dtype="float64")   # 기간별 최근 N개 상승폭 합
+        self.loss = np.empty((0, len(self.windows)), dtype="float64")
+        self.index = {}
+
+    def _load(self):
+        try:
+            with np.load(self.path) as z:
+                if tuple(z["windows"]) != self.windows:
+                    print(f"[INFO] 지표 상태 기간 변경 {tuple(z['windows'])} → {self.windows}: 새로 구성")
+                    return
+                for name in _ARRAYS:
+                    setattr(self, name, z[name])
+        except (OSError, KeyError, ValueError) as e:
+            print(f"[WARN] 지표 상태 읽기 실패 → 새로 구성: {e}")
+            self._empty()
+            return
+        self.index = {c: i for i, c in enumerate(self.codes)}
+
+    def save(self):
+        """임시 파일에 쓴 뒤 교체 (백필 워커끼리 겹쳐도 파일은 항상 온전 — 마지막 저장이 남음)"""
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp = self.path + ".tmp.npz"
+        np.savez(tmp, windows=np.array(self.windows), **{name: getattr(self, name) for name in _ARRAYS})
+        os.replace(tmp, self.path)
+
+    def _rows(self, codes) -> np.ndarray:
+        """종목 → 행 번호 (처음 보는 종목은 행 추가)"""
+        new = [c for c in codes if c not in self.index]
+        if new:
+            n = len(new)
+            self.codes = np.concatenate([self.codes, np.array(new, dtype="U6")])
+            self.dates = np.concatenate([self.dates, np.full(n, "", dtype="U8")])
+            self.closes = np.vstack([self.closes, np.full((n, self.depth), np.nan)])
+            self.n_valid = np.concatenate([self.n_valid, np.zeros(n, dtype="int64")])
+            self.gain = np.vstack([self.gain, np.zeros((n, len(self.windows)))])
+            self.loss = np.vstack([self.loss, np.zeros((n, len(self.windows)))])
+            for c in new:
+                self.index[c] = len(self.index)
+        return np.array([self.index[c] for c in codes], dtype="int64")
+
+    # ----- 갱신 -----
+    def _rebuild(self, rows, prices, n_valid, last_dates):
+        """일봉 행렬(과거→최신)로 상태를 새로 구성"""
+        self.closes[rows] = prices
+        self.n_valid[rows] = n_valid
+        self.dates[rows] = last_dates
+        with np.errstate(invalid="ignore"):
+            for j, n in enumerate(self.windows):
+                delta = np.diff(prices[:, -(n + 1):], axis=1)
+                self.gain[rows, j] = np.nansum(np.clip(delta, 0.0, None), axis=1)
+                self.loss[rows, j] = np.nansum(np.clip(-delta, 0.0, None), axis=1)
+
+    def _advance(self, rows, close, day):
+        """rows 종목에 새 봉 하나씩 전진 (기간마다 새 변화량 더하고 밀려난 변화량 빼기)"""
+        ring = self.closes[rows]
+        new = close - ring[:, -1]
+        for j, n in enumerate(self.windows):
+            dropped = np.nan_to_num(ring[:, -n] - ring[:, -n - 1])
+            self.gain[rows, j] += np.clip(new, 0.0, None) - np.clip(dropped, 0.0, None)
+            self.loss[rows, j] += np.clip(-new, 0.0, None) - np.clip(-dropped, 0.0, None)
+        ring[:, :-1] = ring[:, 1:]
+        ring[:, -1] = close
+        self.closes[rows] = ring
+        self.n_valid[rows] = np.minimum(self.n_valid[rows] + 1, self.depth)
+        self.dates[rows] = day
+
+    def values(self, rows) -> dict:
+        """상태 → compute_indicators 와 같은 형식의 지표 배열"""
+        ring, n_valid = self.closes[rows], self.n_valid[rows]
+        out = {}
+        with np.errstate(divide="ignore", invalid="ignore"):
+            for j, n in enumerate(self.windows):
+                base = ring[:, -n]
+                ret = (ring[:, -1] / base - 1.0) * 100.0
+                ret[(n_valid < n) | (base == 0)] = np.nan
+                rsi = 100.0 - 100.0 / (1.0 + (self.gain[rows, j] / n) / (self.loss[rows, j] / n))
+                rsi[n_valid < n + 1] = np.nan
+                out[f"ret{n}_pct"] = ret
+                out[f"rsi{n}"] = rsi
+        return out
+
+    def last_days(self, codes) -> dict:
+        """{종목코드: 저장된 마지막 봉 일자} — 구간이 다 찬(전진 가능한) 종목만"""
+        return {c: self.dates[self.index[c]] for c in codes
+                if c in self.index and self.n_valid[self.index[c]] >= self.depth}
+
+    def _match(self, codes, prices, dates):
+        """
+        stack_closes 행렬 ↔ 저장 상태 대조.
+        반환: (rows, chained, back, k) — chained: 저장된 마지막 봉(같은 종가)에서 이어지는 종목,
+        back: 저장 상태보다 과거 일봉(백필), k: 저장된 마지막 봉 뒤 새 봉 수
+        """
+        known = np.array([c in self.index for c in codes])
+        rows = self._rows(codes)
+        stored_day, stored_close = self.dates[rows], self.closes[rows, -1]
+
+        # 저장 상태보다 과거 일봉(백필): 상태는 그대로 두고 일봉으로 계산
+        back = known & (stored_day > dates[:, -1])
+
+        # 저장된 마지막 봉이 일봉 안 어디에 있는지 → 그 뒤 새 봉 수 k (0 이면 변화 없음)
+        hit = (dates == stored_day[:, None]) & (stored_day != "")[:, None]
+        pos = np.where(hit.any(axis=1), hit.argmax(axis=1), -1)
+        same_close = np.isclose(prices[np.arange(len(codes)), np.maximum(pos, 0)], stored_close)
+        k = np.where(pos >= 0, self.depth - 1 - pos, -1)
+        chained = known & ~back & (pos >= 0) & same_close & (self.n_valid[rows] > 0)
+        return rows, chained, back, k
+
+    def _step(self, rows, chained, k, prices, dates):
+        for step in range(int(k[chained].max()) if chained.any() else 0):
+            # 새 봉이 k개인 종목은 오래된 것부터 한 칸씩 (보통 하루 1개 → 1번)
+            move = chained & (k > step)
+            col = self.depth - k[move] + step
+            self._advance(rows[move], prices[move, col], dates[move, col])
+
+    def advance(self, bars: dict, verify: bool = None, loader=None):
+        """
+        {종목코드: 저장된 마지막 봉 일자 이후 일봉(그 봉 포함, 최신→과거)} → (지표 DataFrame, 다시 구성할 종목 목록).
+        마지막 봉에서 이어지는 종목만 새 봉만큼 전진하고, 나머지(처음 보는 종목, 수정주가, 백필, 긴 공백)는
+        목록으로 돌려준다 — 호출한 쪽이 그 종목만 전체 구간 일봉으로 update.
+        verify 는 전체 구간 일봉이 필요하므로 loader(종목코드 → 일봉) 를 함께 넘긴다.
+        """
+        if verify is None:
+            verify = os.environ.get(VERIFY_ENV) == "1"
+        codes, prices, _, dates = stack_closes(bars, self.depth, date_col="일자")
+        if not codes:
+            return pd.DataFrame(columns=list(self.values(np.zeros(0, dtype="int64")))), list(bars)
+        rows, chained, _, k = self._match(codes, prices, dates)
+        chained &= self.n_valid[rows] >= self.depth
+        self._step(rows, chained, k, prices, dates)
+
+        done = [c for c, ok in zip(codes, chained) if ok]
+        out = pd.DataFrame(self.values(rows[chained]), index=pd.Index(done, name="종목코드"))
+        REPORT.count("indicator_state.advanced", len(done))
+        if verify and loader is not None and done:
+            out = self._verify(out, {c: loader(c) for c in done})
+        return out, [c for c, ok in zip(codes, chained) if not ok]
+
+    def update(self, charts: dict, verify: bool = None) -> pd.DataFrame:
+        """
+        {종목코드: 일봉 DataFrame(최신→과거, 일자/현재가)} → batch_indicators 와 같은 지표 DataFrame.
+        저장된 마지막 봉 이후의 새 봉만큼 전진하고, 이어지지 않는 종목만 다시 구성한다.
+        """
+        if verify is None:
+            verify = os.environ.get(VERIFY_ENV) == "1"
+        codes, prices, n_valid, dates = stack_closes(charts, self.depth, date_col="일자")
+        if not codes:
+            return batch_indicators(charts, windows=self.windows)
+        rows, chained, back, k = self._match(codes, prices, dates)
+
+        fresh = ~back & ~chained
+        if fresh.any():
+            self._rebuild(rows[fresh], prices[fresh], n_valid[fresh], dates[fresh, -1])
+        self._step(rows, chained, k, prices, dates)
+
+        vals = self.values(rows)
+        if back.any():
+            past = compute_indicators(prices[back], n_valid[back], self.windows)
+            for name in vals:
+                vals[name][back] = past[name]
+        out = pd.DataFrame(vals, index=pd.Index(codes, name="종목코드"))
+        REPORT.count("indicator_state.advanced", int(chained.sum()))
+        REPORT.count("indicator_state.rebuilt", int(fresh.sum()))
+
+        if verify:
+            out = self._verify(out, charts)
+        return out
+
+    def _verify(self, out: pd.DataFrame, charts: dict) -> pd.DataFrame:
+        """전체 재계산과 비교 — 다른 종목은 경고 후 재계산 값 사용"""
+        full = batch_indicators(charts, windows=self.windows).reindex(out.index)
+        diff = ~np.isclose(out.to_numpy(), full[out.columns].to_numpy(), equal_nan=True)
+        bad = out.index[diff.any(axis=1)]
+        REPORT.count("indicator_state.verified", len(out))
+        if len(bad):
+            REPORT.count("indicator_state.mismatch", len(bad))
+            print(f"[WARN] 지표 상태 불일치 {len(bad)}개 → 전체 재계산 값 사용: {list(bad[:10])}")
+            out.loc[bad] = full.loc[bad, out.columns]
+            _, prices, n_valid, dates = stack_closes({c: charts[c] for c in bad}, self.depth, date_col="일자")
+            self._rebuild(self._rows(list(bad)), prices, n_valid, dates[:, -1])
+        return out
+
+
+def verify_store(path: str = STATE_PATH, windows=DEFAULT_WINDOWS, cache: DailyBarCache = None) -> int:
+    """저장된 전 종목을 일봉 캐시(저장 일자까지)로 전체 재계산해 비교. 반환: 불일치 종목 수"""
+    state = IndicatorState(windows, path)
+    cache = cache or DailyBarCache()
+    if not state.index:
+        print("[INFO] 저장된 지표 상태 없음")
+        return 0
+    charts = {c: cache.load(c, limit=state.depth, until=d) for c, d in zip(state.codes, state.dates)}
+    full = batch_indicators(charts, windows=state.windows)
+    mine = pd.DataFrame(state.values(state._rows(list(full.index))), index=full.index)
+    diff = ~np.isclose(mine.to_numpy(), full[mine.columns].to_numpy(), equal_nan=True)
+    bad = full.index[diff.any(axis=1)]
+    print(f"[VERIFY] {len(full)}개 종목 중 불일치 {len(bad)}개" + (f": {list(bad[:20])}" if len(bad) else ""))
+    return len(bad)
+
+
+def main():
+    p = argparse.ArgumentParser(description="지표 상태 저장소 점검")
+    p.add_argument("--verify", action="store_true", help="저장 상태를 일봉 캐시 전체 재계산과 비교")
+    p.add_argument("--windows", default=",".join(map(str, DEFAULT_WINDOWS)), help="기간 목록 (예: 14,20)")
+    args = p.parse_args()
+    windows = tuple(int(w) for w in args.windows.split(","))
+    if args.verify:
+        raise SystemExit(1 if verify_store(windows=windows) else 0)
+    state = IndicatorState(windows)
+    print(f"[INFO] {STATE_PATH}: 종목 {len(state.index)}개, 기간 {state.windows}, 최신 일자 "
+          f"{max(state.dates) if len(state.dates) else '-'}")
+
+
+if __name__ == "__main__":
+    main()
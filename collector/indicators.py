@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""
+일봉 배치 지표 엔진
+
+여러 종목의 일봉(chart_data)을 하나의 (종목 × 일자) 종가 행렬로 쌓은 뒤
+N일 수익률 / RSI(N)을 종목 루프 없이 한 번의 벡터 연산으로 계산한다.
+계산 정의는 step2의 calc_ret14_and_rsi_from_chart 와 동일하다.
+  - retN  : (오늘 종가 / N-1 거래일 전 종가 - 1) * 100
+  - RSI(N): 최근 N개 일간 변화량의 단순평균 상승폭/하락폭 기준
+"""
+
+import numpy as np
+import pandas as pd
+
+from common import to_number
+
+# 기본 계산 기간
+DEFAULT_WINDOWS = (14,)
+
+
+def parse_price_column(values: pd.Series) -> pd.Series:
+    """'12,345' 같은 문자열 가격을 숫자로 변환 (이미 숫자형이면 문자열 처리 생략)"""
+    return to_number(values)
+
+
+def stack_closes(charts: dict, depth: int, price_col: str = "현재가", date_col: str = None):
+    """
+    {종목코드: 일봉 DataFrame(최신→과거)} → (codes, prices, n_valid)
+
+    - prices : shape (종목 수, depth) float64 행렬. 과거→최신(오른쪽 끝이 최신) 정렬,
+               데이터가 모자란 앞쪽 칸은 NaN
+    - n_valid: 종목별 유효 종가 개수(최대 depth)
+    가격 문자열 파싱은 전 종목을 이어붙여 한 번만 수행한다.
+    date_col 을 주면 prices 와 같은 칸 배치의 일자(YYYYMMDD, 빈 칸은 "") 행렬을 4번째로 함께 반환.
+    """
+    codes = list(charts.keys())
+    prices = np.full((len(codes), depth), np.nan, dtype="float64")
+    dates = np.full((len(codes), depth), "", dtype="U8") if date_col else None
+    if not codes:
+        empty = np.zeros(0, dtype="int64")
+        return (codes, prices, empty) if dates is None else (codes, prices, empty, dates)
+
+    lengths = np.array([len(charts[c]) for c in codes], dtype="int64")
+    raw = pd.concat([charts[c][price_col] for c in codes], ignore_index=True)
+    values = parse_price_column(raw).to_numpy(dtype="float64")
+    group = np.repeat(np.arange(len(codes)), lengths)
+
+    # 결측 제거 후 종목 내 순번(0 = 최신) 계산
+    valid = ~np.isnan(values)
+    values, group = values[valid], group[valid]
+    starts = np.searchsorted(group, np.arange(len(codes)))
+    rank = np.arange(len(group)) - starts[group]
+
+    keep = rank < depth
+    prices[group[keep], depth - 1 - rank[keep]] = values[keep]
+    n_valid = np.minimum(np.bincount(group, minlength=len(codes)), depth)
+    if dates is None:
+        return codes, prices, n_valid
+    raw_dates = pd.concat([charts[c][date_col] for c in codes], ignore_index=True)
+    day = raw_dates.astype(str).str.replace("-", "").str.slice(0, 8).to_numpy()[valid]
+    dates[group[keep], depth - 1 - rank[keep]] = day[keep]
+    return codes, prices, n_valid, dates
+
+
+def compute_indicators(prices: np.ndarray, n_valid: np.ndarray, windows=DEFAULT_WINDOWS) -> dict:
+    """
+    stack_closes 결과 행렬에 대해 기간별 ret / RSI 를 일괄 계산.
+    반환: {"ret14_pct": ndarray, "rsi14": ndarray, ...} (계산 불가 종목은 NaN)
+    """
+    out = {}
+    with np.errstate(divide="ignore", invalid="ignore"):
+        for n in windows:
+            if prices.shape[1] < n + 1:
+                raise ValueError(f"행렬 깊이({prices.shape[1]})가 기간 {n}+1 보다 작습니다.")
+
+            # N일 수익률: 최신 종가 vs N-1 거래일 전 종가
+            base = prices[:, -n]
+            ret = (prices[:, -1] / base - 1.0) * 100.0
+            ret[(n_valid < n) | (base == 0)] = np.nan
+
+            # RSI(N): 최근 N개 변화량의 단순평균
+            delta = np.diff(prices[:, -(n + 1):], axis=1)
+            avg_gain = np.clip(delta, 0.0, None).mean(axis=1)
+            avg_loss = np.clip(-delta, 0.0, None).mean(axis=1)
+            rsi = 100.0 - 100.0 / (1.0 + avg_gain / avg_loss)
+            rsi[n_valid < n + 1] = np.nan
+
+            out[f"ret{n}_pct"] = ret
+            out[f"rsi{n}"] = rsi
+    return out
+
+
+def batch_indicators(charts: dict, windows=DEFAULT_WINDOWS, price_col: str = "현재가") -> pd.DataFrame:
+    """
+    일봉 묶음 → 종목코드 인덱스의 지표 DataFrame (열: ret{n}_pct, rsi{n})
+    """
+    depth = max(windows) + 1
+    codes, prices, n_valid = stack_closes(charts, depth, price_col=price_col)
+    cols = compute_indicators(prices, n_valid, windows)
+    return pd.DataFrame(cols, index=pd.Index(codes, name="종목코드"))
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+"""
+투자자별 순매수 로컬 캐시 (SQLite)
+
+opt10059(종목별투자자기관별요청) 응답 행을 (종목코드, 일자) 키로 저장해 두고,
+step3가 필요한 최근 구간(기준일까지 INVESTOR_LOOKBACK 거래일)이 캐시에 모두 있으면
+TR 요청 없이 캐시에서 바로 읽는다.
+  - 요청이 필요할 때도 응답 페이지가 캐시 구간과 겹치는 순간 연속조회를 멈춘다.
+  - 같은 일자는 나중 응답으로 덮어써서 장중에 저장된 값이 확정값으로 갱신된다.
+원본 응답 열은 행마다 JSON 으로 보관해 per_stock 원자료 CSV 를 그대로 다시 만들 수 있다.
+"""
+
+import json
+import os
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from common import connect_sqlite
+from price_cache import CACHE_DIR, DailyBarCache
+from run_report import REPORT
+
+INVESTOR_DB = os.path.join(CACHE_DIR, "investor_flows.sqlite")
+
+# 연속 순매도 판단에 쓰는 기준일 포함 최근 거래일 수 (opt10059 1회 응답 분량)
+INVESTOR_LOOKBACK = 100
+
+# opt10059 요청 입력 (일자/종목코드 제외)
+OPT10059_INPUTS = {
+    "금액수량구분": "1",  # 1: 수량
+    "매매구분": "0",      # 0: 순매수
+    "단위구분": "1",      # 1: 주식수
+}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS investor_flows (
+    code     TEXT NOT NULL,
+    date     TEXT NOT NULL,   -- YYYYMMDD
+    foreign_ REAL,            -- 외국인투자자 순매수
+    inst     REAL,            -- 기관계 순매수
+    volume   REAL,            -- 누적거래량
+    row      TEXT,            -- 원본 응답 행(JSON, 열 순서 유지)
+    PRIMARY KEY (code, date)
+)
+"""
+
+
+def _num(value):
+    try:
+        return float(str(value).replace(",", ""))
+    except ValueError:
+        return None
+
+
+def _last_weekday(yyyymmdd: str) -> str:
+    day = datetime.strptime(yyyymmdd, "%Y%m%d")
+    while day.weekday() >= 5:
+        day -= timedelta(days=1)
+    return day.strftime("%Y%m%d")
+
+
+class InvestorFlowCache:
+    def __init__(self, path: str = INVESTOR_DB, bar_cache: DailyBarCache = None):
+        self.path = path
+        self.bar_cache = bar_cache
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with connect_sqlite(self.path) as con:
+            con.execute(_SCHEMA)
+
+    # ----- 조회 -----
+    def expected_last_date(self, code: str, until: str) -> str:
+        """
+        until(YYYYMMDD) 이하 마지막 거래일.
+        일봉 캐시에 해당 종목 봉이 있으면 그 일자(휴장일 반영), 없으면 마지막 평일.
+        """
+        if self.bar_cache is not None:
+            last = self.bar_cache.last_bar_date(code, until)
+            if last is not None:
+                return last
+        return _last_weekday(until)
+
+    def coverage(self, code: str, until: str):
+        """(until 이하 캐시 마지막 일자, until 이하 저장 행 수)"""
+        with connect_sqlite(self.path) as con:
+            row = con.execute(
+                "SELECT MAX(date), COUNT(*) FROM investor_flows WHERE code=? AND date<=?", (code, until)
+            ).fetchone()
+        return (row[0], int(row[1])) if row and row[0] is not None else (None, 0)
+
+    def covers(self, code: str, until: str, lookback: int = INVESTOR_LOOKBACK) -> bool:
+        """until 까지 최근 lookback 거래일이 캐시에 모두 있으면 True"""
+        last, count = self.coverage(code, until)
+        return last is not None and last >= self.expected_last_date(code, until) and count >= lookback
+
+    def load(self, code: str, until: str, lookback: int = INVESTOR_LOOKBACK) -> pd.DataFrame:
+        """until 이하 최근 lookback 행을 opt10059 응답과 같은 열/순서(최신→과거)로 반환"""
+        with connect_sqlite(self.path) as con:
+            rows = con.execute(
+                "SELECT row FROM investor_flows WHERE code=? AND date<=? ORDER BY date DESC LIMIT ?",
+                (code, until, int(lookback)),
+            ).fetchall()
+        return pd.DataFrame([json.loads(r[0]) for r in rows])
+
+    # ----- 저장 -----
+    def upsert(self, code: str, data: pd.DataFrame) -> int:
+        """opt10059 응답 DataFrame(문자열 열)을 캐시에 병합"""
+        if data is None or len(data) == 0 or "일자" not in data.columns:
+            return 0
+        rows = []
+        for rec in data.to_dict("records"):
+            day = str(rec["일자"]).replace("-", "")[:8]
+            if not day.strip():
+                continue
+            rows.append((code, day, _num(rec.get("외국인투자자")), _num(rec.get("기관계")),
+                         _num(rec.get("누적거래량")), json.dumps(rec, ensure_ascii=False, default=str)))
+        with connect_sqlite(self.path) as con:
+            con.executemany(
+                "INSERT OR REPLACE INTO investor_flows (code, date, foreign_, inst, volume, row) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+        return len(rows)
+
+    # ----- 캐시 경유 조회 -----
+    def fetch(self, ep, code: str, until: str, lookback: int = INVESTOR_LOOKBACK) -> pd.DataFrame:
+        """
+        캐시 우선 투자자 이력 조회.
+        - 캐시가 until 까지 최근 lookback 거래일을 모두 갖고 있으면 TR 없이 반환
+        - 아니면 opt10059 요청. 받은 행이 lookback 이상이거나 응답이 캐시 구간과 겹치면 연속조회 중단
+        반환: until 이하 최근 lookback 행 (최신→과거)
+        """
+        if self.covers(code, until, lookback):
+            REPORT.count("investor_cache.hit")
+        else:
+            REPORT.count("investor_cache.miss")
+            hwm, _ = self.coverage(code, until)
+            inputs = {"일자": until, "종목코드": code, **OPT10059_INPUTS}
+            got = 0
+            events = ep.TransactionCall("종목별투자자기관별요청", "opt10059", "0001", inputs)
+            for event in REPORT.timed_iter("tr.opt10059", events):
+                page = pd.DataFrame.from_records([v.values for v in event.multi_data.values],
+                                                 columns=event.multi_data.names)
+                self.upsert(code, page)
+                got += len(page)
+                oldest = page["일자"].astype(str).min() if len(page) else None
+                if got >= lookback or oldest is None or (hwm is not None and oldest <= hwm):
+                    break
+        return self.load(code, until, lookback)
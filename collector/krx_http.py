@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""
+KRX 정보데이터시스템 HTTP 수집기 (브라우저 없이)
+
+MDC02030204(공매도 거래 상위 50 종목) 화면이 내부적으로 호출하는
+OTP 발급 → CSV 다운로드 엔드포인트를 직접 호출한다.
+  - KOSPI / KOSDAQ 을 풀링된 세션으로 동시에 요청
+  - EUC-KR CSV 를 파일을 거치지 않고 메모리에서 바로 DataFrame 으로 변환
+KRX_BASE_URL 환경변수로 로컬 스텁 서버(krx_stub_server.py)를 가리킬 수 있다.
+"""
+
+import io
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+
+from common import read_typed
+from run_report import REPORT
+
+KRX_BASE_URL = os.environ.get("KRX_BASE_URL", "http://data.krx.co.kr")
+OTP_PATH = "/comm/fileDn/GenerateOTP/generate.cmd"
+DOWNLOAD_PATH = "/comm/fileDn/download_csv/download.cmd"
+REFERER = "http://data.krx.co.kr/contents/MDC/MDI/mdiLoader/index.cmd?menuId=MDC02030204"
+
+# 화면 MDCSTAT304(공매도 거래 상위 50 종목) 데이터 ID
+SHORT_TOP50_BLD = "dbms/MDC/STAT/srt/MDCSTAT30401"
+
+# 시장 → KRX mktId
+MARKET_IDS = {"KOSPI": "STK", "KOSDAQ": "KSQ"}
+
+# 기준일에 데이터가 없으면(휴장일 등) 며칠 전까지 거슬러 올라갈지
+LOOKBACK_DAYS = 10
+
+
+class KrxNoDataError(RuntimeError):
+    """조회 구간에 데이터가 있는 거래일이 없음 (휴장일 등)"""
+
+
+class KrxClient:
+    def __init__(self, base_url: str = None, timeout: float = 15.0):
+        # None 이면 생성 시점의 KRX_BASE_URL 사용 (벤치마크가 모듈 값을 가짜 서버로 바꿀 수 있음)
+        self.base_url = (base_url or KRX_BASE_URL).rstrip("/")
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=len(MARKET_IDS), pool_maxsize=len(MARKET_IDS) * 2)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update({
+            "User-Agent": "Mozilla/5.0",
+            "Referer": REFERER,
+        })
+
+    def close(self):
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    # ----- 단일 시장 -----
+    def download_csv(self, market: str, trd_dd: str) -> bytes:
+        """시장/기준일(YYYYMMDD) CSV 원문(EUC-KR 바이트)"""
+        form = {
+            "locale": "ko_KR",
+            "mktId": MARKET_IDS[market],
+            "trdDd": trd_dd,
+            "money": "1",
+            "csvxls_isNo": "false",
+            "name": "fileDown",
+            "url": SHORT_TOP50_BLD,
+        }
+        with REPORT.timed("krx.otp"):
+            otp = self.session.post(self.base_url + OTP_PATH, data=form, timeout=self.timeout)
+            otp.raise_for_status()
+        with REPORT.timed("krx.download"):
+            resp = self.session.post(self.base_url + DOWNLOAD_PATH, data={"code": otp.text.strip()},
+                                     timeout=self.timeout)
+            resp.raise_for_status()
+        return resp.content
+
+    def fetch_market(self, market: str, trd_dd: str):
+        """(원문 바이트, DataFrame) — 데이터가 없는 날은 빈 DataFrame"""
+        raw = self.download_csv(market, trd_dd)
+        if not raw.strip():
+            return raw, pd.DataFrame()
+        # 종목코드 문자열 / 수치 숫자형으로 파싱 시점에 고정 (common.SCHEMAS["krx"])
+        return raw, read_typed(io.BytesIO(raw), "krx")
+
+    # ----- 전체 시장 -----
+    def fetch_all(self, trd_dd: str) -> dict:
+        """{시장: (원문 바이트, DataFrame)} — 시장별 요청을 동시에 보냄"""
+        with ThreadPoolExecutor(max_workers=len(MARKET_IDS)) as pool:
+            futures = {m: pool.submit(self.fetch_market, m, trd_dd) for m in MARKET_IDS}
+            return {m: f.result() for m, f in futures.items()}
+
+    def fetch_latest(self, base_date: datetime, lookback: int = LOOKBACK_DAYS):
+        """
+        base_date 부터 거슬러 올라가며 데이터가 있는 첫 거래일을 찾음.
+        반환: (기준일 YYYYMMDD, {시장: (원문 바이트, DataFrame)})
+        """
+        for back in range(lookback + 1):
+            day = base_date - timedelta(days=back)
+            if day.weekday() >= 5:   # 주말은 요청 생략
+                continue
+            trd_dd = day.strftime("%Y%m%d")
+            results = self.fetch_all(trd_dd)
+            if any(len(df) for _, df in results.values()):
+                return trd_dd, results
+            REPORT.count("krx.empty_day")
+        raise KrxNoDataError(f"KRX 데이터 없음: {base_date:%Y-%m-%d} 이전 {lookback}일")
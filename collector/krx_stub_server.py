@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+"""
+KRX 다운로드 엔드포인트 로컬 스텁 서버 (krx_http.py 검증용)
+
+public/data/{YYYY-MM-DD}/kospi.csv, kosdaq.csv 를 그대로 돌려준다.
+  python krx_stub_server.py --port 8765 --data-root ../public/data
+  KRX_BASE_URL=http://127.0.0.1:8765 python step1_select_top200.py
+해당 날짜 폴더가 없으면 빈 본문을 돌려준다(휴장일 응답 흉내).
+"""
+
+import argparse
+import os
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+from krx_http import DOWNLOAD_PATH, MARKET_IDS, OTP_PATH
+
+# mktId → 저장 파일명
+FILES = {mkt_id: f"{market.lower()}.csv" for market, mkt_id in MARKET_IDS.items()}
+
+
+def make_handler(data_root: str, latency: float):
+    class Handler(BaseHTTPRequestHandler):
+        def _form(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            body = self.rfile.read(length).decode("utf-8")
+            return {k: v[0] for k, v in parse_qs(body).items()}
+
+        def _send(self, status: int, body: bytes, ctype: str):
+            self.send_response(status)
+            self.send_header("Content-Type", ctype)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_POST(self):
+            time.sleep(latency)
+            form = self._form()
+            if self.path == OTP_PATH:
+                # OTP 대신 요청 파라미터를 그대로 코드로 사용
+                self._send(200, f"{form.get('mktId', '')}:{form.get('trdDd', '')}".encode(), "text/plain")
+            elif self.path == DOWNLOAD_PATH:
+                mkt_id, _, trd_dd = form.get("code", "").partition(":")
+                date_dir = f"{trd_dd[:4]}-{trd_dd[4:6]}-{trd_dd[6:]}"
+                path = os.path.join(data_root, date_dir, FILES.get(mkt_id, ""))
+                body = b""
+                if mkt_id in FILES and os.path.isfile(path):
+                    with open(path, "rb") as f:
+                        body = f.read()
+                self._send(200, body, "text/csv")
+            else:
+                self._send(404, b"not found", "text/plain")
+
+        def log_message(self, fmt, *args):
+            print(f"[STUB] {self.address_string()} {fmt % args}")
+
+    return Handler
+
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=8765)
+    p.add_argument("--data-root", default=os.path.join("..", "public", "data"))
+    p.add_argument("--latency", type=float, default=0.0, help="응답 지연(초)")
+    args = p.parse_args()
+
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(args.data_root, args.latency))
+    print(f"[STUB] KRX 스텁 서버 http://{args.host}:{args.port} (data-root={args.data_root})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
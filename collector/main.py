@@ -1,13 +1,25 @@
 # -*- coding: utf-8 -*-
 import os
 import sys
+import contextlib
 import re
 import json
+import shutil
 import subprocess
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing.util import Finalize
 from pathlib import Path
-from datetime import datetime
+from datetime import datetime, timedelta
 import argparse
 
+from change_feed import CHANGES_FILE, refresh_changes
+from checkpoint import Checkpoint, atomic_write_text, params_hash
+from common import credentials
+from run_report import REPORT, start_profile
+from screen import SCREEN_ENV, fingerprint
+from site_bundle import refresh_bundles
+from snapshot import publish_link
+
 # 기본 날짜(미지정 시 오늘 날짜로 대체됨)
 DEFAULT_DATE = "2025-08-27"   # <-- 필요시 바꿔쓰기 (YYYY-MM-DD)
 
@@ -23,11 +35,36 @@ SCRIPTS = [
     PROJECT_ROOT / "collector" / "step3_foreigner.py",
 ]
 
-def parse_args_date() -> str:
-    """--date(YYYY-MM-DD) > PIPELINE_DATE > DEFAULT_DATE > today 순으로 결정"""
+def parse_args():
     p = argparse.ArgumentParser()
     p.add_argument("--date", default=None, help="YYYY-MM-DD")
+    p.add_argument("--mode", choices=["inprocess", "subprocess", "queue"],
+                   default=os.environ.get("PIPELINE_MODE", "inprocess"),
+                   help="inprocess: 한 프로세스/한 번 로그인으로 실행(기본), subprocess: 스텝별 스크립트 실행, "
+                        "queue: 종목별 TR 을 작업 큐로 워커 프로세스(계정별 세션)에 분산")
+    p.add_argument("--fresh", action="store_true",
+                   help="체크포인트를 무시하고 처음부터 실행 (inprocess 모드)")
+    p.add_argument("--from", dest="date_from", default=None,
+                   help="백필 시작일 YYYY-MM-DD (--to 와 함께: 날짜 구간을 프로세스 풀로 실행, latest/ 는 갱신하지 않음)")
+    p.add_argument("--to", dest="date_to", default=None, help="백필 종료일 YYYY-MM-DD (기본: 오늘)")
+    p.add_argument("--workers", type=int, default=int(os.environ.get("BACKFILL_WORKERS", "2")),
+                   help="백필 워커 프로세스 수 (키움 TR 제한은 워커끼리 나눠 씀)")
+    p.add_argument("--queue-workers", type=int, default=int(os.environ.get("QUEUE_WORKERS", "2")),
+                   help="queue 모드 워커 프로세스 수")
+    p.add_argument("--accounts", default=os.environ.get("KIWOOM_ACCOUNTS"),
+                   help="queue 모드 계정 목록 JSON (워커에 돌려 가며 배정, 기본: 환경변수 로그인 정보 하나)")
+    p.add_argument("--fake-kiwoom", action="store_true",
+                   help="queue 모드 워커가 가짜 키움(fake_entrypoint)으로 조회 (로그인 없이 확인용)")
+    p.add_argument("--screen", default=None,
+                   help="스크린 규칙 JSON 파일 (기본: screen.py 의 DEFAULT_SCREEN, 환경변수 SCREEN_FILE)")
+    p.add_argument("--profile", action="store_true",
+                   help="cProfile 결과를 날짜 폴더의 run_profile.pstats 로 저장 (run_report.json 은 항상 저장)")
     args, _ = p.parse_known_args()
+    return args
+
+def parse_args_date() -> str:
+    """--date(YYYY-MM-DD) > PIPELINE_DATE > DEFAULT_DATE > today 순으로 결정"""
+    args = parse_args()
 
     date = args.date or os.environ.get("PIPELINE_DATE") or DEFAULT_DATE
     # 포맷 검증/보정
@@ -51,17 +88,260 @@ def run(script: Path, date: str):
     if result.returncode != 0:
         raise SystemExit(f"[ERR] {script} 실패 (exit={result.returncode})")
 
-def update_index_json(date: str):
+def import_steps(date: str):
+    """스텝 모듈 import (import 시점에 --date / PIPELINE_DATE 로 경로를 정하므로 먼저 지정)"""
+    os.environ["PIPELINE_DATE"] = date
+    collector_dir = PROJECT_ROOT / "collector"
+    os.chdir(collector_dir)   # subprocess 모드와 같은 작업 폴더(상대 경로 기준)
+    if str(collector_dir) not in sys.path:
+        sys.path.insert(0, str(collector_dir))
+
+    import step1_select_top200 as step1
+    import step2_koapy_filter as step2
+    import step3_foreigner as step3
+    return step1, step2, step3
+
+def run_stages(date: str, steps, ckpt, connect, collect, per_stock_dirs=None, queue=None):
+    """
+    체크포인트를 거쳐 step1 → step2 → step3 계산 (latest/ 저장 없음).
+    - connect(): 로그인된 엔트리포인트 (실제로 조회할 스테이지가 있을 때만 호출)
+    - collect(): step1 수집 → (candidates, 기준일)
+    - queue: work_queue.RunQueue 를 주면 step2/step3 조회를 작업 큐 워커에 맡김
+    반환: (candidates, 기준일, metrics_df, df_filt1, df_final) — step2 결과가 없으면 metrics_df 는 None
+    """
+    step1, step2, step3 = steps
+    until = datetime.strptime(date, "%Y-%m-%d").strftime("%Y%m%d")
+
+    # --- step1: 날짜/수집 방식이 같으면 보관된 후보군 재사용 ---
+    step1_in = params_hash(date, step1.BACKEND)
+    with REPORT.stage("step1") as st:
+        if ckpt.is_complete("step1", step1_in):
+            print(f"\n[SKIP] step1 — 체크포인트 재사용 ({ckpt.dir})")
+            st["skipped"] = True
+            candidates = ckpt.load_output("step1", "candidates")
+            source_date = ckpt.extra("step1")["source_date"]
+        else:
+            print(f"\n[RUN] step1 (in-process) --date {date}")
+            ckpt.begin("step1", step1_in)
+            candidates, source_date = collect()
+            ckpt.complete("step1", {"candidates": candidates}, extra={"source_date": source_date})
+        st["rows_out"] = len(candidates)
+
+    # --- step2 ---
+    step2_in = params_hash(ckpt.output_hash("step1", "candidates"), fingerprint(step2.SCREEN, "column"),
+                           fingerprint(step2.SCREEN, "chart"), list(step2.INDICATOR_WINDOWS), until)
+    with REPORT.stage("step2") as st:
+        if ckpt.is_complete("step2", step2_in):
+            print("\n[SKIP] step2 — 체크포인트 재사용")
+            st["skipped"] = True
+            metrics_df = ckpt.load_output("step2", "metrics")
+            df_filt1 = ckpt.load_output("step2", "filtered1")
+        else:
+            print(f"\n[RUN] step2 (in-process) --date {date}")
+            progress = ckpt.begin("step2", step2_in)
+            metrics_df, df_filt1 = step2.run(candidates, connect(), progress=progress, until=until, queue=queue)
+            ckpt.complete("step2", {"metrics": metrics_df, "filtered1": df_filt1})
+        st["rows_in"] = len(candidates)
+        st["rows_out"] = 0 if df_filt1 is None else len(df_filt1)
+
+    # --- step3 ---
+    df_final = None
+    if metrics_df is not None:
+        step3_in = params_hash(ckpt.output_hash("step2", "metrics"),
+                               ckpt.output_hash("step2", "filtered1"), fingerprint(step3.SCREEN, "investor"), until)
+        with REPORT.stage("step3") as st:
+            if ckpt.is_complete("step3", step3_in):
+                print("\n[SKIP] step3 — 체크포인트 재사용")
+                st["skipped"] = True
+                metrics_step3 = ckpt.load_output("step3", "metrics")
+                df_final = ckpt.load_output("step3", "recommendations")
+            else:
+                print(f"\n[RUN] step3 (in-process) --date {date}")
+                progress = ckpt.begin("step3", step3_in)
+                step3_ep = connect() if not df_filt1.empty else None
+                metrics_step3, df_final = step3.run(df_filt1, metrics_df, step3_ep, fromdate=until,
+                                                    progress=progress, per_stock_dirs=per_stock_dirs, queue=queue)
+                ckpt.complete("step3", {"metrics": metrics_step3, "recommendations": df_final})
+            st["rows_in"] = len(df_filt1)
+            st["rows_out"] = len(df_final)
+        if metrics_step3 is not None:
+            metrics_df = metrics_step3
+    return candidates, source_date, metrics_df, df_filt1, df_final
+
+def run_inprocess(date: str, fresh: bool = False, queue=None):
     """
-    public/data/index.json 갱신 + meta.json( latest / 해당 날짜 폴더 )
+    세 스텝을 한 프로세스에서 함수로 호출.
+    - 키움 로그인은 한 번만 하고 step2/step3가 같은 엔트리포인트를 공유
+    - 스텝 사이에는 DataFrame을 그대로 넘기고, CSV는 마지막에 한 번만 저장
+    - 날짜별 체크포인트(cache/checkpoints/{date})로 입력이 같은 스테이지는 건너뛰고,
+      중간에 끊긴 step2/step3는 완료된 종목 다음부터 이어서 실행
+    - queue(work_queue.RunQueue)를 주면 여기서는 로그인하지 않고 조회를 작업 큐 워커에 맡김
+    """
+    step1, step2, step3 = import_steps(date)
+
+    with contextlib.ExitStack() as stack:
+        ep = None
+
+        def connect():
+            # 실제로 조회할 스테이지가 있을 때만 로그인
+            nonlocal ep
+            if queue is not None:
+                return None
+            if ep is None:
+                from koapy import KiwoomOpenApiPlusEntrypoint
+                ep = stack.enter_context(KiwoomOpenApiPlusEntrypoint())
+                ep.EnsureConnected(credentials)
+            return ep
+
+        candidates, source_date, metrics_df, df_filt1, df_final = run_stages(
+            date, (step1, step2, step3), Checkpoint(date, fresh=fresh), connect, step1.collect, queue=queue)
+
+    # === 결과 저장 (한 번만) ===
+    with REPORT.stage("save"):
+        step1.save(candidates, source_date)
+        if metrics_df is None:
+            print("[WARN] step2 계산 결과가 없어 metrics/recommendations 저장을 건너뜁니다.")
+            return
+        step2.save(metrics_df, df_filt1)
+        step3.save(None, df_final)
+
+def run_queued(date: str, workers: int, accounts: str = None, fake: bool = False, fresh: bool = False):
+    """
+    작업 큐 모드: 워커 프로세스(계정별 키움 세션)를 띄우고, step2/step3 의 종목별 조회를 큐로 분산.
+    워커는 일봉/투자자 캐시를 채우고, 이 프로세스는 캐시에서 읽어 기존과 같은 결과 파일을 저장.
+    """
+    import_steps(date)
+    from work_queue import RunQueue, load_accounts, start_workers, stop_workers
+
+    rq = RunQueue(date)
+    procs = start_workers(rq, max(1, workers), load_accounts(accounts), fake=fake)
+    try:
+        run_inprocess(date, fresh=fresh, queue=rq)
+    finally:
+        stop_workers(rq, procs)
+
+# ====== 백필 (--from / --to) ======
+# 워커 프로세스별 상태: 스텝 모듈, 키움 엔트리포인트(워커당 1회 로그인)
+_WORKER = {}
+
+def backfill_dates(date_from: str, date_to: str):
+    """from~to 사이 평일 (최신 날짜부터: 먼저 받은 전체 이력을 과거 날짜가 캐시로 재사용)"""
+    day = datetime.strptime(date_to, "%Y-%m-%d")
+    first = datetime.strptime(date_from, "%Y-%m-%d")
+    dates = []
+    while day >= first:
+        if day.weekday() < 5:
+            dates.append(day.strftime("%Y-%m-%d"))
+        day -= timedelta(days=1)
+    return dates
+
+def _init_backfill_worker(date_to: str, workers: int):
+    steps = import_steps(date_to)
+    # 같은 계정의 TR 제한을 워커끼리 나눠 씀
+    import tr_scheduler
+    tr_scheduler.TR_LIMITS = [(count / workers, per_sec, burst) for count, per_sec, burst in tr_scheduler.TR_LIMITS]
+    _WORKER["steps"] = steps
+
+def _worker_connect():
+    ep = _WORKER.get("ep")
+    if ep is None:
+        from koapy import KiwoomOpenApiPlusEntrypoint
+        ep = KiwoomOpenApiPlusEntrypoint()
+        ep.__enter__()
+        ep.EnsureConnected(credentials)
+        # 워커 종료 시 로그아웃 (풀 워커는 atexit 이 돌지 않음)
+        Finalize(ep, ep.__exit__, args=(None, None, None), exitpriority=10)
+        _WORKER["ep"] = ep
+    return ep
+
+def run_dated(date: str, fresh: bool = False, profile: bool = False):
+    """
+    백필 워커: date 하나를 계산해 public/data/{date}/ 에만 저장 (latest/ 는 건드리지 않음).
+    휴장일이 아니면 같은 폴더에 run_report.json(+ --profile 시 run_profile.pstats)도 저장.
+    반환: (date, 상태, 날짜 폴더 절대경로)
+    """
+    from krx_http import KrxNoDataError
+    from snapshot import write_snapshot
+
+    step1, step2, step3 = _WORKER["steps"]
+    data_dir = os.path.abspath(os.path.join(step1.DATA_ROOT, date))
+    base_date = datetime.strptime(date, "%Y-%m-%d")
+    REPORT.reset(date, mode="backfill")
+    prof = start_profile(profile)
+    try:
+        candidates, _, metrics_df, df_filt1, df_final = run_stages(
+            date, _WORKER["steps"], Checkpoint(date, fresh=fresh), _worker_connect,
+            lambda: step1.collect_http(base_date, lookback=0),
+            per_stock_dirs=[os.path.join(data_dir, "per_stock", "investors")],
+        )
+    except KrxNoDataError:
+        if prof is not None:
+            prof.disable()
+        return date, "휴장", data_dir
+
+    with REPORT.stage("save"):
+        write_snapshot(candidates, data_dir, "candidates")
+        if metrics_df is not None:
+            write_snapshot(metrics_df, data_dir, "metrics_all")
+            write_snapshot(df_filt1, data_dir, "candidates_filtered1")
+            write_snapshot(df_final, data_dir, "recommendations")
+    REPORT.write(str(PROJECT_ROOT / "public" / "data" / date), profile=prof)
+    if metrics_df is None:
+        return date, "step2 결과 없음", data_dir
+    return date, f"OK (후보 {len(candidates)} / 1차 {len(df_filt1)} / 추천 {len(df_final)})", data_dir
+
+def _prune_empty_tree(path: str):
+    """파일이 하나도 없는 폴더 트리 삭제 (휴장일 등으로 빈 날짜 폴더가 남지 않게)"""
+    if not os.path.isdir(path):
+        return
+    for root, _, files in os.walk(path):
+        if files:
+            return
+    shutil.rmtree(path, ignore_errors=True)
+
+def run_backfill(date_from: str, date_to: str, workers: int, fresh: bool = False, profile: bool = False):
+    dates = backfill_dates(date_from, date_to)
+    print(f"[BACKFILL] {date_from} ~ {date_to}: 평일 {len(dates)}일 / 워커 {workers}개")
+    done = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_backfill_worker,
+                             initargs=(date_to, workers)) as pool:
+        futures = {pool.submit(run_dated, d, fresh, profile): d for d in dates}
+        dirs = {}
+        for fut in as_completed(futures):
+            d = futures[fut]
+            try:
+                _, status, dirs[d] = fut.result()
+            except Exception as e:
+                status = f"실패: {e}"
+            print(f"[BACKFILL] {d}: {status}")
+            if status.startswith("OK"):
+                done.append(d)
+
+    # 결과가 없는 날짜 폴더 정리 (워커 import 시 생성된 빈 폴더 포함)
+    for d, path in dirs.items():
+        if d not in done:
+            _prune_empty_tree(path)
+
+    # 공매도 시계열은 단일 기록자 — 워커가 아닌 여기서 날짜 순으로 적재
+    from short_store import ShortStore
+    ShortStore().ingest_folders([dirs[d] for d in sorted(done)])
+    print(f"[BACKFILL] 완료 {len(done)}일 / 전체 {len(dates)}일")
+    return sorted(done)
+
+def update_index_json(date: str, touch_latest: bool = True, run_dates=None):
+    """
+    public/data/index.json 갱신 + meta.json( latest / 해당 날짜 폴더 ) + 날짜별 사이트 번들 + 변경 피드
     구조:
       {
         "available_dates": ["2025-08-18", "2025-08-27", ...],
-        "latest_run_date": "2025-08-27"
+        "latest_run_date": "2025-08-27",
+        "bundles": {"2025-08-27": {"file": "2025-08-27/bundle.{hash}.json.gz", "hash": "...", "rows": 12, "bytes": 900}},
+        "changes": {"2025-08-27": {"file": "2025-08-27/changes.json", "prev": "2025-08-26", "added": 2, "removed": 1, "bytes": 700}}
       }
     """
     data_root = PROJECT_ROOT / "public" / "data"
     data_root.mkdir(parents=True, exist_ok=True)
+    index_path = data_root / "index.json"
 
     # YYYY-MM-DD 폴더만 수집
     date_dirs = []
@@ -71,42 +351,90 @@ def update_index_json(date: str):
             date_dirs.append(name)
 
     # 현재 실행 날짜가 목록에 없으면 포함시킴(방금 생성됐을 가능성)
-    if date not in date_dirs:
-        date_dirs.append(date)
+    run_dates = run_dates or [date]
+    for d in run_dates:
+        if d not in date_dirs:
+            date_dirs.append(d)
 
     date_dirs = sorted(set(date_dirs))
     latest = date_dirs[-1] if date_dirs else None
 
-    index_obj = {
-        "available_dates": date_dirs,
-        "latest_run_date": latest
-    }
-
-    # index.json 저장
-    (data_root / "index.json").write_text(
-        json.dumps(index_obj, ensure_ascii=False, indent=2),
-        encoding="utf-8"
-    )
-
     # meta.json 저장 (latest, 그리고 해당 날짜 폴더)
     def write_meta(path: Path, run_date: str):
         path.parent.mkdir(parents=True, exist_ok=True)
         path.write_text(json.dumps({"run_date": run_date}, ensure_ascii=False, indent=2), encoding="utf-8")
 
-    if latest:
-        write_meta(data_root / "latest" / "meta.json", latest)
-    write_meta(data_root / date / "meta.json", date)
+    for d in run_dates:
+        write_meta(data_root / d / "meta.json", d)
+    if latest and touch_latest:
+        # latest/meta.json 도 날짜 폴더 파일의 하드링크로 게시
+        if not (data_root / latest / "meta.json").exists():
+            write_meta(data_root / latest / "meta.json", latest)
+        publish_link(str(data_root / latest / "meta.json"), str(data_root / "latest" / "meta.json"))
 
-    print(f"[OK] index.json 갱신 — latest_run_date={latest}, dates={len(date_dirs)}")
+    # 날짜별 번들: 이번 실행 날짜만 다시 만들고 나머지는 기존 항목 재사용
+    previous = {}
+    if index_path.exists():
+        try:
+            previous = json.loads(index_path.read_text(encoding="utf-8"))
+        except ValueError:
+            previous = {}
+    bundles = refresh_bundles(str(data_root), date_dirs, rebuild=set(run_dates), previous=previous.get("bundles", {}))
+
+    # 변경 피드: 이번 실행 날짜(와 그 다음 날짜)만 앞 날짜와 비교해 다시 만듦
+    changes = refresh_changes(str(data_root), date_dirs, rebuild=set(run_dates), previous=previous.get("changes", {}))
+    if latest in changes and touch_latest:
+        publish_link(str(data_root / changes[latest]["file"]), str(data_root / "latest" / CHANGES_FILE))
+
+    index_obj = {
+        "available_dates": date_dirs,
+        "latest_run_date": latest,
+        "bundles": bundles,
+        "changes": changes,
+    }
+
+    # index.json 저장 (원자적 교체)
+    atomic_write_text(str(index_path), json.dumps(index_obj, ensure_ascii=False, indent=2))
+
+    print(f"[OK] index.json 갱신 — latest_run_date={latest}, dates={len(date_dirs)}, bundles={len(bundles)}, "
+          f"changes={len(changes)}")
 
 def main():
+    args = parse_args()
+    if args.screen:
+        # 스텝 모듈/백필 워커가 import 시점에 읽도록 환경변수로 전달
+        os.environ[SCREEN_ENV] = os.path.abspath(args.screen)
+    if args.date_from:
+        # === 백필: 날짜별 결과만 만들고 index.json 은 마지막에 한 번 갱신 ===
+        date_to = args.date_to or datetime.now().strftime("%Y-%m-%d")
+        done = run_backfill(args.date_from, date_to, max(1, args.workers), fresh=args.fresh, profile=args.profile)
+        if done:
+            update_index_json(done[-1], touch_latest=False, run_dates=done)
+        print("\n[OK] 백필 완료!")
+        return
+
     date = parse_args_date()
+    mode = args.mode
+    REPORT.reset(date, mode=mode)
+    prof = start_profile(args.profile)
 
-    for sc in SCRIPTS:
-        run(sc, date)
+    if mode == "inprocess":
+        run_inprocess(date, fresh=args.fresh)
+    elif mode == "queue":
+        run_queued(date, args.queue_workers, args.accounts, fake=args.fake_kiwoom, fresh=args.fresh)
+    else:
+        # 스텝별 스크립트: 벽시계 + 자식 프로세스 CPU 만 기록 (TR 지연시간은 inprocess 모드에서만)
+        for sc in SCRIPTS:
+            with REPORT.stage(sc.stem.split("_")[0]):
+                run(sc, date)
 
     # === 파이프라인 종료 후 index.json/meta.json 갱신 ===
-    update_index_json(date)
+    with REPORT.stage("index"):
+        update_index_json(date)
+
+    # === 실행 리포트 (meta.json 옆) ===
+    report_path = REPORT.write(str(PROJECT_ROOT / "public" / "data" / date), profile=prof)
+    print(f"[OK] 실행 리포트 → {report_path}")
 
     print("\n[OK] 파이프라인 완료!")
 
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""
+일봉 로컬 캐시 (SQLite)
+
+(종목코드, 일자) 키로 OHLCV 일봉을 저장해 두고,
+매 실행마다 캐시의 마지막 일자(high-water mark) 이후 구간만 키움에 요청한다.
+연속된 날짜에 같은 종목을 돌리면 종목당 1일치만 새로 받으면 된다.
+"""
+
+import os
+
+import pandas as pd
+
+from common import connect_sqlite
+from indicators import parse_price_column
+from run_report import REPORT
+
+# 캐시 파일 위치 (public/ 밖에 두어 사이트/깃 업로드 대상에서 제외)
+CACHE_DIR = r"digger-25-short-reco-site\cache"
+PRICE_DB = os.path.join(CACHE_DIR, "daily_bars.sqlite")
+
+# 저장하는 일봉 컬럼 (KOApy 일봉 컬럼명 그대로)
+BAR_COLS = ["현재가", "시가", "고가", "저가", "거래량"]
+
+# 캐시가 이보다 짧으면 전체 이력을 새로 받음
+MIN_BARS = 30
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS daily_bars (
+    code   TEXT NOT NULL,
+    date   TEXT NOT NULL,   -- YYYYMMDD
+    close  REAL,
+    open   REAL,
+    high   REAL,
+    low    REAL,
+    volume REAL,
+    PRIMARY KEY (code, date)
+)
+"""
+
+
+class DailyBarCache:
+    def __init__(self, path: str = PRICE_DB):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with connect_sqlite(self.path) as con:
+            con.execute(_SCHEMA)
+
+    # ----- 조회 -----
+    def high_water_mark(self, code: str):
+        """(캐시의 마지막 일자 YYYYMMDD, 저장된 봉 개수), 없으면 (None, 0)"""
+        with connect_sqlite(self.path) as con:
+            row = con.execute("SELECT MAX(date), COUNT(*) FROM daily_bars WHERE code=?", (code,)).fetchone()
+        if not row or row[0] is None:
+            return None, 0
+        return row[0], int(row[1])
+
+    def last_bar_date(self, code: str, until: str):
+        """until(YYYYMMDD) 이하 캐시의 마지막 봉 일자, 없으면 None"""
+        with connect_sqlite(self.path) as con:
+            row = con.execute("SELECT MAX(date) FROM daily_bars WHERE code=? AND date<=?", (code, until)).fetchone()
+        return row[0] if row else None
+
+    def load(self, code: str, limit: int = None, until: str = None, since: str = None) -> pd.DataFrame:
+        """
+        캐시된 일봉(until 이하)을 KOApy와 같은 최신→과거 순서의 DataFrame으로 반환.
+        since(YYYYMMDD) 를 주면 그 일자 이상 봉만 (지표 상태 전진용: 저장된 마지막 봉 + 새 봉)
+        """
+        sql = "SELECT date, close, open, high, low, volume FROM daily_bars WHERE code=?"
+        params = [code]
+        if until:
+            sql += " AND date<=?"
+            params.append(until)
+        if since:
+            sql += " AND date>=?"
+            params.append(since)
+        sql += " ORDER BY date DESC"
+        if limit:
+            sql += " LIMIT ?"
+            params.append(int(limit))
+        with connect_sqlite(self.path) as con:
+            rows = con.execute(sql, params).fetchall()
+        return pd.DataFrame(rows, columns=["일자"] + BAR_COLS)
+
+    # ----- 저장 -----
+    def upsert(self, code: str, chart: pd.DataFrame) -> int:
+        """KOApy 일봉 DataFrame을 캐시에 병합 (같은 일자는 새 값으로 덮어씀)"""
+        if chart is None or len(chart) == 0:
+            return 0
+        dates = chart["일자"].astype(str).str.replace("-", "").str.slice(0, 8)
+        cols = [parse_price_column(chart[c]) if c in chart.columns else pd.Series(float("nan"), index=chart.index)
+                for c in BAR_COLS]
+        frame = pd.concat([dates] + cols, axis=1)
+        frame = frame.dropna(subset=[frame.columns[1]])
+        rows = [(code, d, *vals) for d, *vals in frame.itertuples(index=False, name=None)]
+        with connect_sqlite(self.path) as con:
+            con.executemany(
+                "INSERT OR REPLACE INTO daily_bars (code, date, close, open, high, low, volume) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+        return len(rows)
+
+    # ----- 캐시 경유 조회 -----
+    def fetch(self, ep, code: str, limit: int = MIN_BARS, until: str = None, since: str = None) -> pd.DataFrame:
+        """
+        캐시 우선 일봉 조회.
+        - until(YYYYMMDD, 과거 기준일) 이후 봉까지 캐시에 있으면 요청 없이 캐시에서 반환
+        - 캐시가 비었거나 MIN_BARS 미만이면 전체 이력 요청
+        - 아니면 마지막 캐시 일자 이후만 요청 (마지막 일자 포함: 장중 저장된 봉을 확정값으로 갱신)
+        반환: 최신→과거 순서 until 이하 최근 limit개 봉 (since 를 주면 그 일자 이상만)
+        """
+        hwm, count = self.high_water_mark(code)
+        if until and hwm is not None and hwm > until and count >= MIN_BARS:
+            REPORT.count("daily_cache.hit")
+            return self.load(code, limit=limit, until=until, since=since)
+        if hwm is None or count < MIN_BARS:
+            REPORT.count("daily_cache.full")
+            with REPORT.timed("tr.opt10081"):
+                chart = ep.GetDailyStockDataAsDataFrame(code)
+        else:
+            # KOApy: start_date(최근) → end_date(과거) 방향으로 조회
+            REPORT.count("daily_cache.incremental")
+            with REPORT.timed("tr.opt10081"):
+                chart = ep.GetDailyStockDataAsDataFrame(code, end_date=hwm, include_end=True)
+        self.upsert(code, chart)
+        return self.load(code, limit=limit, until=until, since=since)
@@ -0,0 +1,325 @@
+# -*- coding: utf-8 -*-
+"""
+날짜별 스냅샷 조회 HTTP 서비스 (aiohttp)
+
+public/data/{date}/ 의 metrics_all / recommendations 스냅샷 전부를 메모리에 올려
+종목코드·날짜·시장별 색인을 만들고, 필터/정렬/페이지 단위 JSON 으로 돌려준다.
+  - 응답마다 ETag(데이터 버전 + 요청) → If-None-Match 가 같으면 304 (본문 없음)
+  - 새 날짜 폴더가 생기거나 스냅샷이 바뀌면 RELOAD_SEC 마다 감지해 바뀐 날짜만 다시 읽고 색인 교체
+    (색인 구성은 스레드에서 하고 완성본을 한 번에 바꿔 끼우므로 요청은 멈추지 않음)
+
+엔드포인트
+  GET /api/dates                           날짜별 metrics / recommendations 행 수
+  GET /api/metrics?code=096770             그 종목이 공매도 압력 필터(metrics_all)를 통과한 모든 날
+  GET /api/metrics?date=2025-08-27&sort=-rsi14&limit=10   그날 RSI 상위
+  GET /api/recommendations?from=2025-08-01&to=2025-08-31&market=KOSDAQ
+  GET /api/codes/096770                    종목별 metrics / recommendations 날짜 목록
+  공통 파라미터: code, date, market (쉼표로 여러 값), from / to (YYYY-MM-DD),
+                min_<열> / max_<열> (수치 필터), sort (쉼표, '-' 는 내림차순), fields, limit, offset
+
+사용 예)
+  python query_service.py --port 8800
+  curl "http://127.0.0.1:8800/api/metrics?code=096770&fields=날짜,rsi14,ret14_pct"
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import re
+import time
+
+import numpy as np
+import pandas as pd
+from aiohttp import web
+
+from common import CODE_COL, DATA_ROOT, DATE_DIR_RE
+from snapshot import read_snapshot, snapshot_paths
+
+DATE_COL = "날짜"
+
+# URL 이름 → 스냅샷 이름
+ARTIFACTS = {"metrics": "metrics_all", "recommendations": "recommendations"}
+
+# 색인 열 (쿼리 파라미터 → 열)
+KEYS = {"code": CODE_COL, "date": DATE_COL, "market": "market"}
+
+# 새 스냅샷 확인 주기[초]
+RELOAD_SEC = 5.0
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 5000
+
+
+# ====== 색인 ======
+def _snapshot_file(folder: str, name: str):
+    """실제로 읽히는 파일 (read_snapshot 과 같은 우선순위 — parquet 이 있으면 parquet)"""
+    for path in snapshot_paths(folder, name):
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def scan(data_root: str) -> dict:
+    """{(날짜, 스냅샷): (경로, 수정시각, 크기)} — 바뀐 날짜 감지용"""
+    out = {}
+    if not os.path.isdir(data_root):
+        return out
+    for d in sorted(os.listdir(data_root)):
+        if not DATE_DIR_RE.match(d):
+            continue
+        folder = os.path.join(data_root, d)
+        for name in ARTIFACTS.values():
+            path = _snapshot_file(folder, name)
+            if path is not None:
+                st = os.stat(path)
+                out[(d, name)] = (path, st.st_mtime_ns, st.st_size)
+    return out
+
+
+class SnapshotIndex:
+    """스냅샷별 전체 날짜 DataFrame + 열 값 → 행 위치 색인"""
+
+    def __init__(self, files: dict, frames: dict):
+        self.files = files
+        self.version = hashlib.sha1(repr(sorted(files.items())).encode()).hexdigest()[:12]
+        self.loaded_at = time.strftime("%Y-%m-%dT%H:%M:%S")
+        self.tables = {}
+        self.index = {}
+        for name in ARTIFACTS.values():
+            parts = [df for (d, n), df in sorted(frames.items()) if n == name]
+            table = pd.concat(parts, ignore_index=True) if parts else pd.DataFrame(columns=[DATE_COL, CODE_COL])
+            self.tables[name] = table
+            self.index[name] = {
+                param: (table.groupby(col, observed=True, sort=False).indices if col in table.columns else {})
+                for param, col in KEYS.items()
+            }
+
+    def positions(self, name: str, param: str, values) -> np.ndarray:
+        idx = self.index[name][param]
+        hits = [idx[v] for v in values if v in idx]
+        return np.unique(np.concatenate(hits)) if hits else np.empty(0, dtype="int64")
+
+    def dates(self, name: str):
+        return sorted(self.index[name]["date"])
+
+
+def build_index(data_root: str, previous: SnapshotIndex = None, frames: dict = None) -> SnapshotIndex:
+    """
+    스냅샷 전부 → SnapshotIndex. previous 와 파일 상태가 같은 날짜는 이전에 읽은 DataFrame 재사용.
+    frames: {(날짜, 스냅샷): DataFrame} 캐시 (호출 간 유지, 제자리 갱신)
+    """
+    files = scan(data_root)
+    frames = {} if frames is None else frames
+    old = previous.files if previous is not None else {}
+    for key in list(frames):
+        if key not in files:
+            del frames[key]
+    for key, sig in files.items():
+        if key in frames and old.get(key) == sig:
+            continue
+        d, name = key
+        try:
+            df = read_snapshot(os.path.join(data_root, d), name)
+        except Exception as e:
+            print(f"[WARN] {d}/{name} 읽기 실패: {e}")
+            frames.pop(key, None)
+            continue
+        df.insert(0, DATE_COL, d)
+        frames[key] = df
+    return SnapshotIndex(files, frames)
+
+
+# ====== 조회 ======
+class QueryError(ValueError):
+    pass
+
+
+def _split(value: str):
+    return [v.strip() for v in value.split(",") if v.strip()]
+
+
+def query(index: SnapshotIndex, name: str, params) -> dict:
+    """쿼리 파라미터 → {"total", "offset", "limit", "rows"} (rows 는 DataFrame)"""
+    table = index.tables[name]
+    pos = None
+    for param in KEYS:
+        if params.get(param):
+            hit = index.positions(name, param, _split(params[param]))
+            pos = hit if pos is None else np.intersect1d(pos, hit, assume_unique=True)
+
+    # 날짜 구간: 색인의 날짜 목록에서 구간에 드는 날짜들의 행 위치
+    lo, hi = params.get("from"), params.get("to")
+    if lo or hi:
+        days = [d for d in index.dates(name) if (not lo or d >= lo) and (not hi or d <= hi)]
+        hit = index.positions(name, "date", days)
+        pos = hit if pos is None else np.intersect1d(pos, hit, assume_unique=True)
+
+    rows = table if pos is None else table.iloc[pos]
+
+    for key, value in params.items():
+        m = re.match(r"^(min|max)_(.+)$", key)
+        if not m:
+            continue
+        col = m.group(2)
+        if col not in rows.columns:
+            raise QueryError(f"알 수 없는 열: {col}")
+        try:
+            bound = float(value)
+        except ValueError:
+            raise QueryError(f"{key}: 숫자가 아님 ({value!r})")
+        values = pd.to_numeric(rows[col], errors="coerce")
+        rows = rows.loc[(values >= bound) if m.group(1) == "min" else (values <= bound)]
+
+    if params.get("sort"):
+        cols, ascending = [], []
+        for s in _split(params["sort"]):
+            col = s.lstrip("-")
+            if col not in rows.columns:
+                raise QueryError(f"정렬 열 없음: {col}")
+            cols.append(col)
+            ascending.append(not s.startswith("-"))
+        rows = rows.sort_values(cols, ascending=ascending, kind="stable", na_position="last")
+
+    try:
+        limit = min(int(params.get("limit", DEFAULT_LIMIT)), MAX_LIMIT)
+        offset = max(int(params.get("offset", 0)), 0)
+    except ValueError:
+        raise QueryError("limit/offset 은 정수")
+
+    if params.get("fields"):
+        fields = _split(params["fields"])
+        missing = [f for f in fields if f not in rows.columns]
+        if missing:
+            raise QueryError(f"알 수 없는 열: {missing}")
+        rows = rows[fields]
+    return {"total": len(rows), "offset": offset, "limit": limit, "rows": rows.iloc[offset:offset + limit]}
+
+
+# ====== HTTP ======
+def _etag(index: SnapshotIndex, request: web.Request) -> str:
+    q = "&".join(f"{k}={v}" for k, v in sorted(request.query.items()))
+    digest = hashlib.sha1(f"{request.path}?{q}".encode("utf-8")).hexdigest()[:12]
+    return f'"{index.version}-{digest}"'
+
+
+def _json_response(request: web.Request, body_fn) -> web.Response:
+    """ETag 가 같으면 304, 아니면 body_fn() 의 JSON 문자열"""
+    index = request.app["index"]
+    etag = _etag(index, request)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag in _split(request.headers.get("If-None-Match", "")):
+        return web.Response(status=304, headers=headers)
+    try:
+        body = body_fn(index)
+    except QueryError as e:
+        return web.json_response({"error": str(e)}, status=400, dumps=lambda o: json.dumps(o, ensure_ascii=False))
+    return web.Response(text=body, content_type="application/json", headers=headers)
+
+
+def _page_json(result: dict, version: str) -> str:
+    rows = result["rows"].to_json(orient="records", force_ascii=False)
+    head = {k: result[k] for k in ("total", "offset", "limit")}
+    head["version"] = version
+    return json.dumps(head, ensure_ascii=False)[:-1] + f', "rows": {rows}}}'
+
+
+async def handle_dates(request):
+    def body(index):
+        counts = {}
+        for param, name in ARTIFACTS.items():
+            for d, pos in index.index[name]["date"].items():
+                counts.setdefault(d, {})[param] = len(pos)
+        return json.dumps({"version": index.version, "dates": dict(sorted(counts.items()))}, ensure_ascii=False)
+    return _json_response(request, body)
+
+
+async def handle_artifact(request):
+    name = ARTIFACTS.get(request.match_info["artifact"])
+    if name is None:
+        raise web.HTTPNotFound()
+    return _json_response(request, lambda index: _page_json(query(index, name, request.query), index.version))
+
+
+async def handle_code(request):
+    code = request.match_info["code"].zfill(6)
+
+    def body(index):
+        out = {"version": index.version, CODE_COL: code}
+        for param, name in ARTIFACTS.items():
+            pos = index.positions(name, "code", [code])
+            table = index.tables[name]
+            out[param] = sorted(table[DATE_COL].iloc[pos].unique().tolist()) if len(pos) else []
+            if len(pos) and "종목명" in table.columns:
+                out["종목명"] = str(table["종목명"].iloc[pos[-1]])
+        return json.dumps(out, ensure_ascii=False)
+    return _json_response(request, body)
+
+
+async def handle_status(request):
+    index = request.app["index"]
+    return web.json_response({
+        "version": index.version,
+        "loaded_at": index.loaded_at,
+        "dates": len({d for name in ARTIFACTS.values() for d in index.dates(name)}),
+        "rows": {param: len(index.tables[name]) for param, name in ARTIFACTS.items()},
+    })
+
+
+async def _reload_loop(app):
+    """RELOAD_SEC 마다 파일 상태를 보고 바뀌었으면 스레드에서 색인을 새로 만들어 교체"""
+    loop = asyncio.get_event_loop()
+    while True:
+        await asyncio.sleep(app["reload_sec"])
+        try:
+            files = await loop.run_in_executor(None, scan, app["data_root"])
+            if files == app["index"].files:
+                continue
+            index = await loop.run_in_executor(None, build_index, app["data_root"], app["index"], app["frames"])
+            app["index"] = index
+            print(f"[RELOAD] 버전 {index.version} (날짜 {len(index.index['metrics_all']['date'])}개)")
+        except Exception as e:
+            print(f"[WARN] 색인 갱신 실패: {e}")
+
+
+async def _start_reload(app):
+    app["reloader"] = asyncio.ensure_future(_reload_loop(app))
+
+
+async def _stop_reload(app):
+    app["reloader"].cancel()
+
+
+def make_app(data_root: str = DATA_ROOT, reload_sec: float = RELOAD_SEC) -> web.Application:
+    app = web.Application()
+    app["data_root"] = data_root
+    app["reload_sec"] = reload_sec
+    app["frames"] = {}
+    t0 = time.perf_counter()
+    app["index"] = build_index(data_root, frames=app["frames"])
+    print(f"[INDEX] {data_root}: 날짜 {len(app['index'].index['metrics_all']['date'])}개, "
+          f"metrics {len(app['index'].tables['metrics_all'])}행, "
+          f"recommendations {len(app['index'].tables['recommendations'])}행 ({time.perf_counter() - t0:.2f}s)")
+    app.router.add_get("/api/dates", handle_dates)
+    app.router.add_get("/api/status", handle_status)
+    app.router.add_get("/api/codes/{code}", handle_code)
+    app.router.add_get("/api/{artifact}", handle_artifact)
+    if reload_sec > 0:
+        app.on_startup.append(_start_reload)
+        app.on_cleanup.append(_stop_reload)
+    return app
+
+
+def main():
+    p = argparse.ArgumentParser(description="날짜별 스냅샷 조회 HTTP 서비스")
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=8800)
+    p.add_argument("--data-root", default=DATA_ROOT)
+    p.add_argument("--reload-sec", type=float, default=RELOAD_SEC, help="새 스냅샷 확인 주기 (0: 끔)")
+    args = p.parse_args()
+    web.run_app(make_app(args.data_root, args.reload_sec), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
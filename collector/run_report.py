@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+"""
+실행 리포트 (run_report.json)
+
+한 번의 파이프라인 실행(날짜 하나)에 대해
+  - 스테이지별 벽시계/CPU 시간, 스테이지 종료 시점 메모리
+  - 키움 TR(opt10081 일봉, opt10059 투자자) / KRX 다운로드 종류별 지연시간 히스토그램
+  - 재시도/과부하/오류 횟수, 필터별 입력/출력 행 수
+  - 최대 메모리 사용량(peak RSS)
+을 모아 날짜 폴더(meta.json 옆)에 run_report.json 으로 저장한다.
+계측 지점은 모듈 전역 REPORT 에 기록하고(스레드 안전), main.py 가 실행마다 reset/write 한다.
+느린 날이 키움 과부하 때문인지, KRX 수집 때문인지, pandas 계산 때문인지 구분하는 용도.
+"""
+
+import bisect
+import contextlib
+import json
+import os
+import threading
+import time
+from datetime import datetime
+
+try:
+    import psutil   # 있으면 Windows 에서도 peak RSS 측정
+except ImportError:
+    psutil = None
+
+try:
+    import resource  # Unix 전용
+except ImportError:
+    resource = None
+
+REPORT_NAME = "run_report.json"
+PROFILE_NAME = "run_profile.pstats"
+
+# 지연시간 히스토그램 구간 상한[ms] (마지막 구간은 초과분)
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+# 요약에 넣을 백분위
+PERCENTILES = (50, 90, 99)
+
+
+# ====== 메모리 ======
+def rss_mb():
+    """현재 RSS[MB] (측정 불가면 None)"""
+    if psutil is not None:
+        return psutil.Process().memory_info().rss / 2**20
+    return None
+
+
+def peak_rss_mb():
+    """프로세스 시작 이후 최대 RSS[MB] (측정 불가면 None)"""
+    if psutil is not None:
+        info = psutil.Process().memory_info()
+        peak = getattr(info, "peak_wset", None)   # Windows
+        if peak is not None:
+            return peak / 2**20
+    if resource is not None:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2**10   # Linux: KB
+    return None
+
+
+def _cpu_seconds() -> float:
+    """이 프로세스 + 종료된 자식 프로세스(subprocess 모드 스텝) CPU 시간"""
+    t = os.times()
+    return t[0] + t[1] + t[2] + t[3]
+
+
+def _round(v, nd=4):
+    return None if v is None else round(v, nd)
+
+
+# ====== 지연시간 ======
+class LatencyStats:
+    def __init__(self):
+        self.samples = []
+        self.errors = 0
+
+    def add(self, seconds: float):
+        self.samples.append(seconds)
+
+    def summary(self) -> dict:
+        ms = sorted(s * 1000.0 for s in self.samples)
+        hist = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        for v in ms:
+            hist[bisect.bisect_left(LATENCY_BUCKETS_MS, v)] += 1
+        labels = [f"<={b}" for b in LATENCY_BUCKETS_MS] + [f">{LATENCY_BUCKETS_MS[-1]}"]
+        out = {"count": len(ms), "errors": self.errors, "total_s": _round(sum(ms) / 1000.0)}
+        if ms:
+            out["mean_ms"] = _round(sum(ms) / len(ms), 2)
+            for p in PERCENTILES:
+                out[f"p{p}_ms"] = _round(ms[min(len(ms) - 1, int(len(ms) * p / 100))], 2)
+            out["max_ms"] = _round(ms[-1], 2)
+        out["histogram_ms"] = dict(zip(labels, hist))
+        return out
+
+
+# ====== 리포트 ======
+class RunReport:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self, date: str = None, mode: str = None):
+        """새 실행 시작 (백필 워커는 날짜마다 호출)"""
+        with self.lock:
+            self.date = date
+            self.mode = mode
+            self.started_at = datetime.now()
+            self.t0 = time.perf_counter()
+            self.cpu0 = _cpu_seconds()
+            self.stages = {}
+            self.latency = {}
+            self.counters = {}
+            self.rows_io = {}
+            self.extra = {}
+
+    # ----- 스테이지 -----
+    @contextlib.contextmanager
+    def stage(self, name: str):
+        """with REPORT.stage("step2") as st: ... (st 에 skipped 등 추가 기록 가능)"""
+        st = {}
+        t0, c0 = time.perf_counter(), _cpu_seconds()
+        try:
+            yield st
+        finally:
+            st.update(wall_s=_round(time.perf_counter() - t0), cpu_s=_round(_cpu_seconds() - c0),
+                      rss_mb=_round(rss_mb(), 1))
+            with self.lock:
+                self.stages[name] = st
+
+    # ----- 지연시간 -----
+    def _stats(self, kind: str) -> LatencyStats:
+        stats = self.latency.get(kind)
+        if stats is None:
+            stats = self.latency[kind] = LatencyStats()
+        return stats
+
+    def observe(self, kind: str, seconds: float, error: bool = False):
+        with self.lock:
+            stats = self._stats(kind)
+            stats.add(seconds)
+            if error:
+                stats.errors += 1
+
+    @contextlib.contextmanager
+    def timed(self, kind: str):
+        """요청 1건 지연시간 기록 (예외도 시간과 함께 오류로 기록 후 다시 던짐)"""
+        t0 = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.observe(kind, time.perf_counter() - t0, error=True)
+            raise
+        self.observe(kind, time.perf_counter() - t0)
+
+    def timed_iter(self, kind: str, events):
+        """연속조회 제너레이터: 페이지마다 (요청 → 응답) 지연시간 기록"""
+        it = iter(events)
+        while True:
+            t0 = time.perf_counter()
+            try:
+                event = next(it)
+            except StopIteration:
+                return
+            except Exception:
+                self.observe(kind, time.perf_counter() - t0, error=True)
+                raise
+            self.observe(kind, time.perf_counter() - t0)
+            yield event
+
+    # ----- 카운터 / 행 수 -----
+    def count(self, name: str, n: int = 1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def rows(self, name: str, rows_in: int, rows_out: int):
+        """필터 하나의 입력/출력 행 수"""
+        with self.lock:
+            self.rows_io[name] = {"in": int(rows_in), "out": int(rows_out)}
+
+    def note(self, **kwargs):
+        with self.lock:
+            self.extra.update(kwargs)
+
+    # ----- 저장 -----
+    def to_dict(self) -> dict:
+        with self.lock:
+            return {
+                "date": self.date,
+                "mode": self.mode,
+                "started_at": self.started_at.isoformat(timespec="seconds"),
+                "finished_at": datetime.now().isoformat(timespec="seconds"),
+                "wall_s": _round(time.perf_counter() - self.t0),
+                "cpu_s": _round(_cpu_seconds() - self.cpu0),
+                "peak_rss_mb": _round(peak_rss_mb(), 1),
+                "stages": dict(self.stages),
+                "latency": {k: v.summary() for k, v in sorted(self.latency.items())},
+                "counters": dict(sorted(self.counters.items())),
+                "rows": dict(self.rows_io),
+                **self.extra,
+            }
+
+    def write(self, folder: str, profile=None) -> str:
+        """folder/run_report.json 저장. profile(cProfile.Profile)을 주면 run_profile.pstats 도 저장"""
+        os.makedirs(folder, exist_ok=True)
+        if profile is not None:
+            profile.disable()
+            profile.dump_stats(os.path.join(folder, PROFILE_NAME))
+            self.note(profile=PROFILE_NAME)
+        path = os.path.join(folder, REPORT_NAME)
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, indent=2)
+        os.replace(tmp, path)
+        return path
+
+
+REPORT = RunReport()
+
+
+def start_profile(enabled: bool):
+    """--profile: cProfile 시작 (메인 스레드만 측정 — TR 스레드 대기는 latency 로 봄). 꺼져 있으면 None"""
+    if not enabled:
+        return None
+    import cProfile
+    prof = cProfile.Profile()
+    prof.enable()
+    return prof
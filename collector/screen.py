@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+"""
+선언형 스크리닝 규칙 엔진
+
+스크린 정의(규칙 목록)를 받아 조회 비용 순서로 나눠 평가한다.
+  - column   : 후보군 CSV 에 이미 있는 열 (공매도 비중, 주가 수익률 ...)      비용 0
+  - chart    : 일봉 TR(opt10081)로 계산하는 열 (ret14_pct, rsi14 ...)          비용 1
+  - investor : 투자자 TR(opt10059)로 계산하는 값 (netsell_streak, netsell_run, netsell_share20 ...)  비용 2
+column 규칙은 키움 조회 전에 하나의 벡터 마스크로 한 번에 적용하고(step2 시작),
+chart 규칙은 통과 종목의 일봉 지표 계산 후(step2 끝), investor 규칙은 그 통과 종목만
+조회해 수급 배치 엔진(flow_engine)으로 전 종목 지표를 한 번에 계산한 뒤 마스크로 적용한다(step3). 스크린에 쓰인 열이 싼 등급일수록
+먼저 걸러지므로 TR 은 스크린이 실제로 필요로 하는 종목에만 나간다.
+
+규칙 형식 (JSON 파일로도 지정 가능: main.py --screen 또는 환경변수 SCREEN_FILE)
+  {"field": "공매도 비중", "op": ">=", "value": 2.5}
+  {"field": "netsell_streak", "op": ">=", "value": 3}
+  source("column"/"chart"/"investor")는 field 로 추론하며 직접 지정할 수도 있다.
+"""
+
+import json
+import os
+import re
+from collections import namedtuple
+
+import pandas as pd
+
+from flow_engine import flow_metrics, metric_names
+
+# ====== 기본 스크린 (기존 step2/step3 임계값과 동일) ======
+DEFAULT_SCREEN = [
+    {"field": "공매도 비중", "op": ">=", "value": 2.5},     # step2 공매도 압력 (TH_SHORT_RATIO)
+    {"field": "ret14_pct", "op": ">=", "value": 20.0},      # step2 14일 수익률 (TH_RET14)
+    {"field": "rsi14", "op": ">=", "value": 70.0},          # step2 RSI(14)    (TH_RSI)
+    {"field": "netsell_streak", "op": ">=", "value": 3},    # step3 외국인·기관 동시 순매도 연속 일수
+]
+
+SCREEN_ENV = "SCREEN_FILE"
+
+# 비용 등급 (작을수록 먼저 평가)
+COSTS = {"column": 0, "chart": 1, "investor": 2}
+
+# 일봉 지표 열 → 계산 기간
+_CHART_FIELD_RE = re.compile(r"^(?:ret(\d+)_pct|rsi(\d+))$")
+
+OPS = {
+    ">=": lambda s, v: s >= v,
+    ">": lambda s, v: s > v,
+    "<=": lambda s, v: s <= v,
+    "<": lambda s, v: s < v,
+    "==": lambda s, v: s == v,
+    "!=": lambda s, v: s != v,
+}
+
+
+# ====== 투자자 지표 (opt10059 원자료 → 값) ======
+def _flow_metric(field: str):
+    # 종목 하나짜리 묶음으로 배치 엔진 호출 (여러 종목은 step3 처럼 flow_metrics 를 직접 사용)
+    return lambda data: flow_metrics({"": data})[field].iloc[0]
+
+
+# 투자자 지표 = 수급 배치 엔진 열 (netsell_streak / foreign_·inst_ 변형, *_run, netsell_share{n})
+INVESTOR_METRICS = {name: _flow_metric(name) for name in metric_names()}
+
+
+# ====== 규칙 ======
+Rule = namedtuple("Rule", ["field", "op", "value", "source"])
+
+
+def rule_source(field: str) -> str:
+    if field in INVESTOR_METRICS:
+        return "investor"
+    if _CHART_FIELD_RE.match(field):
+        return "chart"
+    return "column"
+
+
+def parse_screen(spec) -> list:
+    """규칙 dict 목록 → 비용 순으로 정렬된 Rule 목록 (같은 등급 안에서는 정의 순서 유지)"""
+    rules = []
+    for i, item in enumerate(spec):
+        field, op = item.get("field"), item.get("op", ">=")
+        if not field or "value" not in item:
+            raise ValueError(f"스크린 규칙 {i}: field/value 필요 ({item})")
+        if op not in OPS:
+            raise ValueError(f"스크린 규칙 {i}: 지원하지 않는 연산자 {op!r} (가능: {list(OPS)})")
+        source = item.get("source") or rule_source(field)
+        if source not in COSTS:
+            raise ValueError(f"스크린 규칙 {i}: 알 수 없는 source {source!r}")
+        if source == "investor" and field not in INVESTOR_METRICS:
+            raise ValueError(f"스크린 규칙 {i}: 알 수 없는 투자자 지표 {field!r} (가능: {list(INVESTOR_METRICS)})")
+        rules.append(Rule(field, op, item["value"], source))
+    return sorted(rules, key=lambda r: COSTS[r.source])
+
+
+def load_screen(path: str = None) -> list:
+    """path(없으면 SCREEN_FILE 환경변수)의 JSON 스크린, 둘 다 없으면 DEFAULT_SCREEN"""
+    path = path or os.environ.get(SCREEN_ENV)
+    if not path:
+        return parse_screen(DEFAULT_SCREEN)
+    with open(path, encoding="utf-8") as f:
+        return parse_screen(json.load(f))
+
+
+def tier(rules, source: str) -> list:
+    return [r for r in rules if r.source == source]
+
+
+def fingerprint(rules, source: str = None) -> list:
+    """체크포인트 입력 해시용 (source 를 주면 그 등급만)"""
+    return [list(r) for r in rules if source is None or r.source == source]
+
+
+def chart_windows(rules) -> set:
+    """chart 규칙이 필요로 하는 지표 기간 (ret20_pct → 20)"""
+    out = set()
+    for r in tier(rules, "chart"):
+        m = _CHART_FIELD_RE.match(r.field)
+        out.add(int(m.group(1) or m.group(2)))
+    return out
+
+
+def threshold(rules, field: str, default=None):
+    """field 에 걸린 첫 규칙의 값 (표시용)"""
+    return next((r.value for r in rules if r.field == field), default)
+
+
+# ====== 평가 ======
+def mask(df: pd.DataFrame, rules) -> pd.Series:
+    """열 규칙들을 하나의 불리언 마스크로 (숫자로 못 바꾸는 값/결측은 불통과)"""
+    missing = [r.field for r in rules if r.field not in df.columns]
+    if missing:
+        raise KeyError(f"스크린 열 없음: {missing}")
+    out = pd.Series(True, index=df.index)
+    for r in rules:
+        col = df[r.field]
+        if isinstance(r.value, (int, float)) and not pd.api.types.is_numeric_dtype(col):
+            col = pd.to_numeric(col, errors="coerce")
+        out &= OPS[r.op](col, r.value).fillna(False).astype(bool)
+    return out
+
+
+def investor_pass(data: pd.DataFrame, rules) -> bool:
+    """투자자 규칙을 순서대로 평가하다 하나라도 실패하면 바로 False"""
+    for r in rules:
+        value = INVESTOR_METRICS[r.field](data)
+        if not OPS[r.op](value, r.value):
+            return False
+    return True
@@ -0,0 +1,295 @@
+# -*- coding: utf-8 -*-
+"""
+종목 × 거래일 공매도 시계열 저장소 (NumPy memmap, 추가 전용)
+
+step1 이 날마다 받는 KRX 원본(kospi.csv / kosdaq.csv)의 공매도 거래대금·거래대금·공매도 비중·
+주가 수익률을 필드별 이진 파일 하나씩에 "하루 = 한 행, 종목 = 고정 열" 로 이어 붙인다.
+  - 읽기는 np.memmap 으로 파일을 그대로 (일수 × 종목) 행렬로 보므로 CSV 수백 개를 열 필요가 없고,
+    특정 날짜/종목 조회는 행·열 번호 계산만으로 끝난다
+  - 직전 N일 평균, z-score, 증가배율 같은 특성을 전 종목에 대해 행렬 연산으로 계산 (features)
+  - meta.json(날짜·종목 목록)을 마지막에 원자적으로 교체해 커밋 — 커밋 전 중단된 행은 다음에 잘라냄
+  - 같은 날짜를 다시 넣으면 그 행만 제자리에서 덮어쓰고, 과거 날짜 백필이나 종목 열 부족(용량 초과)은
+    새 세대 파일로 다시 쓴 뒤 meta 로 교체 (드문 경로)
+
+주의: KRX 다운로드는 시장별 공매도 상위 50 종목만 담으므로, 종목마다 목록에 든 날만 값이 있고
+나머지는 NaN 이다. 특성은 관측된 날 기준이며 관측 일수(obs{N})를 함께 돌려준다.
+
+사용 예)
+  python short_store.py --ingest-all                 # 기존 날짜 폴더 전부 적재
+  python short_store.py --code 096770                # 한 종목 시계열
+  python short_store.py --features --window 40       # 마지막 날 전 종목 특성
+"""
+
+import argparse
+import bisect
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from common import CODE_COL, DATA_ROOT, DATE_DIR_RE, read_typed, yyyymmdd
+from price_cache import CACHE_DIR
+from run_report import REPORT
+
+SHORT_STORE_DIR = os.path.join(CACHE_DIR, "short_store")
+
+# 저장 필드 → KRX CSV 열
+FIELDS = {
+    "short_value": "공매도 거래대금",
+    "value": "거래대금",
+    "ratio": "공매도 비중",
+    "ret": "주가 수익률",
+}
+
+# 첫 생성 시 종목 열 수 (KOSPI+KOSDAQ 전 종목보다 넉넉히), 넘치면 두 배로 다시 씀
+INITIAL_CAPACITY = 4096
+
+DTYPE = np.dtype("<f8")
+
+META = "meta.json"
+
+
+class ShortStore:
+    def __init__(self, path: str = SHORT_STORE_DIR):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self._maps = {}
+        self._load()
+
+    # ----- 메타/파일 -----
+    def _load(self):
+        meta_path = os.path.join(self.path, META)
+        if os.path.exists(meta_path):
+            with open(meta_path, encoding="utf-8") as f:
+                meta = json.load(f)
+        else:
+            meta = {"generation": 0, "capacity": INITIAL_CAPACITY, "dates": [], "codes": []}
+        self.generation = meta["generation"]
+        self.capacity = meta["capacity"]
+        self.dates = meta["dates"]
+        self.codes = meta["codes"]
+        self.day_index = {d: i for i, d in enumerate(self.dates)}
+        self.code_index = {c: j for j, c in enumerate(self.codes)}
+        self._maps = {}
+        # 커밋되지 않은 꼬리 행(기록 중 중단) 잘라내기
+        size = len(self.dates) * self.capacity * DTYPE.itemsize
+        for field in FIELDS:
+            path = self._file(field)
+            if os.path.exists(path) and os.path.getsize(path) > size:
+                with open(path, "r+b") as f:
+                    f.truncate(size)
+
+    def _file(self, field: str, generation: int = None) -> str:
+        gen = self.generation if generation is None else generation
+        return os.path.join(self.path, f"{field}-{gen}.f8")
+
+    def _commit(self, generation: int, capacity: int, dates: list, codes: list):
+        """meta.json 원자적 교체 → 이 시점부터 새 행/세대가 보임"""
+        tmp = os.path.join(self.path, META + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"generation": generation, "capacity": capacity, "dates": dates, "codes": codes}, f)
+        os.replace(tmp, os.path.join(self.path, META))
+        old = self.generation
+        self._load()
+        if generation != old:
+            for field in FIELDS:
+                path = self._file(field, old)
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def _map(self, field: str) -> np.ndarray:
+        """필드 파일 → (일수 × 용량) 읽기 전용 memmap"""
+        if field not in self._maps:
+            if not self.dates:
+                self._maps[field] = np.empty((0, self.capacity), dtype=DTYPE)
+            else:
+                self._maps[field] = np.memmap(self._file(field), dtype=DTYPE, mode="r",
+                                              shape=(len(self.dates), self.capacity))
+        return self._maps[field]
+
+    # ----- 적재 -----
+    def _row(self, df: pd.DataFrame, codes: list, capacity: int) -> np.ndarray:
+        """KRX DataFrame → (필드 수 × 용량) 한 행"""
+        row = np.full((len(FIELDS), capacity), np.nan, dtype=DTYPE)
+        index = {c: j for j, c in enumerate(codes)}
+        cols = np.array([index[c] for c in df[CODE_COL]], dtype="int64")
+        for i, col in enumerate(FIELDS.values()):
+            if col in df.columns:
+                row[i, cols] = pd.to_numeric(df[col], errors="coerce").to_numpy(dtype="float64")
+        return row
+
+    def add_day(self, day: str, df: pd.DataFrame) -> int:
+        """하루치 KRX 목록(종목코드 + FIELDS 열) 저장. 반환: 저장한 종목 수"""
+        return self.add_days({day: df})
+
+    def add_days(self, frames: dict) -> int:
+        """
+        {날짜: KRX 목록} 여러 날을 한 번에 저장. 반환: 저장한 종목 수 합계
+        백필 날짜나 용량 증가가 섞여 있어도 새 세대 다시 쓰기는 한 번만 (날짜마다 다시 쓰지 않음)
+        """
+        frames = {yyyymmdd(d): df.drop_duplicates(subset=[CODE_COL]) for d, df in frames.items()}
+        if not frames:
+            return 0
+        codes = list(self.codes)
+        known = set(codes)
+        for df in frames.values():
+            new = [c for c in dict.fromkeys(df[CODE_COL]) if c not in known]
+            codes += new
+            known.update(new)
+        capacity = self.capacity
+        while len(codes) > capacity:
+            capacity *= 2
+        rows = {d: self._row(df, codes, capacity) for d, df in sorted(frames.items())}
+
+        last = self.dates[-1] if self.dates else ""
+        if capacity != self.capacity or any(d < last and d not in self.day_index for d in rows):
+            self._rewrite(rows, codes, capacity)
+        else:
+            # 같은 날 재수집: 그 행만 덮어씀 / 마지막 날 이후: 이어 붙임 → meta 커밋 한 번
+            again = [d for d in rows if d in self.day_index]
+            append = [d for d in rows if d not in self.day_index]
+            self._maps = {}
+            for i, field in enumerate(FIELDS):
+                if again:
+                    m = np.memmap(self._file(field), dtype=DTYPE, mode="r+", shape=(len(self.dates), self.capacity))
+                    for d in again:
+                        m[self.day_index[d]] = rows[d][i]
+                    m.flush()
+                    del m
+                if append:
+                    with open(self._file(field), "ab") as f:
+                        for d in append:
+                            f.write(rows[d][i].tobytes())
+            self._commit(self.generation, capacity, self.dates + append, codes)
+        n = sum(len(df) for df in frames.values())
+        REPORT.count("short_store.rows", n)
+        return n
+
+    def _rewrite(self, rows: dict, codes: list, capacity: int):
+        """날짜 순서를 유지해 새 세대 파일로 다시 씀 (백필/용량 증가) — rows: {날짜: (필드 수 × 용량) 행}"""
+        dates = sorted(set(self.dates) | set(rows))
+        position = {d: i for i, d in enumerate(dates)}
+        keep = np.array([position[d] for d in self.dates], dtype="int64")
+        new_at = np.array([position[d] for d in rows], dtype="int64")
+        gen = self.generation + 1
+        for i, field in enumerate(FIELDS):
+            old = self._map(field)
+            out = np.memmap(self._file(field, gen), dtype=DTYPE, mode="w+", shape=(len(dates), capacity))
+            out[:] = np.nan
+            if len(keep):
+                out[keep, :self.capacity] = old
+            out[new_at] = np.stack([r[i] for r in rows.values()])
+            out.flush()
+            del out
+        self._maps = {}
+        self._commit(gen, capacity, dates, codes)
+        REPORT.count("short_store.rewrite")
+
+    @staticmethod
+    def _read_folder(folder: str):
+        """날짜 폴더(YYYY-MM-DD)의 kospi.csv / kosdaq.csv → DataFrame (없으면 None)"""
+        frames = [read_typed(os.path.join(folder, f"{m}.csv"), "krx")
+                  for m in ("kospi", "kosdaq") if os.path.exists(os.path.join(folder, f"{m}.csv"))]
+        return pd.concat(frames, ignore_index=True) if frames else None
+
+    def ingest_folder(self, folder: str) -> int:
+        """날짜 폴더(YYYY-MM-DD)의 kospi.csv / kosdaq.csv 적재"""
+        return self.ingest_folders([folder])
+
+    def ingest_folders(self, folders) -> int:
+        """여러 날짜 폴더를 한 번에 적재 (백필: 다시 쓰기 최대 한 번)"""
+        frames = {}
+        for folder in folders:
+            df = self._read_folder(folder)
+            if df is not None:
+                frames[os.path.basename(os.path.normpath(folder))] = df
+        return self.add_days(frames)
+
+    def ingest_all(self, data_root: str = DATA_ROOT) -> int:
+        """data_root 의 날짜 폴더 중 아직 없는 날짜만 적재. 반환: 새로 적재한 날짜 수"""
+        before = len(self.dates)
+        self.ingest_folders([os.path.join(data_root, d) for d in sorted(os.listdir(data_root))
+                             if DATE_DIR_RE.match(d) and yyyymmdd(d) not in self.day_index])
+        return len(self.dates) - before
+
+    # ----- 조회 -----
+    def _until(self, day: str = None) -> int:
+        """day(포함)까지의 행 수"""
+        return len(self.dates) if day is None else bisect.bisect_right(self.dates, yyyymmdd(day))
+
+    def matrix(self, field: str, until: str = None, last: int = None):
+        """(날짜 목록, (일수 × 종목 수) memmap 뷰) — until 이하 최근 last 일"""
+        end = self._until(until)
+        start = 0 if last is None else max(end - last, 0)
+        return self.dates[start:end], self._map(field)[start:end, :len(self.codes)]
+
+    def series(self, code: str, field: str = "ratio", last: int = None) -> pd.Series:
+        """한 종목의 날짜별 값 (목록에 없던 날은 NaN)"""
+        dates, m = self.matrix(field, last=last)
+        j = self.code_index.get(code)
+        values = np.asarray(m[:, j]) if j is not None else np.full(len(dates), np.nan)
+        return pd.Series(values, index=pd.Index(dates, name="일자"), name=FIELDS[field])
+
+    def features(self, day: str = None, window: int = 40) -> pd.DataFrame:
+        """
+        day(기본: 마지막 날) 목록 종목별 특성. 직전 window 일(당일 제외, 관측된 날만) 기준
+          ratio_mean{N} / ratio_std{N} / ratio_z{N} / ratio_increase{N} (당일 비중 ÷ 평균)
+          short_value_increase{N} (당일 공매도 거래대금 ÷ 평균), obs{N} (관측 일수)
+        """
+        end = self._until(day)
+        if end == 0:
+            return pd.DataFrame()
+        start = max(end - 1 - window, 0)
+        n = len(self.codes)
+        ratio = self._map("ratio")[start:end, :n]
+        short_value = self._map("short_value")[start:end, :n]
+        today = ratio[-1]
+        listed = ~np.isnan(today)
+        past, past_value = np.asarray(ratio[:-1, listed]), np.asarray(short_value[:-1, listed])
+        with np.errstate(divide="ignore", invalid="ignore"):
+            obs = (~np.isnan(past)).sum(axis=0)
+            mean = np.where(obs > 0, np.nansum(past, axis=0) / np.maximum(obs, 1), np.nan)
+            var = np.where(obs > 1, np.nansum((past - mean) ** 2, axis=0) / np.maximum(obs - 1, 1), np.nan)
+            std = np.sqrt(var)
+            value_obs = (~np.isnan(past_value)).sum(axis=0)
+            value_mean = np.where(value_obs > 0, np.nansum(past_value, axis=0) / np.maximum(value_obs, 1), np.nan)
+            out = pd.DataFrame({
+                "공매도 비중": today[listed],
+                f"ratio_mean{window}": mean,
+                f"ratio_std{window}": std,
+                f"ratio_z{window}": np.where(std > 0, (today[listed] - mean) / std, np.nan),
+                f"ratio_increase{window}": today[listed] / mean,
+                f"short_value_increase{window}": short_value[-1, :n][listed] / value_mean,
+                f"obs{window}": obs,
+            }, index=pd.Index(np.array(self.codes)[listed], name=CODE_COL))
+        out.attrs["date"] = self.dates[end - 1]
+        return out
+
+
+def main():
+    p = argparse.ArgumentParser(description="공매도 시계열 저장소")
+    p.add_argument("--path", default=SHORT_STORE_DIR)
+    p.add_argument("--data-root", default=DATA_ROOT)
+    p.add_argument("--ingest-all", action="store_true", help="날짜 폴더의 KRX 원본을 모두 적재")
+    p.add_argument("--code", help="한 종목 시계열 출력")
+    p.add_argument("--features", action="store_true", help="전 종목 특성 출력")
+    p.add_argument("--date", help="특성 기준일 (기본: 마지막 날)")
+    p.add_argument("--window", type=int, default=40)
+    args = p.parse_args()
+
+    store = ShortStore(args.path)
+    if args.ingest_all:
+        print(f"[INGEST] 새 날짜 {store.ingest_all(args.data_root)}개")
+    if args.code:
+        print(store.series(args.code.zfill(6)).dropna().to_string())
+    if args.features:
+        feats = store.features(args.date, args.window)
+        print(f"[FEATURES] {feats.attrs.get('date', '-')}")
+        print(feats.sort_values(f"ratio_z{args.window}", ascending=False).head(30).to_string())
+    print(f"[INFO] {args.path}: 날짜 {len(store.dates)}개 ({store.dates[0] if store.dates else '-'}"
+          f" ~ {store.dates[-1] if store.dates else '-'}), 종목 {len(store.codes)}개")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+"""
+사이트용 날짜별 JSON 번들
+
+public/data/{date}/ 의 recommendations / metrics_all / meta 를 하나의 JSON 으로 묶어
+gzip 압축 후 내용 해시를 붙인 파일명(bundle.{hash}.json.gz)으로 저장한다.
+  - 내용이 같으면 파일명도 같으므로 브라우저/CDN 이 영구 캐시해도 된다.
+  - index.json 에 날짜별 {file, hash, rows} 를 기록하고, index.html 은 날짜당 한 번만 받는다.
+  - 압축은 브라우저 DecompressionStream 이 지원하는 gzip 을 쓴다 (brotli 는 미지원).
+"""
+
+import glob
+import gzip
+import hashlib
+import json
+import os
+
+import pandas as pd
+
+from common import CODE_COL
+from snapshot import has_snapshot, read_snapshot
+
+# 2: recommendations 전체 열 포함 (1 은 표 열만 — CSV 다운로드에서 열이 빠짐)
+BUNDLE_VERSION = 2
+BUNDLE_PREFIX = "bundle."
+BUNDLE_SUFFIX = ".json.gz"
+HASH_LEN = 16
+
+
+def _json_value(v):
+    if v is None or v is pd.NA or (isinstance(v, float) and v != v):
+        return None
+    if hasattr(v, "item"):   # numpy 스칼라
+        return v.item()
+    return v
+
+
+def build_bundle(folder: str, run_date: str):
+    """날짜 폴더 → 번들 dict (recommendations 스냅샷이 없으면 None)"""
+    if not has_snapshot(folder, "recommendations"):
+        return None
+    recs = read_snapshot(folder, "recommendations")
+    # recommendations.csv 의 모든 열 (표에 보일 열은 index.html renderTable 이 고르고, CSV 다운로드는 전체 열)
+    cols = list(recs.columns)
+    rows = [[_json_value(v) for v in row] for row in recs[cols].astype(object).itertuples(index=False, name=None)]
+
+    counts = {"recommendations": len(recs)}
+    for name in ("candidates", "metrics_all", "candidates_filtered1"):
+        if has_snapshot(folder, name):
+            counts[name] = len(read_snapshot(folder, name, usecols=[CODE_COL]))
+
+    meta = {"run_date": run_date}
+    meta_path = os.path.join(folder, "meta.json")
+    if os.path.exists(meta_path):
+        with open(meta_path, encoding="utf-8") as f:
+            meta.update(json.load(f))
+    return {"version": BUNDLE_VERSION, "meta": meta, "counts": counts, "columns": cols, "rows": rows}
+
+
+def write_bundle(folder: str, bundle: dict) -> dict:
+    """
+    번들을 gzip(mtime=0 고정 → 같은 내용이면 같은 바이트)으로 저장하고 예전 번들 파일은 삭제.
+    반환: index.json 에 넣을 항목 {"file", "hash", "rows", "bytes"}
+    """
+    raw = json.dumps(bundle, ensure_ascii=False, separators=(",", ":"), sort_keys=True).encode("utf-8")
+    digest = hashlib.sha256(raw).hexdigest()[:HASH_LEN]
+    data = gzip.compress(raw, compresslevel=9, mtime=0)
+    name = f"{BUNDLE_PREFIX}{digest}{BUNDLE_SUFFIX}"
+    path = os.path.join(folder, name)
+    if not os.path.exists(path):
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    for old in glob.glob(os.path.join(folder, f"{BUNDLE_PREFIX}*{BUNDLE_SUFFIX}")):
+        if os.path.basename(old) != name:
+            os.remove(old)
+    return {"file": name, "hash": digest, "rows": len(bundle["rows"]), "bytes": len(data),
+            "version": bundle["version"]}
+
+
+def existing_bundle(folder: str):
+    """날짜 폴더에 이미 있는 현재 버전 번들 파일 → 항목 dict (없거나 예전 버전이면 None)"""
+    found = sorted(glob.glob(os.path.join(folder, f"{BUNDLE_PREFIX}*{BUNDLE_SUFFIX}")))
+    if not found:
+        return None
+    path = found[-1]
+    name = os.path.basename(path)
+    with gzip.open(path, "rb") as f:
+        bundle = json.loads(f.read().decode("utf-8"))
+    if bundle.get("version") != BUNDLE_VERSION:
+        return None
+    return {"file": name, "hash": name[len(BUNDLE_PREFIX):-len(BUNDLE_SUFFIX)], "rows": len(bundle["rows"]),
+            "bytes": os.path.getsize(path), "version": BUNDLE_VERSION}
+
+
+def refresh_bundles(data_root: str, dates, rebuild=(), previous: dict = None) -> dict:
+    """
+    날짜별 번들 항목 갱신.
+    - rebuild 에 있는 날짜(이번 실행 결과)와 번들이 없거나 예전 버전인 날짜는 새로 만들고
+    - 나머지는 예전 index.json 항목(previous) 또는 폴더의 번들 파일을 그대로 사용
+    반환: {date: {"file": "{date}/bundle.{hash}.json.gz", "hash", "rows", "bytes"}}
+    """
+    previous = previous or {}
+    out = {}
+    for d in dates:
+        folder = os.path.join(data_root, d)
+        entry = None
+        if d not in rebuild:
+            prev = previous.get(d)
+            if (prev and prev.get("version") == BUNDLE_VERSION
+                    and os.path.exists(os.path.join(data_root, prev["file"]))):
+                out[d] = prev
+                continue
+            entry = existing_bundle(folder)
+        if entry is None:
+            bundle = build_bundle(folder, d)
+            if bundle is None:
+                continue
+            entry = write_bundle(folder, bundle)
+        entry["file"] = f"{d}/{entry['file']}"
+        out[d] = entry
+    return out
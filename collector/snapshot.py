@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+"""
+스테이지 산출물 스냅샷 (타입 고정 컬럼형 저장)
+
+candidates / metrics_all / candidates_filtered1 / recommendations 를
+public/data/{date}/ 에 고정 스키마로 저장한다.
+  - 종목코드 : 6자리 문자열 (예: 096770 — CSV 재파싱으로 앞자리 0이 사라지는 문제 방지)
+  - 수치     : int64 / float64
+  - market   : category
+스키마 선언과 타입 고정 로더는 common.py (CSV 는 파싱 시점에 타입 고정, 한 번 읽은 파일은 메모에서 재사용).
+Parquet(pyarrow 필요)을 기본 저장 형식으로 쓰고, CSV는 index.html 용 내보내기 본으로 함께 쓴다.
+읽을 때는 Parquet 가 있으면 그것을, 없으면 CSV를 스키마대로 읽는다.
+파일은 임시 파일에 쓴 뒤 os.replace 로 교체해, 중간에 실패해도 반쯤 쓰인 파일이 남지 않는다.
+
+산출물은 날짜 폴더에 한 번만 쓰고, latest/ 에는 하드링크(불가하면 복사)로 게시한다.
+latest/pointer.json 에 산출물별 원본 날짜 폴더를 기록하고, latest 를 읽는 쪽은 이 포인터를 거쳐
+날짜 폴더의 파일을 읽는다 (read_latest).
+"""
+
+import json
+import os
+import shutil
+
+import pandas as pd
+
+from common import SCHEMAS, SNAPSHOT_SCHEMA, apply_schema, memoized, read_typed
+
+try:
+    import pyarrow  # noqa: F401  (Parquet 엔진)
+    HAS_PARQUET = True
+except ImportError:   # 32bit 환경 등 pyarrow 미설치 시 CSV만 사용
+    HAS_PARQUET = False
+
+CSV_ENCODING = "utf-8-sig"
+
+# 산출물 이름 (파일명 stem)
+ARTIFACTS = ("candidates", "metrics_all", "candidates_filtered1", "recommendations")
+
+
+def snapshot_paths(folder: str, name: str):
+    return os.path.join(folder, f"{name}.parquet"), os.path.join(folder, f"{name}.csv")
+
+
+def has_snapshot(folder: str, name: str) -> bool:
+    """folder 에 name 스냅샷(parquet 또는 csv)이 있는지"""
+    return any(os.path.exists(p) for p in snapshot_paths(folder, name))
+
+
+def _replace_atomic(write, path: str):
+    """write(임시경로) 후 path 로 원자적 교체"""
+    tmp = path + ".tmp"
+    try:
+        write(tmp)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def publish_link(src: str, dst: str):
+    """src 를 dst 에 하드링크로 게시 (원자적 교체, 하드링크 불가 시 복사)"""
+    os.makedirs(os.path.dirname(dst) or ".", exist_ok=True)
+
+    def link(tmp):
+        try:
+            os.link(src, tmp)
+        except OSError:   # 다른 드라이브/FAT 등
+            shutil.copy2(src, tmp)
+
+    _replace_atomic(link, dst)
+
+
+def write_snapshot(df: pd.DataFrame, folder: str, name: str) -> pd.DataFrame:
+    """
+    folder/{name}.parquet (+ 내보내기용 {name}.csv) 저장.
+    반환: 스키마가 적용된 DataFrame
+    """
+    os.makedirs(folder, exist_ok=True)
+    typed = apply_schema(df)
+    pq_path, csv_path = snapshot_paths(folder, name)
+    if HAS_PARQUET:
+        _replace_atomic(lambda tmp: typed.to_parquet(tmp, index=False), pq_path)
+    _replace_atomic(lambda tmp: typed.to_csv(tmp, index=False, encoding=CSV_ENCODING), csv_path)
+    return typed
+
+
+def read_snapshot(folder: str, name: str, usecols=None) -> pd.DataFrame:
+    """
+    Parquet 우선, 없으면 CSV 를 스키마대로 읽음 (같은 파일은 프로세스 안에서 한 번만 파싱).
+    usecols 를 주면 그 중 파일에 있는 열만 읽음
+    """
+    pq_path, csv_path = snapshot_paths(folder, name)
+    if HAS_PARQUET and os.path.exists(pq_path):
+        df = memoized(pq_path, "parquet", lambda: pd.read_parquet(pq_path))
+        return df[[c for c in df.columns if c in set(usecols)]] if usecols else df
+    return read_typed(csv_path, SCHEMAS.get(name, SNAPSHOT_SCHEMA), usecols=usecols)
+
+
+# ====== latest 게시 ======
+LATEST_POINTER = "pointer.json"
+
+
+def _read_pointer(latest_dir: str) -> dict:
+    path = os.path.join(latest_dir, LATEST_POINTER)
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def publish_latest(folder: str, name: str, latest_dir: str):
+    """
+    날짜 폴더의 스냅샷 파일을 latest/ 에 하드링크로 게시하고 pointer.json 갱신.
+    pointer.json: {산출물 이름: 날짜 폴더 이름}
+    """
+    os.makedirs(latest_dir, exist_ok=True)
+    for src, dst in zip(snapshot_paths(folder, name), snapshot_paths(latest_dir, name)):
+        if os.path.exists(src):
+            publish_link(src, dst)
+        elif os.path.exists(dst):
+            os.remove(dst)   # 예전 형식 파일이 남아 원본과 어긋나지 않게
+    pointer = _read_pointer(latest_dir)
+    pointer[name] = os.path.basename(os.path.normpath(folder))
+
+    def write_pointer(tmp):
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(pointer, f, ensure_ascii=False, indent=2)
+
+    _replace_atomic(write_pointer, os.path.join(latest_dir, LATEST_POINTER))
+
+
+def resolve_latest(latest_dir: str, name: str) -> str:
+    """latest 의 name 산출물이 실제로 있는 날짜 폴더 (포인터가 없으면 latest 폴더 자체)"""
+    dated = _read_pointer(latest_dir).get(name)
+    if dated:
+        folder = os.path.join(os.path.dirname(os.path.normpath(latest_dir)), dated)
+        if has_snapshot(folder, name):
+            return folder
+    return latest_dir
+
+
+def has_latest(latest_dir: str, name: str) -> bool:
+    return has_snapshot(resolve_latest(latest_dir, name), name)
+
+
+def read_latest(latest_dir: str, name: str) -> pd.DataFrame:
+    """latest 포인터를 거쳐 날짜 폴더의 스냅샷 읽기"""
+    return read_snapshot(resolve_latest(latest_dir, name), name)
+
+
+def write_and_publish(df: pd.DataFrame, folder: str, name: str, latest_dir: str) -> pd.DataFrame:
+    """날짜 폴더에 한 번만 쓰고 latest 에 게시"""
+    typed = write_snapshot(df, folder, name)
+    publish_latest(folder, name, latest_dir)
+    return typed
+
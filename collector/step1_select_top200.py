@@ -4,20 +4,21 @@ import os, time
 import pandas as pd
 from datetime import datetime, timedelta, timezone
 
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-import shutil
+
+from common import DATA_ROOT, read_typed
+from krx_http import LOOKBACK_DAYS, KrxClient
+from run_report import REPORT
+from short_store import ShortStore
+from snapshot import snapshot_paths, write_and_publish
 
 # ===================== 설정 =====================
+# 수집 방식: "http"(기본, 브라우저 없이 KRX 엔드포인트 직접 호출) / "selenium"(Chrome 자동화)
+# http 수집이 실패하면 selenium 으로 한 번 더 시도한다.
+BACKEND = os.environ.get("STEP1_BACKEND", "http")
+
 HEADLESS = False
 START_URL = "https://data.krx.co.kr/contents/MDC/MDI/mdiLoader/index.cmd?menuId=MDC02030204"
 
-# 저장 루트 경로
-DATA_ROOT = r"digger-25-short-reco-site\public\data"
-
 # 다운로드 임시 폴더
 DOWNLOAD_DIR = os.path.join(DATA_ROOT, "downloads")
 os.makedirs(DOWNLOAD_DIR, exist_ok=True)
@@ -40,176 +41,243 @@ KST = timezone(timedelta(hours=9))
 now_kst = lambda: datetime.now(KST)
 
 # ===================== Selenium 드라이버 준비 =====================
-opts = Options()
-if HEADLESS:
-    opts.add_argument("--headless=new")
-prefs = {
-    "download.default_directory": DOWNLOAD_DIR,
-    "download.prompt_for_download": False,
-    "download.directory_upgrade": True,
-    "safebrowsing.enabled": True,
-    "profile.default_content_setting_values.automatic_downloads": 1
-}
-opts.add_experimental_option("prefs", prefs)
-opts.add_experimental_option("excludeSwitches", ["enable-automation", "enable-logging"])
-opts.add_argument("--window-size=1500,1000")
-
-driver = webdriver.Chrome(options=opts)
-driver.set_page_load_timeout(60)
-
-try:
-    # ===================== 페이지 열고 iframe 진입 =====================
-    driver.get(START_URL)
-    time.sleep(1.0)
-
-    # trdDd(기준일 입력박스)가 들어있는 iframe을 찾아 들어감
-    found_iframe = False
-    frames = driver.find_elements(By.TAG_NAME, "iframe")
-    for f in frames:
-        driver.switch_to.default_content()
-        driver.switch_to.frame(f)
-        if driver.find_elements(By.ID, "trdDd"):
-            found_iframe = True
-            break
-    if not found_iframe:
-        driver.switch_to.default_content()
-
-    wait = WebDriverWait(driver, 15)
-
-    # 수집 결과 담을 리스트
-    dfs = []
+def make_driver():
+    """다운로드 폴더가 지정된 Chrome 드라이버 생성"""
+    # selenium 은 이 백엔드를 쓸 때만 import
+    from selenium import webdriver
+    from selenium.webdriver.chrome.options import Options
+
+    opts = Options()
+    if HEADLESS:
+        opts.add_argument("--headless=new")
+    prefs = {
+        "download.default_directory": DOWNLOAD_DIR,
+        "download.prompt_for_download": False,
+        "download.directory_upgrade": True,
+        "safebrowsing.enabled": True,
+        "profile.default_content_setting_values.automatic_downloads": 1
+    }
+    opts.add_experimental_option("prefs", prefs)
+    opts.add_experimental_option("excludeSwitches", ["enable-automation", "enable-logging"])
+    opts.add_argument("--window-size=1500,1000")
+
+    driver = webdriver.Chrome(options=opts)
+    driver.set_page_load_timeout(60)
+    return driver
+
+# ===================== 수집 (HTTP) =====================
+def collect_http(base_date: datetime = None, lookback: int = LOOKBACK_DAYS):
+    """
+    KRX 다운로드 엔드포인트에서 KOSPI/KOSDAQ CSV를 동시에 받아 합친 DataFrame과 기준일(YYYY-MM-DD) 반환.
+    base_date(기본: 오늘 KST)부터 최대 lookback 일 거슬러 올라가 데이터가 있는 첫 거래일을 사용.
+    (lookback=0 이면 base_date 당일만 — 휴장일이면 KrxNoDataError)
+    원본 kospi.csv / kosdaq.csv 는 기준일 폴더에 그대로 저장.
+    """
+    with KrxClient() as client:
+        trd_dd, results = client.fetch_latest(base_date or now_kst(), lookback)
+    source_date_iso = f"{trd_dd[:4]}-{trd_dd[4:6]}-{trd_dd[6:]}"
 
-    # ===================== KOSPI 수집 =====================
-    # 조회 버튼 클릭 → 표 뜰 때까지 대기
-    search_btn = wait.until(EC.element_to_be_clickable((By.XPATH, SEARCH_BTN_XPATH)))
-    driver.execute_script("arguments[0].click();", search_btn)
-    WebDriverWait(driver, 15).until(EC.presence_of_element_located((By.CSS_SELECTOR, ROW_SELECTOR)))
-
-    # 다운로드 직전 디렉토리 스냅샷
-    before = set(os.listdir(DOWNLOAD_DIR))
-
-    # 다운로드 버튼 클릭
-    dl_btn = WebDriverWait(driver, 10).until(EC.element_to_be_clickable((By.XPATH, DOWNLOAD_BTN_XPATH)))
-    driver.execute_script("arguments[0].click();", dl_btn)
-
-    # 팝업 내 KOSPI CSV 버튼 클릭
-    kospi_csv_btn = WebDriverWait(driver, 10).until(EC.element_to_be_clickable((By.XPATH, CSV_BTN_XPATH["KOSPI"])))
-    driver.execute_script("arguments[0].click();", kospi_csv_btn)
-
-    # 새 파일이 생길 때까지 대기 → .crdownload 끝날 때까지 대기 → 파일명 고정
-    timeout = time.time() + 40
-    kospi_save_name = "kospi.csv"
-    kospi_dst_path = os.path.join(DOWNLOAD_DIR, kospi_save_name)
-    while True:
-        after = set(os.listdir(DOWNLOAD_DIR))
-        new_files = list(after - before)
-        if new_files:
-            candidate = new_files[0]
-            if candidate.endswith(".crdownload"):
-                if time.time() > timeout:
-                    raise RuntimeError("KOSPI CSV 다운로드 타임아웃(.crdownload 유지)")
-                time.sleep(0.5)
-                continue
-            src_path = os.path.join(DOWNLOAD_DIR, candidate)
-            # 기존 동일 파일 있으면 교체
-            if os.path.exists(kospi_dst_path):
-                os.remove(kospi_dst_path)
-            os.rename(src_path, kospi_dst_path)
-            break
-        if time.time() > timeout:
-            raise RuntimeError("KOSPI CSV 다운로드 실패(새 파일 미발견)")
-        time.sleep(0.5)
-
-    # CSV 읽기
-    kospi_df = pd.read_csv(kospi_dst_path, encoding="euc-kr")
-    kospi_df["market"] = "KOSPI"
-    dfs.append(kospi_df)
-
-    # ===================== KOSDAQ 수집 =====================
-    # 코스닥 버튼 클릭
-    kosdaq_btn = WebDriverWait(driver, 10).until(EC.element_to_be_clickable((By.XPATH, KOSDAQ_BTN_XPATH)))
-    driver.execute_script("arguments[0].click();", kosdaq_btn)
-
-    # 조회 버튼 클릭 → 표 뜰 때까지 대기
-    search_btn = wait.until(EC.element_to_be_clickable((By.XPATH, SEARCH_BTN_XPATH)))
-    driver.execute_script("arguments[0].click();", search_btn)
-    WebDriverWait(driver, 15).until(EC.presence_of_element_located((By.CSS_SELECTOR, ROW_SELECTOR)))
-
-    # 다운로드 직전 디렉토리 스냅샷
-    before = set(os.listdir(DOWNLOAD_DIR))
-
-    # 다운로드 버튼 클릭
-    dl_btn = WebDriverWait(driver, 10).until(EC.element_to_be_clickable((By.XPATH, DOWNLOAD_BTN_XPATH)))
-    driver.execute_script("arguments[0].click();", dl_btn)
-
-    # 팝업 내 KOSDAQ CSV 버튼 클릭
-    kosdaq_csv_btn = WebDriverWait(driver, 10).until(EC.element_to_be_clickable((By.XPATH, CSV_BTN_XPATH["KOSDAQ"])))
-    driver.execute_script("arguments[0].click();", kosdaq_csv_btn)
-
-    # 새 파일 → .crdownload 종료 → 파일명 고정
-    timeout = time.time() + 40
-    kosdaq_save_name = "kosdaq.csv"
-    kosdaq_dst_path = os.path.join(DOWNLOAD_DIR, kosdaq_save_name)
-    while True:
-        after = set(os.listdir(DOWNLOAD_DIR))
-        new_files = list(after - before)
-        if new_files:
-            candidate = new_files[0]
-            if candidate.endswith(".crdownload"):
-                if time.time() > timeout:
-                    raise RuntimeError("KOSDAQ CSV 다운로드 타임아웃(.crdownload 유지)")
-                time.sleep(0.5)
-                continue
-            src_path = os.path.join(DOWNLOAD_DIR, candidate)
-            if os.path.exists(kosdaq_dst_path):
-                os.remove(kosdaq_dst_path)
-            os.rename(src_path, kosdaq_dst_path)
-            break
-        if time.time() > timeout:
-            raise RuntimeError("KOSDAQ CSV 다운로드 실패(새 파일 미발견)")
-        time.sleep(0.5)
-
-    # CSV 읽기
-    kosdaq_df = pd.read_csv(kosdaq_dst_path, encoding="euc-kr")
-    kosdaq_df["market"] = "KOSDAQ"
-    dfs.append(kosdaq_df)
-
-    # ===================== 합치고 저장 =====================
-    combined = pd.concat(dfs, ignore_index=True)
+    save_dir = os.path.join(DATA_ROOT, source_date_iso)
+    os.makedirs(save_dir, exist_ok=True)
 
-    # 현재 선택된 기준일
-    latest = driver.execute_script("return document.getElementById('trdDd').value;")
-    source_date_iso = f"{latest[:4]}-{latest[4:6]}-{latest[6:]}"
+    dfs = []
+    for market, (raw, df) in results.items():
+        with open(os.path.join(save_dir, f"{market.lower()}.csv"), "wb") as f:
+            f.write(raw)
+        df = df.copy()
+        df["market"] = market
+        dfs.append(df)
+    combined = pd.concat(dfs, ignore_index=True)
 
     print(f"[OK] 기준일: {source_date_iso}, rows: {len(combined)}")
-
+    return combined, source_date_iso
+
+# ===================== 수집 (Selenium) =====================
+def collect_selenium():
+    """
+    KRX 페이지에서 KOSPI/KOSDAQ CSV를 내려받아 합친 DataFrame과 기준일(YYYY-MM-DD) 반환.
+    원본 kospi.csv / kosdaq.csv 는 기준일 폴더로 옮겨 둔다.
+    """
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support.ui import WebDriverWait
+    from selenium.webdriver.support import expected_conditions as EC
+
+    driver = make_driver()
+    try:
+        # ===================== 페이지 열고 iframe 진입 =====================
+        driver.get(START_URL)
+        time.sleep(1.0)
+
+        # trdDd(기준일 입력박스)가 들어있는 iframe을 찾아 들어감
+        found_iframe = False
+        frames = driver.find_elements(By.TAG_NAME, "iframe")
+        for f in frames:
+            driver.switch_to.default_content()
+            driver.switch_to.frame(f)
+            if driver.find_elements(By.ID, "trdDd"):
+                found_iframe = True
+                break
+        if not found_iframe:
+            driver.switch_to.default_content()
+
+        wait = WebDriverWait(driver, 15)
+
+        # 수집 결과 담을 리스트
+        dfs = []
+
+        # ===================== KOSPI 수집 =====================
+        # 조회 버튼 클릭 → 표 뜰 때까지 대기
+        search_btn = wait.until(EC.element_to_be_clickable((By.XPATH, SEARCH_BTN_XPATH)))
+        driver.execute_script("arguments[0].click();", search_btn)
+        WebDriverWait(driver, 15).until(EC.presence_of_element_located((By.CSS_SELECTOR, ROW_SELECTOR)))
+
+        # 다운로드 직전 디렉토리 스냅샷
+        before = set(os.listdir(DOWNLOAD_DIR))
+
+        # 다운로드 버튼 클릭
+        dl_btn = WebDriverWait(driver, 10).until(EC.element_to_be_clickable((By.XPATH, DOWNLOAD_BTN_XPATH)))
+        driver.execute_script("arguments[0].click();", dl_btn)
+
+        # 팝업 내 KOSPI CSV 버튼 클릭
+        kospi_csv_btn = WebDriverWait(driver, 10).until(EC.element_to_be_clickable((By.XPATH, CSV_BTN_XPATH["KOSPI"])))
+        driver.execute_script("arguments[0].click();", kospi_csv_btn)
+
+        # 새 파일이 생길 때까지 대기 → .crdownload 끝날 때까지 대기 → 파일명 고정
+        timeout = time.time() + 40
+        kospi_save_name = "kospi.csv"
+        kospi_dst_path = os.path.join(DOWNLOAD_DIR, kospi_save_name)
+        while True:
+            after = set(os.listdir(DOWNLOAD_DIR))
+            new_files = list(after - before)
+            if new_files:
+                candidate = new_files[0]
+                if candidate.endswith(".crdownload"):
+                    if time.time() > timeout:
+                        raise RuntimeError("KOSPI CSV 다운로드 타임아웃(.crdownload 유지)")
+                    time.sleep(0.5)
+                    continue
+                src_path = os.path.join(DOWNLOAD_DIR, candidate)
+                # 기존 동일 파일 있으면 교체
+                if os.path.exists(kospi_dst_path):
+                    os.remove(kospi_dst_path)
+                os.rename(src_path, kospi_dst_path)
+                break
+            if time.time() > timeout:
+                raise RuntimeError("KOSPI CSV 다운로드 실패(새 파일 미발견)")
+            time.sleep(0.5)
+
+        # CSV 읽기
+        kospi_df = read_typed(kospi_dst_path, "krx")
+        kospi_df["market"] = "KOSPI"
+        dfs.append(kospi_df)
+
+        # ===================== KOSDAQ 수집 =====================
+        # 코스닥 버튼 클릭
+        kosdaq_btn = WebDriverWait(driver, 10).until(EC.element_to_be_clickable((By.XPATH, KOSDAQ_BTN_XPATH)))
+        driver.execute_script("arguments[0].click();", kosdaq_btn)
+
+        # 조회 버튼 클릭 → 표 뜰 때까지 대기
+        search_btn = wait.until(EC.element_to_be_clickable((By.XPATH, SEARCH_BTN_XPATH)))
+        driver.execute_script("arguments[0].click();", search_btn)
+        WebDriverWait(driver, 15).until(EC.presence_of_element_located((By.CSS_SELECTOR, ROW_SELECTOR)))
+
+        # 다운로드 직전 디렉토리 스냅샷
+        before = set(os.listdir(DOWNLOAD_DIR))
+
+        # 다운로드 버튼 클릭
+        dl_btn = WebDriverWait(driver, 10).until(EC.element_to_be_clickable((By.XPATH, DOWNLOAD_BTN_XPATH)))
+        driver.execute_script("arguments[0].click();", dl_btn)
+
+        # 팝업 내 KOSDAQ CSV 버튼 클릭
+        kosdaq_csv_btn = WebDriverWait(driver, 10).until(EC.element_to_be_clickable((By.XPATH, CSV_BTN_XPATH["KOSDAQ"])))
+        driver.execute_script("arguments[0].click();", kosdaq_csv_btn)
+
+        # 새 파일 → .crdownload 종료 → 파일명 고정
+        timeout = time.time() + 40
+        kosdaq_save_name = "kosdaq.csv"
+        kosdaq_dst_path = os.path.join(DOWNLOAD_DIR, kosdaq_save_name)
+        while True:
+            after = set(os.listdir(DOWNLOAD_DIR))
+            new_files = list(after - before)
+            if new_files:
+                candidate = new_files[0]
+                if candidate.endswith(".crdownload"):
+                    if time.time() > timeout:
+                        raise RuntimeError("KOSDAQ CSV 다운로드 타임아웃(.crdownload 유지)")
+                    time.sleep(0.5)
+                    continue
+                src_path = os.path.join(DOWNLOAD_DIR, candidate)
+                if os.path.exists(kosdaq_dst_path):
+                    os.remove(kosdaq_dst_path)
+                os.rename(src_path, kosdaq_dst_path)
+                break
+            if time.time() > timeout:
+                raise RuntimeError("KOSDAQ CSV 다운로드 실패(새 파일 미발견)")
+            time.sleep(0.5)
+
+        # CSV 읽기
+        kosdaq_df = read_typed(kosdaq_dst_path, "krx")
+        kosdaq_df["market"] = "KOSDAQ"
+        dfs.append(kosdaq_df)
+
+        # ===================== 합치기 =====================
+        combined = pd.concat(dfs, ignore_index=True)
+
+        # 현재 선택된 기준일
+        latest = driver.execute_script("return document.getElementById('trdDd').value;")
+        source_date_iso = f"{latest[:4]}-{latest[4:6]}-{latest[6:]}"
+
+        print(f"[OK] 기준일: {source_date_iso}, rows: {len(combined)}")
+
+        save_dir = os.path.join(DATA_ROOT, source_date_iso)
+        os.makedirs(save_dir, exist_ok=True)
+
+        # 개별 파일 이동(덮어쓰기)
+        final_kospi = os.path.join(save_dir, "kospi.csv")
+        final_kosdaq = os.path.join(save_dir, "kosdaq.csv")
+        if os.path.exists(final_kospi):
+            os.remove(final_kospi)
+        if os.path.exists(final_kosdaq):
+            os.remove(final_kosdaq)
+        os.replace(os.path.join(DOWNLOAD_DIR, "kospi.csv"),  final_kospi)
+        os.replace(os.path.join(DOWNLOAD_DIR, "kosdaq.csv"), final_kosdaq)
+
+        return combined, source_date_iso
+    finally:
+        driver.quit()
+
+def collect(base_date: datetime = None):
+    """BACKEND 설정에 따라 수집 (http 실패 시 selenium 폴백)"""
+    if BACKEND == "selenium":
+        return collect_selenium()
+    try:
+        return collect_http(base_date)
+    except Exception as e:
+        print(f"[WARN] KRX HTTP 수집 실패 → Selenium 으로 재시도: {e}")
+        REPORT.count("step1.selenium_fallback")
+        return collect_selenium()
+
+# ===================== 저장 =====================
+def save(combined: pd.DataFrame, source_date_iso: str):
+    """candidates 스냅샷(parquet + csv)을 기준일 폴더에 한 번 저장하고 latest 에 게시(하드링크)"""
     save_dir = os.path.join(DATA_ROOT, source_date_iso)
-    os.makedirs(save_dir, exist_ok=True)
-
-    # 개별 파일 이동(덮어쓰기)
-    final_kospi = os.path.join(save_dir, "kospi.csv")
-    final_kosdaq = os.path.join(save_dir, "kosdaq.csv")
-    if os.path.exists(final_kospi):
-        os.remove(final_kospi)
-    if os.path.exists(final_kosdaq):
-        os.remove(final_kosdaq)
-    os.replace(os.path.join(DOWNLOAD_DIR, "kospi.csv"),  final_kospi)
-    os.replace(os.path.join(DOWNLOAD_DIR, "kosdaq.csv"), final_kosdaq)
-
-    # 합친 파일 저장
-    combined_path = os.path.join(save_dir, "candidates.csv")
-    combined.to_csv(combined_path, index=False, encoding="utf-8-sig")
-    print(f"[SAVED] {combined_path}")
-
-    # === latest 폴더에도 동일 파일 복사 ===
     latest_dir = os.path.join(DATA_ROOT, "latest")
-    os.makedirs(latest_dir, exist_ok=True)
-    latest_path = os.path.join(latest_dir, "candidates.csv")
-    # 기존 파일 있으면 덮어쓰기
-    if os.path.exists(latest_path):
-        os.remove(latest_path)
-    shutil.copy2(combined_path, latest_path)
-    print(f"[SAVED] {latest_path}")
-
-finally:
-    driver.quit()
+
+    # 합친 파일 저장 (종목코드 6자리 문자열 등 스키마 적용)
+    write_and_publish(combined, save_dir, "candidates", latest_dir)
+    for p in snapshot_paths(save_dir, "candidates"):
+        if os.path.exists(p):
+            print(f"[SAVED] {p} (latest 게시)")
+
+    # 원본 kospi.csv / kosdaq.csv → 종목 × 거래일 공매도 시계열 (실패해도 후보 저장은 유지)
+    try:
+        ShortStore().ingest_folder(save_dir)
+    except Exception as e:
+        print(f"[WARN] 공매도 시계열 저장 실패: {e}")
+
+def main():
+    combined, source_date_iso = collect()
+    save(combined, source_date_iso)
+
+if __name__ == "__main__":
+    main()
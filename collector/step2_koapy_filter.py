@@ -2,33 +2,18 @@
 
 import os
 import pandas as pd
-from koapy import KiwoomOpenApiPlusEntrypoint
 
-# ====== 로그인 정보 ======
-credentials = {
-    'user_id': os.getenv('KIWOOM_ID'),
-    'user_password': os.getenv('KIWOOM_PW'),
-    'cert_password': os.getenv('KIWOOM_CERT_PW'),
-    'is_simulation': True,
-    'account_passwords': { os.getenv('KIWOOM_ACCT','0000000000'): os.getenv('KIWOOM_ACCT_PW') }
-}
+from common import credentials, get_date_arg, typed_codes
+from indicator_state import IndicatorState
+from indicators import batch_indicators, parse_price_column
+from price_cache import DailyBarCache
+from run_report import REPORT
+from screen import chart_windows, load_screen, mask, tier
+from snapshot import read_latest, write_and_publish
+from tr_scheduler import EmptyResponseError, TRScheduler, rank_priorities
 
 # ====== 기준 날짜(데이터 보관 폴더명) ======
-
-# 공통: --date 또는 환경변수 PIPELINE_DATE 받기
-import argparse, os
-from datetime import datetime
-
-def get_date_arg() -> str:
-    p = argparse.ArgumentParser(add_help=False)
-    p.add_argument("--date", help="YYYY-MM-DD", default=None)
-    args, _ = p.parse_known_args()
-    date = args.date or os.environ.get("PIPELINE_DATE")
-    if not date:
-        # 기본: 오늘 날짜
-        date = datetime.now().strftime("%Y-%m-%d")
-    return date
-
+# 로그인 정보(credentials)와 --date / PIPELINE_DATE 처리는 common.py
 date = get_date_arg()
 
 # ====== 경로 & 임계값 ======
@@ -41,9 +26,9 @@ DATA_DIR = os.path.join(
 os.makedirs(DATA_DIR, exist_ok=True)
 
 # 입력/출력 경로
-CAND_PATH = os.path.join(BASE_DIR, "candidates.csv")  # latest의 후보군 입력
+CAND_PATH = os.path.join(BASE_DIR, "candidates.csv")  # latest의 후보군 입력 (pointer.json 경유)
 
-# 1) Step1 전체 + 계산열
+# 1) Step1 전체 + 계산열 (dated 에 한 번 저장, latest 는 하드링크 게시)
 OUT_ALL          = os.path.join(BASE_DIR, "metrics_all.csv")        # latest
 METRICS_ALL_DATA = os.path.join(DATA_DIR, "metrics_all.csv")        # dated
 
@@ -51,31 +36,34 @@ METRICS_ALL_DATA = os.path.join(DATA_DIR, "metrics_all.csv")        # dated
 OUT_FINAL = os.path.join(BASE_DIR, "candidates_filtered1.csv")           # latest
 OUT_DATA  = os.path.join(DATA_DIR, "candidates_filtered1.csv")           # dated
 
-# 임계값
-TH_SHORT_RATIO = 2.5
-TH_RET14       = 20.0
-TH_RSI         = 70.0
+# 스크린 규칙 (기본: 공매도 비중 ≥ 2.5, ret14_pct ≥ 20, rsi14 ≥ 70 / 투자자 규칙은 step3)
+# 바꾸려면 screen.py 의 DEFAULT_SCREEN 또는 JSON 파일(main.py --screen / SCREEN_FILE)
+SCREEN = load_screen()
+
+# 지표 계산 기간 (14는 필수: ret14_pct / rsi14 열 생성, 추가 기간은 ret{n}_pct / rsi{n} 열로 저장)
+INDICATOR_WINDOWS = (14,)
 
-# ----- Step1: 공매도 압력 필터 -----
-def filter_by_short_pressure(df: pd.DataFrame) -> pd.DataFrame:
+# 일봉 로컬 캐시 사용 여부 (False면 매번 전체 이력 요청)
+USE_PRICE_CACHE = True
+
+# 지표 상태 저장소 사용 여부 (False면 매번 일봉 전체로 재계산)
+# 검증: 환경변수 VERIFY_INDICATOR_STATE=1 이면 전체 재계산과 비교 (indicator_state.py)
+USE_INDICATOR_STATE = True
+
+# ----- Step1: 공매도 압력 필터 (스크린의 열 규칙 전체를 키움 조회 전에 한 번에 적용) -----
+def filter_by_short_pressure(df: pd.DataFrame, rules=None) -> pd.DataFrame:
     need = ["종목코드","공매도 비중","공매도 거래대금 증가배율","공매도 비중 증가배율"]
     missing = [c for c in need if c not in df.columns]
     if missing:
         raise KeyError(f"필수 컬럼 없음: {missing}")
 
-    mask = (pd.to_numeric(df["공매도 비중"], errors="coerce") >= TH_SHORT_RATIO)
-    out = df.loc[mask].copy()
-    out["종목코드"] = out["종목코드"].astype(str).str.zfill(6)
-    out.reset_index(drop=True, inplace=True)
-    return out
+    keep = mask(df, tier(SCREEN if rules is None else rules, "column"))
+    return df.loc[keep].reset_index(drop=True)
 
 # ----- Step2: 일봉 → 14일 수익률 & RSI(14) -----
 def calc_ret14_and_rsi_from_chart(chart_data: pd.DataFrame):
     # KOApy 일봉이 최신→과거 순서라고 가정
-    prices_desc = pd.to_numeric(
-        chart_data["현재가"].astype(str).str.replace(",", ""),
-        errors="coerce"
-    ).dropna().reset_index(drop=True)
+    prices_desc = parse_price_column(chart_data["현재가"]).dropna().reset_index(drop=True)
 
     if len(prices_desc) < 14:
         return None, None, None  # ret, rsi, rsi_series
@@ -85,100 +73,172 @@ def calc_ret14_and_rsi_from_chart(chart_data: pd.DataFrame):
     close_14ago = prices_desc.iloc[13]
     ret14_pct = None if close_14ago == 0 else (close_today / close_14ago - 1.0) * 100.0
 
-    # RSI(14): 오름차순으로 계산 후 다시 내림차순으로 맞춤
-    prices_asc = prices_desc.iloc[::-1].reset_index(drop=True)
-    delta = prices_asc.diff()
+    # RSI(14): 최신→과거 순서 그대로 — i 행의 변화량은 (i 종가 - i+1 종가),
+    # 이후 14일 창(i..i+13)의 평균은 역방향 rolling 을 위로 13칸 당겨서 얻음 (뒤집기 없음)
+    delta = prices_desc.diff(-1)
     gain = delta.clip(lower=0.0)
     loss = (-delta).clip(lower=0.0)
-    avg_gain = gain.rolling(window=14, min_periods=14).mean()
-    avg_loss = loss.rolling(window=14, min_periods=14).mean()
+    avg_gain = gain.rolling(window=14, min_periods=14).mean().shift(-13)
+    avg_loss = loss.rolling(window=14, min_periods=14).mean().shift(-13)
     rs = avg_gain / avg_loss
-    rsi_asc = 100.0 - (100.0 / (1.0 + rs))
-    rsi_desc = rsi_asc.iloc[::-1].reset_index(drop=True)  # chart_data 정렬(최신→과거)에 맞춤
+    rsi_desc = 100.0 - (100.0 / (1.0 + rs))
     rsi14_latest = float(rsi_desc.iloc[0]) if pd.notna(rsi_desc.iloc[0]) else None
 
     return (float(ret14_pct) if ret14_pct is not None else None), rsi14_latest, rsi_desc
 
-def main():
-    # 후보군 로드 (scraper가 UTF-8-SIG로 저장했다고 가정)
-    df = pd.read_csv(CAND_PATH, encoding="utf-8-sig")
+def run(df: pd.DataFrame, ep, progress=None, until: str = None, queue=None):
+    """
+    후보군 DataFrame → (metrics_df, df_filtered1)
+    로그인된 엔트리포인트(ep)를 받아 계산만 수행 (파일 저장 없음).
+    계산 결과가 없으면 (None, None)
+    progress(checkpoint.StageProgress)를 주면 일봉 캐시에 저장 완료된 종목을 기록하고,
+    이미 기록된 종목은 키움 조회 없이 캐시에서 바로 읽는다.
+    until(YYYYMMDD)을 주면 그 날짜까지의 일봉으로 계산 (과거 날짜 백필)
+    queue(work_queue.RunQueue)를 주면 일봉 조회는 워커 프로세스에 맡기고 완료된 종목을 캐시에서 읽음.
+    """
     if "종목코드" not in df.columns:
         raise KeyError("CSV에 '종목코드' 컬럼이 없습니다.")
-    df["종목코드"] = df["종목코드"].astype(str).str.zfill(6)
+    # 로더/스냅샷으로 읽은 후보군은 종목코드가 이미 6자리 문자열 (숫자로 들어온 경우만 정규화)
+    df = typed_codes(df)
 
     # Step1
     df_step1 = filter_by_short_pressure(df)
-    print(f"[Step1] 원본 {len(df)}개 → 공매도 압력 통과 {len(df_step1)}개")
+    print(f"[Step1] 원본 {len(df)}개 → 공매도 압력(열 규칙) 통과 {len(df_step1)}개")
+    REPORT.rows("screen.column", len(df), len(df_step1))
     if len(df_step1) == 0:
         print("[종료] 공매도 조건 통과 종목이 없습니다.")
-        return
+        return None, None
 
-    # Step2: ret14 / rsi 계산
-    metrics_rows = []  # Step1 전체에 대한 계산치
-    with KiwoomOpenApiPlusEntrypoint() as ep:
-        ep.EnsureConnected(credentials)
+    # Step2: 일봉 수집(스케줄러로 TR 파이프라이닝) → ret14 / rsi 일괄 계산
+    cache = DailyBarCache() if USE_PRICE_CACHE or queue is not None else None
 
-        total2 = len(df_step1)
-        done2  = 0
-
-        for _, row in df_step1.iterrows():
-            code = row["종목코드"]
-            try:
-                chart = ep.GetDailyStockDataAsDataFrame(code)
-                if chart is None or len(chart) < 14:
-                    print(f"[{code}] 일봉 데이터 부족 → 건너뜀")
-                    done2 += 1
-                    continue
-
-                chart = chart.copy()
-                chart["현재가_num"] = pd.to_numeric(
-                    chart["현재가"].astype(str).str.replace(",", ""),
-                    errors="coerce"
-                )
-
-                ret14, rsi14, _ = calc_ret14_and_rsi_from_chart(chart)
-
-                m = row.copy()  # 기존 candidates 정보 보존
-                m["ret14_pct"] = ret14
-                m["rsi14"]     = rsi14
-                metrics_rows.append(m)
-
-                if ret14 is not None and rsi14 is not None:
-                    print(f"[{code}] 14일 수익률: {ret14:.2f}% | RSI(14): {rsi14:.2f}")
-                else:
-                    print(f"[{code}] 계산 불가 (데이터 부족/NaN)")
+    # 스크린의 chart 규칙이 쓰는 기간(ret20_pct → 20)도 함께 계산
+    windows = tuple(sorted(set(INDICATOR_WINDOWS) | chart_windows(SCREEN)))
+    limit = max(windows) + 1
 
-            except Exception as e:
-                print(f"[WARN] Step2 오류 ({code}): {e}")
+    # 지표 상태 저장소: 캐시에서 종목별 저장된 마지막 봉 이후만 읽음 (보통 새 봉 1개 + 이어짐 확인용 1개)
+    state = IndicatorState(windows) if USE_INDICATOR_STATE else None
+    since = state.last_days(df_step1["종목코드"]) if state is not None and cache is not None else {}
 
-            done2 += 1
-            if done2 % 5 == 0 or done2 == total2:
-                print(f"[Step2] 진행: {done2}/{total2}")
+    def full_chart(code):
+        return cache.load(code, limit=limit, until=until)
 
-    # --- 저장 파트 ---
-    if not metrics_rows:
-        print("[WARN] metrics_rows 비어있음: Step2 계산 결과가 없습니다.")
-        return
+    def since_or_full(code, chart):
+        # 기준일이 저장 상태보다 과거(백필)면 since 구간이 비므로 전체 구간
+        return full_chart(code) if code in since and len(chart) == 0 else chart
 
-    metrics_df = pd.DataFrame(metrics_rows)
+    def fetch_chart(code):
+        if cache is not None:
+            chart = since_or_full(code, cache.fetch(ep, code, limit=limit, until=until, since=since.get(code)))
+        else:
+            with REPORT.timed("tr.opt10081"):
+                if until:
+                    chart = ep.GetDailyStockDataAsDataFrame(code, start_date=until)
+                else:
+                    chart = ep.GetDailyStockDataAsDataFrame(code)
+        # 빈 응답은 일시 장애로 보고 스케줄러가 재시도
+        if chart is None or len(chart) == 0:
+            raise EmptyResponseError(f"{code} 일봉 응답 없음")
+        return chart
+
+    def load_chart(code):
+        chart = since_or_full(code, cache.load(code, limit=limit, until=until, since=since.get(code)))
+        if len(chart) == 0:
+            raise EmptyResponseError(f"{code} 일봉 캐시 없음")
+        return chart
+
+    def mark_done(code, chart, e):
+        if e is None and progress is not None:
+            progress.mark(code)
+
+    # 체크포인트에 완료 기록된 종목은 캐시에서 바로 읽음 (캐시 미사용 시 재조회)
+    resume = progress if cache is not None else None
+    done_mask = df_step1["종목코드"].map(resume.done) if resume is not None else pd.Series(False, index=df_step1.index)
+    fetched = {code: load_chart(code) for code in df_step1.loc[done_mask, "종목코드"]}
+    df_todo = df_step1.loc[~done_mask]
+    if fetched:
+        print(f"[Step2] 체크포인트 재사용 {len(fetched)}개 / 조회 {len(df_todo)}개")
+
+    if queue is not None:
+        # 작업 큐: 워커가 일봉 캐시를 채운 종목부터 여기서 캐시로 읽음
+        scheduler, fetch = queue.scheduler("chart", {"until": until}, label="Step2"), load_chart
+    else:
+        # 재시도/2차 시도 후에도 실패한 종목만 failed (차단기가 열리면 재로그인 시도)
+        scheduler = TRScheduler(label="Step2", reconnect=lambda: ep.EnsureConnected(credentials))
+        fetch = fetch_chart
+    results, failed = scheduler.map(fetch, df_todo["종목코드"], priorities=rank_priorities(df_todo),
+                                    on_result=mark_done if resume is not None else None)
+    fetched.update(results)
+
+    for code, e in failed.items():
+        print(f"[WARN] Step2 오류 ({code}): {e}")
+
+    charts = {}  # {종목코드: 일봉 DataFrame} (since 종목은 저장된 마지막 봉 이후만)
+    for code, chart in fetched.items():
+        if chart is None or (len(chart) < 14 and code not in since) or len(chart) == 0:
+            print(f"[{code}] 일봉 데이터 부족 → 건너뜀")
+        else:
+            charts[code] = chart
+
+    if not charts:
+        print("[WARN] metrics_rows 비어있음: Step2 계산 결과가 없습니다.")
+        return None, None
+
+    # 전 종목을 (종목 × 일자) 행렬로 쌓아 한 번에 계산
+    # 지표 상태 저장소가 있으면 지난 실행 상태에서 새 봉만큼만 전진 (이어지지 않는 종목만 전체 구간으로 재계산)
+    if state is not None:
+        ind, stale = state.advance({c: ch for c, ch in charts.items() if c in since}, loader=full_chart)
+        rebuild = {}
+        for code in [c for c in charts if c not in since] + stale:
+            chart = full_chart(code) if code in since else charts[code]
+            if len(chart) < 14:
+                print(f"[{code}] 일봉 데이터 부족 → 건너뜀")
+            else:
+                rebuild[code] = chart
+        if rebuild:
+            ind = pd.concat([ind, state.update(rebuild)]) if len(ind) else state.update(rebuild)
+        REPORT.count("step2.indicator_rebuild", len(rebuild))
+        state.save()
+    else:
+        ind = batch_indicators(charts, windows=windows)
+    metrics_df = df_step1.loc[df_step1["종목코드"].isin(ind.index)].reset_index(drop=True)
+    metrics_df = metrics_df.join(ind, on="종목코드")
+
+    n_ok = int((metrics_df["ret14_pct"].notna() & metrics_df["rsi14"].notna()).sum())
+    print(f"[Step2] 지표 계산 {len(metrics_df)}개 (계산 불가 {len(metrics_df) - n_ok}개)")
+
+    # 필터링된 종목 (스크린 chart 규칙 — 기본: ret14_pct ≥ 20 and rsi14 ≥ 70)
+    cond = mask(metrics_df, tier(SCREEN, "chart"))
+    df_reco = metrics_df.loc[cond].reset_index(drop=True)
+    REPORT.rows("step2.indicators", len(df_step1), len(metrics_df))
+    REPORT.rows("screen.chart", len(metrics_df), len(df_reco))
+    return metrics_df, df_reco
 
+def save(metrics_df: pd.DataFrame, df_reco: pd.DataFrame):
     # 1) metrics_all.csv : Step1 전체 + 계산열(ret14_pct, rsi14) + 기존 candidates 정보
-    metrics_df.to_csv(OUT_ALL,          index=False, encoding="utf-8-sig")  # latest
-    metrics_df.to_csv(METRICS_ALL_DATA, index=False, encoding="utf-8-sig")  # dated
-    print(f"[SAVED] metrics_all (latest) → {OUT_ALL} (rows={len(metrics_df)})")
+    write_and_publish(metrics_df, DATA_DIR, "metrics_all", BASE_DIR)
     print(f"[SAVED] metrics_all (dated)  → {METRICS_ALL_DATA} (rows={len(metrics_df)})")
+    print(f"[LINKED] metrics_all (latest) → {OUT_ALL}")
 
-    # 2) recommendations.csv : 필터링된 종목 (ret14_pct ≥ TH_RET14 and rsi14 ≥ TH_RSI)
-    cond = (
-        (metrics_df["ret14_pct"] >= TH_RET14) &
-        (metrics_df["rsi14"]     >= TH_RSI)
-    )
-    df_reco = metrics_df.loc[cond].reset_index(drop=True)
-
-    df_reco.to_csv(OUT_FINAL, index=False, encoding="utf-8-sig")  # latest
-    df_reco.to_csv(OUT_DATA,  index=False, encoding="utf-8-sig")  # dated
-    print(f"[SAVED] recommendations (latest) → {OUT_FINAL} (rows={len(df_reco)})")
+    # 2) candidates_filtered1.csv : 임계값 통과본
+    write_and_publish(df_reco, DATA_DIR, "candidates_filtered1", BASE_DIR)
     print(f"[SAVED] recommendations (dated)  → {OUT_DATA}  (rows={len(df_reco)})")
+    print(f"[LINKED] recommendations (latest) → {OUT_FINAL}")
+
+def main():
+    # 후보군 로드 (scraper가 UTF-8-SIG로 저장했다고 가정)
+    df = read_latest(BASE_DIR, "candidates")
+
+    # koapy 는 직접 로그인할 때만 import (main.py 작업 큐 조정자 / 가짜 키움은 koapy 없이 동작)
+    from koapy import KiwoomOpenApiPlusEntrypoint
+    with KiwoomOpenApiPlusEntrypoint() as ep:
+        ep.EnsureConnected(credentials)
+        metrics_df, df_reco = run(df, ep)
+
+    # --- 저장 파트 ---
+    if metrics_df is None:
+        return
+    save(metrics_df, df_reco)
 
 if __name__ == "__main__":
     main()
@@ -3,24 +3,20 @@
 
 import os
 import pandas as pd
-from koapy import KiwoomOpenApiPlusEntrypoint
 from datetime import datetime
 
-# ====== 사용자 설정 ======
-# 공통: --date 또는 환경변수 PIPELINE_DATE 받기
-import argparse, os
-from datetime import datetime
-
-def get_date_arg() -> str:
-    p = argparse.ArgumentParser(add_help=False)
-    p.add_argument("--date", help="YYYY-MM-DD", default=None)
-    args, _ = p.parse_known_args()
-    date = args.date or os.environ.get("PIPELINE_DATE")
-    if not date:
-        # 기본: 오늘 날짜
-        date = datetime.now().strftime("%Y-%m-%d")
-    return date
+from common import column_type, credentials, get_date_arg, typed_codes
+from investor_cache import OPT10059_INPUTS, InvestorFlowCache
+from price_cache import DailyBarCache
+from run_report import REPORT
+from flow_engine import flow_metrics, metric_names
+from screen import investor_pass, load_screen, mask, tier
+from snapshot import has_latest, publish_link, read_latest, write_and_publish
+from stock_archive import StockArchive
+from tr_scheduler import EmptyResponseError, TRScheduler, rank_priorities
 
+# ====== 사용자 설정 ======
+# --date / PIPELINE_DATE 처리와 키움 로그인 정보(credentials)는 common.py
 date = get_date_arg()
 
 FROMDATE = datetime.strptime(date, '%Y-%m-%d').strftime('%Y%m%d')
@@ -45,144 +41,236 @@ OUT_RECO_DATED  = os.path.join(DATA_DIR, "recommendations.csv")
 METRICS_LATEST = os.path.join(BASE_DIR, "metrics_all.csv")
 METRICS_DATED  = os.path.join(DATA_DIR, "metrics_all.csv")
 
-# 투자자 내역 개별 저장 폴더(선택)
+# 투자자 원자료: 통합 아카이브(public/data/per_stock.sqlite, 기준일·종목코드 색인) 에 저장
+# 조회: StockArchive().read("investors", code, asof) / 기존 CSV 형식이 필요하면 stock_archive.py export
+USE_STOCK_ARCHIVE = True
+
+# 종목별 CSV 도 따로 저장할지 (예전 방식: 날짜 폴더 + latest 하드링크, 종목 수만큼 파일 생성)
+PER_STOCK_CSV = False
+
+# 투자자 내역 개별 저장 폴더 (PER_STOCK_CSV 일 때만 사용)
 PER_STOCK_INV_LATEST = os.path.join(BASE_DIR, "per_stock", "investors")
 PER_STOCK_INV_DATED  = os.path.join(DATA_DIR,  "per_stock", "investors")
-os.makedirs(PER_STOCK_INV_LATEST, exist_ok=True)
-os.makedirs(PER_STOCK_INV_DATED,  exist_ok=True)
+if PER_STOCK_CSV:
+    os.makedirs(PER_STOCK_INV_LATEST, exist_ok=True)
+    os.makedirs(PER_STOCK_INV_DATED,  exist_ok=True)
+
+ARCHIVE = StockArchive() if USE_STOCK_ARCHIVE else None
 
 # 결과 컬럼명
 COL_FLAG = "외인기관3일연속순매도"
 
-# ====== Kiwoom 로그인 정보 ======
-credentials = {
-    'user_id': os.getenv('KIWOOM_ID'),
-    'user_password': os.getenv('KIWOOM_PW'),
-    'cert_password': os.getenv('KIWOOM_CERT_PW'),
-    'is_simulation': True,
-    'account_passwords': { os.getenv('KIWOOM_ACCT','0000000000'): os.getenv('KIWOOM_ACCT_PW') }
-}
-
-# ====== 투자자 연속 순매도 체크 함수 ======
-def check_fi_3day_netsell_and_save(ep, code: str, fromdate: str) -> bool:
+# 스크린 규칙 (step3 는 investor 규칙만 사용 — 기본: netsell_streak ≥ 3)
+SCREEN = load_screen()
+
+# 투자자 로컬 캐시 사용 여부 (False면 매번 opt10059 연속조회)
+USE_INVESTOR_CACHE = True
+
+# ====== 투자자 원자료 조회 / 저장 ======
+def fetch_investors(ep, code: str, fromdate: str, cache: InvestorFlowCache = None,
+                    save_dirs=None, data: pd.DataFrame = None) -> pd.DataFrame:
     """
-    외국인/기관 모두 순매도(<0)가 3일 연속인지 판단.
-    조회 결과를 latest/dated 투자자 폴더에 CSV로 저장.
+    종목 하나의 opt10059 원자료(최신→과거) 조회 후 저장. 판단은 run() 에서 전 종목을 모아 한 번에.
+    조회 결과는 통합 아카이브에 fromdate 기준으로 저장 (전날과 겹치는 행은 저장하지 않음).
+    PER_STOCK_CSV 면 dated 투자자 폴더에 CSV로도 저장하고 latest 에 하드링크로 게시 (save_dirs 를 주면 그 폴더들에만 저장).
+    cache 를 주면 캐시 우선 조회 (기준일까지 최근 구간이 캐시에 있으면 TR 없음)
+    data 를 주면 조회 없이 그 원자료로 판단 (작업 큐 모드: 워커가 채운 캐시에서 읽은 값)
+    응답 행이 없으면 EmptyResponseError (스케줄러가 재시도)
     """
-    inputs = {
-        "일자": fromdate, "종목코드": code,
-        "금액수량구분": "1",  # 1: 수량
-        "매매구분": "0",      # 0: 순매수
-        "단위구분": "1"       # 1: 주식수
-    }
-
-    data_frames = []
-    for event in ep.TransactionCall("종목별투자자기관별요청", "opt10059", "0001", inputs):
-        columns = event.multi_data.names
-        records = [values.values for values in event.multi_data.values]
-        df = pd.DataFrame.from_records(records, columns=columns)
-        data_frames.append(df)
-
-    if not data_frames:
-        return False
-
-    data = pd.concat(data_frames, axis=0).reset_index(drop=True)
-
-    # 원본 저장 (latest/dated 둘 다)
-    for base in (PER_STOCK_INV_LATEST, PER_STOCK_INV_DATED):
-        outp = os.path.join(base, f"{code}_investors.csv")
-        data.to_csv(outp, index=False, encoding="utf-8-sig")
-
-    # 수치화
-    data['외국인투자자'] = pd.to_numeric(data['외국인투자자'].astype(str).str.replace(',', ''), errors='coerce')
-    data['기관계']     = pd.to_numeric(data['기관계'].astype(str).str.replace(',', ''), errors='coerce')
-
-    # 순매수 기준이므로 < 0이면 순매도
-    cond = (data['외국인투자자'] < 0) & (data['기관계'] < 0)
-
-    # "연속 3일" 체크 (데이터가 최신→과거인지/과거→최신인지에 상관없이, 연속성만 확인)
-    # opt10059 결과는 일반적으로 과거→최신 순. 연속성만 확인하므로 그대로 순회.
-    streak = 0
-    for flag in cond:
-        if bool(flag):
-            streak += 1
-            if streak >= 3:
-                return True
+    if data is not None or cache is not None:
+        if data is None:
+            data = cache.fetch(ep, code, fromdate)
+        if data.empty:
+            raise EmptyResponseError(f"{code} 투자자 응답 없음")
+    else:
+        inputs = {"일자": fromdate, "종목코드": code, **OPT10059_INPUTS}
+
+        data_frames = []
+        events = ep.TransactionCall("종목별투자자기관별요청", "opt10059", "0001", inputs)
+        for event in REPORT.timed_iter("tr.opt10059", events):
+            columns = event.multi_data.names
+            records = [values.values for values in event.multi_data.values]
+            df = pd.DataFrame.from_records(records, columns=columns)
+            data_frames.append(df)
+
+        if not data_frames:
+            raise EmptyResponseError(f"{code} 투자자 응답 없음")
+
+        data = pd.concat(data_frames, axis=0).reset_index(drop=True)
+
+    # 원본 저장 (아카이브 / 선택 시 종목별 CSV)
+    if ARCHIVE is not None:
+        ARCHIVE.write("investors", fromdate, code, data)
+    if PER_STOCK_CSV:
+        fname = f"{code}_investors.csv"
+        if save_dirs:
+            for base in save_dirs:
+                os.makedirs(base, exist_ok=True)
+                data.to_csv(os.path.join(base, fname), index=False, encoding="utf-8-sig")
         else:
-            streak = 0
-    return False
+            dated = os.path.join(PER_STOCK_INV_DATED, fname)
+            data.to_csv(dated, index=False, encoding="utf-8-sig")
+            publish_link(dated, os.path.join(PER_STOCK_INV_LATEST, fname))
+    return data
 
-def main():
-    # 1) 1차 필터 목록 읽기 (latest/candidates_filtered1.csv)
-    df_filt1 = pd.read_csv(IN_FILTER1, encoding="utf-8-sig")
+def load_saved(code: str, fromdate: str, cache: InvestorFlowCache = None) -> pd.DataFrame:
+    """이미 조회한 종목(체크포인트 완료)의 원자료 — 투자자 캐시, 없으면 아카이브의 fromdate 스냅샷 (없으면 빈 DataFrame)"""
+    if cache is not None:
+        return cache.load(code, fromdate)
+    if ARCHIVE is not None and code in ARCHIVE.codes("investors", fromdate):
+        return ARCHIVE.read("investors", code, fromdate)
+    return pd.DataFrame()
+
+def check_fi_3day_netsell_and_save(ep, code: str, fromdate: str, cache: InvestorFlowCache = None,
+                                   save_dirs=None, rules=None, data: pd.DataFrame = None) -> bool:
+    """
+    종목 하나 조회·저장 후 스크린 investor 규칙 판단 (기본: 외국인/기관 모두 순매도(<0)가 3일 연속).
+    run() 은 전 종목을 모아 flow_metrics 로 한 번에 판단하고, 이 함수는 종목 단위 호출(bench 등)용
+    """
+    data = fetch_investors(ep, code, fromdate, cache, save_dirs, data)
+    return investor_pass(data, tier(SCREEN, "investor") if rules is None else rules)
+
+def run(df_filt1: pd.DataFrame, metrics_df, ep, fromdate: str = FROMDATE, progress=None, per_stock_dirs=None,
+        queue=None):
+    """
+    1차 필터 결과 + metrics_all → (투자자 컬럼이 추가된 metrics_df, 최종 추천 df)
+    로그인된 엔트리포인트(ep)를 받아 계산만 수행 (투자자 원자료 아카이브 외 파일 저장 없음).
+    원자료를 전 종목 모은 뒤 수급 배치 엔진(flow_engine)으로 지표 열을 한 번에 계산해 metrics / 추천에 추가하고
+    스크린 investor 규칙을 마스크로 적용한다.
+    metrics_df 가 None 이면 metrics 갱신은 건너뜀.
+    progress(checkpoint.StageProgress)를 주면 조회 완료 종목을 기록하고, 기록된 종목은 다시 조회하지 않는다 (저장된 원자료 사용).
+    per_stock_dirs 를 주면 종목별 CSV(PER_STOCK_CSV)를 latest/dated 대신 그 폴더들에 저장.
+    queue(work_queue.RunQueue)를 주면 opt10059 조회는 워커 프로세스에 맡기고 완료된 종목을 캐시에서 읽어 판단.
+    """
     if "종목코드" not in df_filt1.columns:
         raise KeyError("candidates_filtered1.csv 에 '종목코드' 컬럼이 없습니다.")
-    df_filt1["종목코드"] = df_filt1["종목코드"].astype(str).str.zfill(6)
+    df_filt1 = typed_codes(df_filt1)
 
-    # ✅ 만약 비어 있으면 recommendations.csv 빈 파일 생성 후 종료
+    # ✅ 만약 비어 있으면 빈 recommendations 반환 (metrics_all은 그대로)
     if df_filt1.empty:
         print("[INFO] candidates_filtered1.csv 가 비어 있음 → 빈 recommendations.csv 생성")
         # 빈 DataFrame 동일 구조로 생성
         empty_df = pd.DataFrame(columns=df_filt1.columns.tolist() + [COL_FLAG])
-        empty_df.to_csv(OUT_RECO_LATEST, index=False, encoding="utf-8-sig")
-        empty_df.to_csv(OUT_RECO_DATED,  index=False, encoding="utf-8-sig")
-        return
-
-    # 2) 해당 리스트에 대해서만 투자자 조건 평가
-    flags = []  # [{"종목코드": "005930", COL_FLAG: True/False}, ...]
-    with KiwoomOpenApiPlusEntrypoint() as ep:
-        ep.EnsureConnected(credentials)
-
-        total = len(df_filt1)
-        done  = 0
-        for _, row in df_filt1.iterrows():
-            code = row["종목코드"]
+        return None, empty_df
+
+    # 스크린에 투자자 규칙이 없으면 opt10059 조회 없이 1차 필터 결과가 그대로 최종
+    if not tier(SCREEN, "investor"):
+        print("[Step3] 스크린에 투자자 규칙 없음 → 투자자 조회 생략")
+        met = None
+        if metrics_df is not None:
+            met = metrics_df.copy()
+            met[COL_FLAG] = None
+        return met, df_filt1.assign(**{COL_FLAG: None})
+
+    # 2) 해당 리스트에 대해서만 투자자 원자료 수집 (스케줄러로 TR 파이프라이닝, 순위 우선)
+    def report(code, data, e):
+        if e is not None:
+            print(f"[WARN] {code} 처리 오류: {e}")
+        elif progress is not None:
+            progress.mark(code, True)
+
+    cache = InvestorFlowCache(bar_cache=DailyBarCache()) if USE_INVESTOR_CACHE or queue is not None else None
+
+    # 체크포인트에 완료 기록된 종목은 저장된 원자료 사용 (없으면 다시 조회)
+    histories = {}  # {종목코드: opt10059 원자료}
+    if progress is not None:
+        for code in df_filt1.loc[df_filt1["종목코드"].map(progress.done), "종목코드"]:
+            data = load_saved(code, fromdate, cache)
+            if len(data):
+                histories[code] = data
+    df_todo = df_filt1.loc[~df_filt1["종목코드"].isin(histories)]
+    if histories:
+        print(f"[Step3] 체크포인트 재사용 {len(histories)}개 / 조회 {len(df_todo)}개")
+
+    # 투자자 캐시에 구간이 있는 종목은 TR 없이 바로 읽음 (스케줄러 대기 없음)
+    if cache is not None:
+        hit_mask = df_todo["종목코드"].map(lambda c: cache.covers(c, fromdate)).astype(bool)
+        for code in df_todo.loc[hit_mask, "종목코드"]:
             try:
-                ok = check_fi_3day_netsell_and_save(ep, code, FROMDATE)
-                flags.append({"종목코드": code, COL_FLAG: bool(ok)})
-                msg = "✅ 통과" if ok else "❌ 미통과"
-                print(f"[{code}] {msg}")
+                histories[code] = fetch_investors(None, code, fromdate, cache, per_stock_dirs)
+                report(code, histories[code], None)
             except Exception as e:
-                print(f"[WARN] {code} 처리 오류: {e}")
-                flags.append({"종목코드": code, COL_FLAG: None})
-            done += 1
-            if done % 5 == 0 or done == total:
-                print(f"[진행] {done}/{total}")
-
-    flags_df = pd.DataFrame(flags)
-
-    # 3) metrics_all(latest/dated)에 컬럼 추가
-    #    - candidates_filtered1에 있는 종목만 True/False 채워지고
-    #    - 나머지는 None으로 둠
-    for path in (METRICS_LATEST, METRICS_DATED):
-        if not os.path.exists(path):
-            print(f"[SKIP] metrics_all 없음 → {path}")
-            continue
-        met = pd.read_csv(path, encoding="utf-8-sig")
-        if "종목코드" not in met.columns:
-            print(f"[SKIP] '종목코드' 컬럼 없음 → {path}")
-            continue
-        met["종목코드"] = met["종목코드"].astype(str).str.zfill(6)
-
-        # 기본 None으로 두고, 후보에만 값을 채움
-        met[COL_FLAG] = None
-        # map 으로 채우기
-        map_dict = dict(zip(flags_df["종목코드"], flags_df[COL_FLAG]))
-        met.loc[met["종목코드"].isin(map_dict.keys()), COL_FLAG] = met["종목코드"].map(map_dict)
-
-        met.to_csv(path, index=False, encoding="utf-8-sig")
-        print(f"[UPDATED] 투자자 컬럼 추가 → {path}")
-
-    # 4) 최종 recommendations.csv 생성 (latest/dated)
+                report(code, None, e)
+        print(f"[Step3] 투자자 캐시 적중 {int(hit_mask.sum())}개 / TR 조회 {int((~hit_mask).sum())}개")
+        df_todo = df_todo.loc[~hit_mask]
+
+    if queue is not None:
+        # 작업 큐: 워커가 투자자 캐시를 채운 종목부터 여기서 캐시로 판단
+        scheduler = queue.scheduler("investor", {"fromdate": fromdate}, label="Step3")
+        fetch = lambda code: fetch_investors(None, code, fromdate, save_dirs=per_stock_dirs,
+                                             data=cache.load(code, fromdate))
+    else:
+        # 재시도/2차 시도 후에도 실패한 종목은 COL_FLAG None (커버리지는 실행 리포트에 기록)
+        scheduler = TRScheduler(label="Step3", reconnect=lambda: ep.EnsureConnected(credentials))
+        fetch = lambda code: fetch_investors(ep, code, fromdate, cache, per_stock_dirs)
+    fetched, _ = scheduler.map(fetch, df_todo["종목코드"], priorities=rank_priorities(df_todo), on_result=report)
+    histories.update(fetched)
+
+    # 3) 전 종목 수급 지표를 (종목 × 일자) 행렬로 한 번에 계산 → 투자자 규칙 마스크
+    with REPORT.timed("step3.flow_metrics"):
+        flows = flow_metrics(histories)
+    passed = mask(flows, tier(SCREEN, "investor"))
+    for code in df_filt1["종목코드"]:
+        if code in passed.index:
+            print(f"[{code}] {'✅ 통과' if passed[code] else '❌ 미통과'}")
+
+    # 종목별 COL_FLAG(True/False, 오류 종목은 None) + 수급 지표 열
+    flow_cols = metric_names()
+    flags_df = flows.reindex(df_filt1["종목코드"].unique())
+    flags_df = flags_df.astype({c: column_type(c) for c in flow_cols})
+    flags_df.insert(0, COL_FLAG, None)
+    flags_df.loc[passed.index, COL_FLAG] = passed
+    flags_df = flags_df.reset_index()
+
+    # 4) metrics_all에 컬럼 추가
+    #    - candidates_filtered1에 있는 종목만 값이 채워지고
+    #    - 나머지는 None/NaN 으로 둠
+    met = None
+    if metrics_df is not None and "종목코드" in metrics_df.columns:
+        met = typed_codes(metrics_df)
+        met = met.drop(columns=[c for c in [COL_FLAG] + flow_cols if c in met.columns])
+        met = met.join(flags_df.set_index("종목코드"), on="종목코드")
+    elif metrics_df is not None:
+        print("[SKIP] metrics_all 에 '종목코드' 컬럼 없음")
+
+    # 5) 최종 recommendations
     #    - candidates_filtered1에 투자자 컬럼 merge
     #    - 투자자 조건 True 인 종목만 필터
     df_merge = df_filt1.merge(flags_df, on="종목코드", how="left")
     df_final = df_merge.loc[df_merge[COL_FLAG] == True].reset_index(drop=True)
+    REPORT.rows("screen.investor", len(df_filt1), len(df_final))
+    return met, df_final
 
-    df_final.to_csv(OUT_RECO_LATEST, index=False, encoding="utf-8-sig")
-    df_final.to_csv(OUT_RECO_DATED,  index=False, encoding="utf-8-sig")
-    print(f"[DONE] recommendations (latest) → {OUT_RECO_LATEST} (rows={len(df_final)})")
+def save(metrics_df, df_final: pd.DataFrame):
+    # metrics_all 갱신 (dated 에 한 번 저장, latest 는 하드링크 게시)
+    if metrics_df is not None:
+        write_and_publish(metrics_df, DATA_DIR, "metrics_all", BASE_DIR)
+        print(f"[UPDATED] 투자자 컬럼 추가 → {METRICS_DATED} (latest 게시)")
+
+    # 최종 recommendations.csv
+    write_and_publish(df_final, DATA_DIR, "recommendations", BASE_DIR)
     print(f"[DONE] recommendations (dated)  → {OUT_RECO_DATED}  (rows={len(df_final)})")
+    print(f"[DONE] recommendations (latest) → {OUT_RECO_LATEST} (게시)")
+
+def main():
+    # 1) 1차 필터 목록 / metrics_all 읽기 (latest)
+    df_filt1 = read_latest(BASE_DIR, "candidates_filtered1")
+    metrics_df = None
+    if has_latest(BASE_DIR, "metrics_all"):
+        metrics_df = read_latest(BASE_DIR, "metrics_all")
+    else:
+        print(f"[SKIP] metrics_all 없음 → {METRICS_LATEST}")
+
+    if df_filt1.empty:
+        metrics_df, df_final = run(df_filt1, metrics_df, None)
+    else:
+        # koapy 는 직접 로그인할 때만 import (main.py 작업 큐 조정자 / 가짜 키움은 koapy 없이 동작)
+        from koapy import KiwoomOpenApiPlusEntrypoint
+        with KiwoomOpenApiPlusEntrypoint() as ep:
+            ep.EnsureConnected(credentials)
+            metrics_df, df_final = run(df_filt1, metrics_df, ep)
+
+    save(metrics_df, df_final)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+"""
+종목별 원자료 통합 아카이브 (SQLite 파일 하나)
+
+종목마다 {code}_investors.csv 를 날짜 폴더·latest 폴더에 따로 쓰던 per_stock 원자료를
+public/data/per_stock.sqlite 한 파일에 모은다.
+  - 분할: 기준일(asof) — 실행 날짜마다 종목별 스냅샷(일자 구간, 열 순서)을 기록
+  - 색인: (종류, 종목코드, 일자) 기본키 — 한 종목 조회는 폴더를 훑지 않고 색인 탐색 한 번
+  - 중복 제거: 날마다 받는 opt10059 응답은 100일 중 99일이 전날과 겹치므로, 행은 (종목, 일자)별로
+    값이 처음 나왔거나 바뀐 기준일에만 저장하고, 스냅샷은 그 기준일 이하 최신 값으로 다시 만든다
+  - 종류(kind): investors(opt10059 원자료) — 일봉·지표 시계열도 같은 표에 kind 만 달리해 추가 가능
+
+조회: StockArchive().read("investors", "096770", asof="20250827") → 그날 저장했던 CSV 와 같은 DataFrame
+사용 예)
+  python stock_archive.py show --code 096770 [--date 2025-08-27]
+  python stock_archive.py export --date 2025-08-27 --out tmp/investors    # 기존 CSV 형식으로 내보내기
+  python stock_archive.py migrate                                          # 기존 per_stock CSV 폴더 흡수
+"""
+
+import argparse
+import json
+import os
+
+import pandas as pd
+
+from common import DATA_ROOT, DATE_DIR_RE, connect_sqlite, yyyymmdd
+from run_report import REPORT
+
+ARCHIVE_PATH = os.path.join(DATA_ROOT, "per_stock.sqlite")
+
+# 기존 per_stock CSV 폴더 (migrate / export 형식)
+CSV_DIRS = {"investors": os.path.join("per_stock", "investors")}
+CSV_SUFFIX = {"investors": "_investors.csv"}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS rows (
+    kind TEXT NOT NULL,   -- investors
+    code TEXT NOT NULL,
+    day  TEXT NOT NULL,   -- 행 일자 YYYYMMDD
+    asof TEXT NOT NULL,   -- 이 값이 처음 저장된 기준일 YYYYMMDD
+    row  TEXT,            -- 원본 행(JSON, 열 순서 유지), NULL 은 "이 기준일부터 없음" 표시(백필 뒤 스냅샷 보존용)
+    PRIMARY KEY (kind, code, day, asof)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS snapshots (
+    kind    TEXT NOT NULL,
+    asof    TEXT NOT NULL,
+    code    TEXT NOT NULL,
+    lo      TEXT,         -- 스냅샷 일자 구간
+    hi      TEXT,
+    n       INTEGER,
+    columns TEXT,         -- 열 순서(JSON)
+    PRIMARY KEY (kind, asof, code)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS snapshots_code ON snapshots (kind, code, asof);
+"""
+
+
+class StockArchive:
+    def __init__(self, path: str = ARCHIVE_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with connect_sqlite(self.path) as con:
+            con.executescript(_SCHEMA)
+
+    # ----- 저장 -----
+    def write(self, kind: str, asof: str, code: str, data: pd.DataFrame, date_col: str = "일자") -> int:
+        """한 종목 스냅샷 저장. 반환: 새로 저장한 행 수 (전 기준일과 같은 값은 저장하지 않음)"""
+        return self.write_many(kind, asof, {code: data}, date_col)
+
+    def write_many(self, kind: str, asof: str, frames: dict, date_col: str = "일자") -> int:
+        """{종목코드: DataFrame} 을 한 트랜잭션으로 저장"""
+        asof = yyyymmdd(asof)
+        added = 0
+        with connect_sqlite(self.path) as con:
+            for code, data in frames.items():
+                if data is None or len(data) == 0 or date_col not in data.columns:
+                    continue
+                records = {}
+                for rec in data.to_dict("records"):
+                    day = yyyymmdd(rec[date_col])
+                    if day.strip():
+                        records[day] = json.dumps(rec, ensure_ascii=False, default=str)
+                if not records:
+                    continue
+                lo, hi = min(records), max(records)
+                current = self._versions(con, kind, code, lo, hi, asof)
+                new = [(kind, code, day, asof, row) for day, row in records.items() if current.get(day) != row]
+                # 구간 안인데 이번 응답에 없는 일자(거래정지 등)는 NULL 로 가려 스냅샷 행 수를 맞춤
+                new += [(kind, code, day, asof, None) for day in current if day not in records]
+                con.executemany("INSERT OR REPLACE INTO rows (kind, code, day, asof, row) VALUES (?, ?, ?, ?, ?)", new)
+                if new:
+                    self._keep_later(con, kind, code, asof, {d: current.get(d) for _, _, d, _, _ in new})
+                con.execute(
+                    "INSERT OR REPLACE INTO snapshots (kind, asof, code, lo, hi, n, columns) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (kind, asof, code, lo, hi, len(records), json.dumps(list(data.columns), ensure_ascii=False)),
+                )
+                added += len(new)
+        REPORT.count(f"archive.{kind}.rows_new", added)
+        return added
+
+    @staticmethod
+    def _versions(con, kind: str, code: str, lo: str, hi: str, asof: str) -> dict:
+        """{일자: asof 이하 최신 행} (lo~hi, 최신 버전이 NULL 인 일자는 제외)"""
+        rows = con.execute(
+            "SELECT day, row FROM rows r WHERE kind=? AND code=? AND day BETWEEN ? AND ? AND asof = ("
+            " SELECT MAX(asof) FROM rows WHERE kind=r.kind AND code=r.code AND day=r.day AND asof<=?)",
+            (kind, code, lo, hi, asof),
+        ).fetchall()
+        return {day: row for day, row in rows if row is not None}
+
+    @staticmethod
+    def _keep_later(con, kind: str, code: str, asof: str, previous: dict):
+        """
+        과거 기준일을 나중에 채운 경우(백필): 그 뒤 스냅샷들이 기대던 이전 값이 새 값에 가려지지 않도록
+        바로 다음 스냅샷 기준일에 이전 값을 다시 기록 (그 사이 다른 버전이 없을 때만).
+        이전 값이 없던 일자(백필로 처음 생긴 일자)는 NULL 을 기록해 뒤 스냅샷에 끼어들지 않게 한다
+        """
+        later = con.execute("SELECT asof, lo, hi FROM snapshots WHERE kind=? AND code=? AND asof>? ORDER BY asof",
+                            (kind, code, asof)).fetchall()
+        if not later:
+            return
+        for day, prev in previous.items():
+            nxt = next((a for a, lo, hi in later if lo <= day <= hi), None)
+            if nxt is None:
+                continue
+            exists = con.execute("SELECT 1 FROM rows WHERE kind=? AND code=? AND day=? AND asof>? AND asof<=?",
+                                 (kind, code, day, asof, nxt)).fetchone()
+            if exists is None:
+                con.execute("INSERT INTO rows (kind, code, day, asof, row) VALUES (?, ?, ?, ?, ?)",
+                            (kind, code, day, nxt, prev))
+
+    # ----- 조회 -----
+    def snapshot(self, kind: str, code: str, asof: str = None):
+        """(기준일, lo, hi, 열 목록) — asof 이하 가장 최근 스냅샷, 없으면 None"""
+        sql = "SELECT asof, lo, hi, columns FROM snapshots WHERE kind=? AND code=?"
+        args = [kind, code]
+        if asof:
+            sql += " AND asof<=?"
+            args.append(yyyymmdd(asof))
+        with connect_sqlite(self.path) as con:
+            row = con.execute(sql + " ORDER BY asof DESC LIMIT 1", args).fetchone()
+        return None if row is None else (row[0], row[1], row[2], json.loads(row[3]))
+
+    def read(self, kind: str, code: str, asof: str = None) -> pd.DataFrame:
+        """
+        asof(기본: 최신) 에 저장했던 한 종목 원자료 — 원본과 같은 열 순서, 일자 최신→과거.
+        없으면 빈 DataFrame
+        """
+        snap = self.snapshot(kind, code, asof)
+        if snap is None:
+            return pd.DataFrame()
+        at, lo, hi, columns = snap
+        with connect_sqlite(self.path) as con:
+            versions = self._versions(con, kind, code, lo, hi, at)
+        records = [json.loads(versions[d]) for d in sorted(versions, reverse=True)]
+        return pd.DataFrame(records, columns=columns)
+
+    def codes(self, kind: str, asof: str) -> list:
+        """그 기준일에 스냅샷이 있는 종목"""
+        with connect_sqlite(self.path) as con:
+            rows = con.execute("SELECT code FROM snapshots WHERE kind=? AND asof=? ORDER BY code",
+                               (kind, yyyymmdd(asof))).fetchall()
+        return [r[0] for r in rows]
+
+    def dates(self, kind: str) -> list:
+        with connect_sqlite(self.path) as con:
+            rows = con.execute("SELECT DISTINCT asof FROM snapshots WHERE kind=? ORDER BY asof", (kind,)).fetchall()
+        return [r[0] for r in rows]
+
+    def stats(self) -> dict:
+        with connect_sqlite(self.path) as con:
+            rows = dict(con.execute("SELECT kind, COUNT(*) FROM rows GROUP BY kind").fetchall())
+            snaps = con.execute("SELECT kind, COUNT(*), SUM(n) FROM snapshots GROUP BY kind").fetchall()
+        return {kind: {"snapshots": n, "snapshot_rows": int(total or 0), "stored_rows": rows.get(kind, 0)}
+                for kind, n, total in snaps}
+
+    # ----- CSV 호환 -----
+    def export(self, kind: str, asof: str, folder: str) -> int:
+        """그 기준일 스냅샷을 기존 per_stock CSV 형식({code}{접미사}.csv)으로 내보내기"""
+        os.makedirs(folder, exist_ok=True)
+        codes = self.codes(kind, asof)
+        for code in codes:
+            self.read(kind, code, asof).to_csv(os.path.join(folder, f"{code}{CSV_SUFFIX[kind]}"),
+                                               index=False, encoding="utf-8-sig")
+        return len(codes)
+
+    def migrate(self, data_root: str = DATA_ROOT, kind: str = "investors") -> int:
+        """날짜 폴더의 기존 per_stock CSV 를 아카이브로 흡수 (날짜 순). 반환: 흡수한 파일 수"""
+        n = 0
+        for d in sorted(os.listdir(data_root)):
+            folder = os.path.join(data_root, d, CSV_DIRS[kind])
+            if not DATE_DIR_RE.match(d) or not os.path.isdir(folder):
+                continue
+            frames = {}
+            for name in sorted(os.listdir(folder)):
+                if name.endswith(CSV_SUFFIX[kind]):
+                    code = name[:-len(CSV_SUFFIX[kind])]
+                    frames[code] = pd.read_csv(os.path.join(folder, name), dtype=str, encoding="utf-8-sig")
+            self.write_many(kind, d, frames)
+            n += len(frames)
+            print(f"[MIGRATE] {d}: {len(frames)}개 종목")
+        return n
+
+
+def main():
+    p = argparse.ArgumentParser(description="종목별 원자료 통합 아카이브")
+    p.add_argument("--path", default=ARCHIVE_PATH)
+    sub = p.add_subparsers(dest="cmd")
+    s = sub.add_parser("show", help="한 종목 스냅샷 출력")
+    s.add_argument("--code", required=True)
+    s.add_argument("--date", default=None)
+    s.add_argument("--kind", default="investors")
+    e = sub.add_parser("export", help="기준일 스냅샷을 CSV 폴더로 내보내기")
+    e.add_argument("--date", required=True)
+    e.add_argument("--out", required=True)
+    e.add_argument("--kind", default="investors")
+    m = sub.add_parser("migrate", help="기존 per_stock CSV 흡수")
+    m.add_argument("--data-root", default=DATA_ROOT)
+    args = p.parse_args()
+
+    archive = StockArchive(args.path)
+    if args.cmd == "show":
+        print(archive.read(args.kind, args.code.zfill(6), args.date).to_string(index=False))
+    elif args.cmd == "export":
+        print(f"[EXPORT] {archive.export(args.kind, args.date, args.out)}개 종목 → {args.out}")
+    elif args.cmd == "migrate":
+        print(f"[MIGRATE] 파일 {archive.migrate(args.data_root)}개 흡수 (기존 폴더는 확인 후 직접 삭제)")
+    print(f"[INFO] {args.path}: {archive.stats()}")
+
+
+if __name__ == "__main__":
+    main()
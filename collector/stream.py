@@ -0,0 +1,455 @@
+# -*- coding: utf-8 -*-
+"""
+장중 실시간 추천 데몬
+
+하루 한 번(08:40) 돌리는 파이프라인과 달리, 장중 내내 실시간 체결가/투자자 순매수를 받아
+스크린을 종목 단위로 다시 평가하고 추천 종목 구성이 바뀔 때만 장중 구성을 다시 게시한다.
+  - 장중 구성은 {date}/recommendations_intraday 에 저장하고 latest/recommendations_intraday 로 게시
+    (아침 배치의 {date}/recommendations 는 백테스트·변경 피드·사이트 번들이 기대는 일별 결과라 건드리지 않음)
+  - column 규칙 : 시작 시 후보군(latest/candidates)에 한 번 적용 (공매도 자료는 하루 단위) — 통과 종목만 구독
+  - chart 규칙  : 완성된 일봉(전일까지)으로 구간 합을 미리 잡아 두고, 틱마다 오늘 변화량 하나만 더해
+                  retN / RSI(N)을 O(1)로 갱신 (정의는 indicators.compute_indicators 와 동일)
+  - investor 규칙: chart 를 통과한 종목만 평가. 투자자 이력(전일까지) + 오늘 잠정 순매수 1행
+시작 시 값은 step2/step3 와 같은 배치 계산(전일 종가 기준)이라, 틱이 오기 전 구성은 아침 실행 결과와 같다.
+
+이벤트 소스
+  - ReplaySource : 기록된 틱 CSV(time, code, price, foreign, inst)를 재생 — 브로커 없이 테스트용
+  - KiwoomRealSource : koapy 실시간 체결(현재가) + opt10059 주기 조회(오늘 외국인/기관 순매수)
+--record 로 실시간 이벤트를 CSV 로 남겨 두면 그대로 --replay 할 수 있다.
+
+사용 예)
+  python stream.py --date 2025-08-27 --replay ticks.csv            # 최대 속도 재생
+  python stream.py --date 2025-08-27 --replay ticks.csv --speed 60 # 60배속
+  python stream.py --record ticks.csv                               # 실시간 (키움 로그인)
+"""
+
+import argparse
+import csv
+import os
+import queue
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from common import credentials, get_date_arg, read_typed, to_number
+from indicators import batch_indicators
+from investor_cache import INVESTOR_LOOKBACK, OPT10059_INPUTS, InvestorFlowCache
+from price_cache import DailyBarCache
+from run_report import REPORT
+from flow_engine import flow_metrics
+from screen import INVESTOR_METRICS, OPS, chart_windows, load_screen, mask, tier
+from snapshot import has_snapshot, read_latest, read_snapshot, write_and_publish
+from tr_scheduler import TRScheduler
+
+# ====== 기준 날짜 / 경로 (step2/step3 와 동일) ======
+date = get_date_arg()
+
+BASE_DIR = r"digger-25-short-reco-site\public\data\latest"
+DATA_DIR = os.path.join(r"digger-25-short-reco-site\public\data", date)
+
+# 장중 구성 산출물 이름 (아침 배치의 recommendations 와 분리)
+INTRADAY_NAME = "recommendations_intraday"
+
+# 추천 플래그 열 (step3 의 COL_FLAG 와 같은 열)
+COL_FLAG = "외인기관3일연속순매도"
+
+# ====== 설정 ======
+# step2 와 같은 지표 기간 (스크린 chart 규칙 기간은 자동 추가)
+INDICATOR_WINDOWS = (14,)
+
+# 구성 변경 게시 최소 간격[초] (이벤트 시각 기준 — 짧은 시간에 여러 번 바뀌면 마지막 구성만 게시)
+PUBLISH_MIN_SEC = 10.0
+
+# 실시간 모드: 투자자 순매수 조회 주기[초], 장 종료 시각
+INVESTOR_POLL_SEC = 300.0
+SESSION_END = "15:30"
+
+# koapy 실시간 FID (체결시간, 현재가)
+FID_TIME, FID_PRICE = "20", "10"
+
+TICK_FIELDS = ["time", "code", "price", "foreign", "inst"]
+
+# price 가 있으면 체결 틱, foreign/inst 가 있으면 투자자 틱 (한 행에 둘 다 있어도 됨)
+Tick = namedtuple("Tick", TICK_FIELDS)
+
+
+def _present(v) -> bool:
+    return v is not None and not (isinstance(v, float) and np.isnan(v))
+
+
+# ====== 지표 (O(1) 갱신) ======
+class IncrementalIndicators:
+    """
+    종목 하나의 장중 ret{n}_pct / rsi{n}.
+    완성된 종가(과거→최신, 전일까지)에서 기간별 기준가와 최근 n-1개 변화량의 상승/하락 합을 미리 구해 두고,
+    틱 가격 p 가 오면 오늘 변화량(p - 전일 종가) 하나만 더해 계산한다.
+    """
+
+    def __init__(self, closes, windows):
+        closes = np.asarray(closes, dtype="float64")
+        self.prev = closes[-1] if len(closes) else np.nan
+        self.base = {}   # n → (ret 기준가, 상승 합, 하락 합); 계산 불가 기간은 없음
+        for n in windows:
+            ret_base = closes[-(n - 1)] if n >= 2 and len(closes) >= n - 1 else np.nan
+            if len(closes) >= n:
+                delta = np.diff(closes[-n:])
+                gain, loss = float(np.clip(delta, 0.0, None).sum()), float(np.clip(-delta, 0.0, None).sum())
+            else:
+                gain = loss = np.nan
+            self.base[n] = (ret_base, gain, loss)
+
+    def update(self, price: float) -> dict:
+        d = price - self.prev
+        up, down = max(d, 0.0), max(-d, 0.0)
+        out = {}
+        for n, (ret_base, gain, loss) in self.base.items():
+            out[f"ret{n}_pct"] = (price / ret_base - 1.0) * 100.0 if ret_base else np.nan
+            avg_gain, avg_loss = (gain + up) / n, (loss + down) / n
+            if np.isnan(avg_gain) or np.isnan(avg_loss) or (avg_gain == 0 and avg_loss == 0):
+                out[f"rsi{n}"] = np.nan
+            elif avg_loss == 0:
+                out[f"rsi{n}"] = 100.0
+            else:
+                out[f"rsi{n}"] = 100.0 - 100.0 / (1.0 + avg_gain / avg_loss)
+        return out
+
+
+# ====== 투자자 지표 ======
+class FlowState:
+    """
+    종목 하나의 투자자 이력(opt10059 행, 최신→과거, 전일까지) + 오늘 잠정 순매수.
+    netsell_streak / netsell_run 은 이력의 최장/끝 연속 일수를 수급 엔진으로 미리 구해 두고 O(1)로,
+    그 밖의 투자자 지표는 오늘 행을 붙인 원자료로 다시 계산한다 (장중엔 오늘 1행이 더해진 구간).
+    """
+
+    def __init__(self, history: pd.DataFrame):
+        self.history = history
+        self.today = None
+        start = flow_metrics({"": history}).iloc[0]
+        self.longest = int(start["netsell_streak"])
+        self.trailing = int(start["netsell_run"])   # 전일에서 끝나는 연속 일수
+
+    def update(self, foreign: float, inst: float, day: str):
+        self.today = (foreign, inst, day)
+
+    def frame(self) -> pd.DataFrame:
+        if self.today is None:
+            return self.history
+        foreign, inst, day = self.today
+        row = pd.DataFrame([{"일자": day, "외국인투자자": foreign, "기관계": inst}])
+        return pd.concat([row, self.history], ignore_index=True)
+
+    def value(self, field: str):
+        if field in ("netsell_streak", "netsell_run"):
+            selling = self.today is not None and self.today[0] < 0 and self.today[1] < 0
+            run = self.trailing + 1 if selling else (self.trailing if self.today is None else 0)
+            return max(self.longest, run) if field == "netsell_streak" else run
+        return INVESTOR_METRICS[field](self.frame())
+
+
+# ====== 스크린 (종목 단위 재평가) ======
+class StreamScreen:
+    """
+    column 규칙을 통과한 후보(base)에 대해 chart → investor 순으로 종목 하나씩 재평가.
+    on_tick() 은 추천 구성이 바뀌었으면 True.
+    """
+
+    def __init__(self, base: pd.DataFrame, closes: dict, histories: dict, rules, windows, day: str):
+        self.base = base.set_index("종목코드", drop=False)
+        self.chart_rules = tier(rules, "chart")
+        self.investor_rules = tier(rules, "investor")
+        self.day = day
+        self.lock = threading.Lock()
+
+        # 시작 값: step2 와 같은 배치 계산 (전일 종가 기준)
+        charts = {code: pd.DataFrame({"현재가": c[::-1]}) for code, c in closes.items()}
+        start = batch_indicators(charts, windows=windows)
+        self.value_cols = list(start.columns)
+        self.indicators = {code: IncrementalIndicators(c, windows) for code, c in closes.items()}
+        self.values = {code: start.loc[code].to_dict() for code in start.index}
+        self.flows = {code: FlowState(histories.get(code, pd.DataFrame())) for code in self.values}
+
+        self.chart_pass = {code for code in self.values if self._chart_ok(code)}
+        self.members = {code for code in self.chart_pass if self._investor_ok(code)}
+
+    # ----- 규칙 평가 -----
+    def _chart_ok(self, code) -> bool:
+        vals = self.values[code]
+        return all(bool(OPS[r.op](vals.get(r.field, np.nan), r.value)) for r in self.chart_rules)
+
+    def _investor_ok(self, code) -> bool:
+        # 비용 순: 규칙 하나가 실패하면 나머지는 계산하지 않음
+        flow = self.flows[code]
+        return all(bool(OPS[r.op](flow.value(r.field), r.value)) for r in self.investor_rules)
+
+    def codes(self):
+        return list(self.values)
+
+    def investor_targets(self):
+        """투자자 조회가 필요한 종목 (chart 통과 종목만, 투자자 규칙이 없으면 없음)"""
+        with self.lock:
+            return sorted(self.chart_pass) if self.investor_rules else []
+
+    # ----- 이벤트 -----
+    def on_tick(self, tick: Tick) -> bool:
+        code = tick.code
+        if code not in self.values:
+            return False
+        with self.lock:
+            if _present(tick.price):
+                self.values[code].update(self.indicators[code].update(float(tick.price)))
+                if self._chart_ok(code):
+                    self.chart_pass.add(code)
+                else:
+                    self.chart_pass.discard(code)
+            if _present(tick.foreign) and _present(tick.inst):
+                self.flows[code].update(float(tick.foreign), float(tick.inst), self.day)
+
+            member = code in self.chart_pass and self._investor_ok(code)
+            if member == (code in self.members):
+                return False
+            if member:
+                self.members.add(code)
+            else:
+                self.members.discard(code)
+            return True
+
+    def recommendations(self) -> pd.DataFrame:
+        """현재 구성 → step3 recommendations 와 같은 열 (후보 열 + 지표 열 + 플래그), 후보 순서 유지"""
+        with self.lock:
+            codes = [c for c in self.base.index if c in self.members]
+            ind = pd.DataFrame([self.values[c] for c in codes], index=codes, columns=self.value_cols)
+        out = self.base.loc[codes].reset_index(drop=True).join(ind, on="종목코드")
+        out[COL_FLAG] = True if self.investor_rules else None
+        return out
+
+
+# ====== 시작 상태 ======
+def _prev_day(day: str) -> str:
+    """YYYY-MM-DD → 전일 YYYYMMDD (완성된 일봉/투자자 이력의 상한)"""
+    return (datetime.strptime(day, "%Y-%m-%d") - timedelta(days=1)).strftime("%Y%m%d")
+
+
+def build_screen(day: str = date, ep=None, rules=None) -> StreamScreen:
+    """
+    latest/candidates → column 규칙 → 통과 종목의 전일까지 일봉/투자자 이력으로 StreamScreen 구성.
+    ep 가 있으면 캐시에 없는 이력은 키움에서 받아 채우고, 없으면(재생) 캐시만 사용.
+    """
+    rules = load_screen() if rules is None else rules
+    windows = tuple(sorted(set(INDICATOR_WINDOWS) | chart_windows(rules)))
+    until = _prev_day(day)
+
+    candidates = read_latest(BASE_DIR, "candidates")
+    base = candidates.loc[mask(candidates, tier(rules, "column"))].reset_index(drop=True)
+    REPORT.rows("screen.column", len(candidates), len(base))
+
+    bars = DailyBarCache()
+    flows = InvestorFlowCache(bar_cache=bars) if tier(rules, "investor") else None
+    closes, histories = {}, {}
+    for code in base["종목코드"]:
+        chart = bars.fetch(ep, code, limit=max(windows) + 1, until=until) if ep is not None \
+            else bars.load(code, limit=max(windows) + 1, until=until)
+        prices = to_number(chart["현재가"]).dropna().to_numpy()[::-1]   # 과거→최신
+        if len(prices) < 2:
+            print(f"[{code}] 일봉 없음 → 구독 제외")
+            continue
+        closes[code] = prices
+        if flows is not None:
+            histories[code] = flows.fetch(ep, code, until) if ep is not None \
+                else flows.load(code, until, INVESTOR_LOOKBACK)
+
+    screen = StreamScreen(base, closes, histories, rules, windows, day.replace("-", ""))
+    print(f"[Stream] 후보 {len(candidates)}개 → column 통과 {len(base)}개 → 구독 {len(closes)}개 "
+          f"(chart 통과 {len(screen.chart_pass)}개, 추천 {len(screen.members)}개)")
+    return screen
+
+
+# ====== 이벤트 소스 ======
+class ReplaySource:
+    """기록된 틱 CSV 재생. speed=0 이면 대기 없이, speed=k 면 기록 간격의 1/k 로 대기"""
+
+    def __init__(self, path: str, speed: float = 0.0):
+        self.ticks = read_typed(path, "ticks")
+        self.ticks["ts"] = pd.to_datetime(self.ticks["time"])
+        self.ticks = self.ticks.sort_values("ts", kind="stable").reset_index(drop=True)
+        self.speed = speed
+
+    def __iter__(self):
+        prev = None
+        for row in self.ticks.itertuples(index=False):
+            if self.speed > 0 and prev is not None:
+                time.sleep(max(0.0, (row.ts - prev).total_seconds()) / self.speed)
+            prev = row.ts
+            yield Tick(row.ts, row.code, row.price, row.foreign, row.inst)
+
+
+class KiwoomRealSource:
+    """
+    koapy 실시간 체결(현재가) 스트림 + opt10059 주기 조회(chart 통과 종목의 오늘 외국인/기관 순매수).
+    두 스레드가 큐에 넣은 틱을 SESSION_END 까지 순서대로 내보낸다.
+    """
+
+    def __init__(self, ep, screen: StreamScreen, day: str, poll_sec: float = INVESTOR_POLL_SEC):
+        self.ep = ep
+        self.screen = screen
+        self.day = day.replace("-", "")
+        self.poll_sec = poll_sec
+        self.queue = queue.Queue()
+        self.stop = threading.Event()
+
+    def _prices(self):
+        events = self.ep.GetRealDataForCodesAsStream(self.screen.codes(), [FID_TIME, FID_PRICE], opt_type="0")
+        for event in events:
+            if self.stop.is_set():
+                break
+            names, values = list(event.single_data.names), list(event.single_data.values)
+            if FID_PRICE not in names:
+                continue
+            price = abs(float(str(values[names.index(FID_PRICE)]).replace(",", "") or "nan"))
+            self.queue.put(Tick(datetime.now(), event.arguments[0].string_value, price, None, None))
+
+    def _today_flow(self, code: str):
+        inputs = {"일자": self.day, "종목코드": code, **OPT10059_INPUTS}
+        events = self.ep.TransactionCall("종목별투자자기관별요청", "opt10059", "0001", inputs)
+        for event in REPORT.timed_iter("tr.opt10059", events):
+            page = pd.DataFrame.from_records([v.values for v in event.multi_data.values],
+                                             columns=event.multi_data.names)
+            today = page.loc[page["일자"].astype(str).str.replace("-", "") == self.day]
+            if len(today):
+                return to_number(today["외국인투자자"]).iloc[0], to_number(today["기관계"]).iloc[0]
+            return None   # 첫 페이지(최신)만 보면 됨
+
+    def _flows(self):
+        scheduler = TRScheduler(label="Stream")
+        while not self.stop.is_set():
+            results, failed = scheduler.map(self._today_flow, self.screen.investor_targets())
+            for code, e in failed.items():
+                print(f"[WARN] 투자자 조회 오류 ({code}): {e}")
+            for code, flow in results.items():
+                if flow is not None:
+                    self.queue.put(Tick(datetime.now(), code, None, flow[0], flow[1]))
+            self.stop.wait(self.poll_sec)
+
+    def __iter__(self):
+        end = datetime.strptime(f"{self.day} {SESSION_END}", "%Y%m%d %H:%M")
+        workers = [threading.Thread(target=f, daemon=True) for f in (self._prices, self._flows)]
+        for w in workers:
+            w.start()
+        try:
+            while datetime.now() < end:
+                try:
+                    yield self.queue.get(timeout=1.0)
+                except queue.Empty:
+                    continue
+        finally:
+            self.stop.set()
+
+
+class TickRecorder:
+    """처리한 틱을 재생 가능한 CSV 로 기록"""
+
+    def __init__(self, path: str):
+        new = not os.path.exists(path)
+        self.f = open(path, "a", newline="", encoding="utf-8-sig" if new else "utf-8")
+        self.w = csv.writer(self.f)
+        if new:
+            self.w.writerow(TICK_FIELDS)
+
+    def write(self, tick: Tick):
+        self.w.writerow([pd.Timestamp(tick.time).isoformat(sep=" "), tick.code,
+                         *("" if not _present(v) else v for v in (tick.price, tick.foreign, tick.inst))])
+
+    def close(self):
+        self.f.close()
+
+
+# ====== 데몬 ======
+def publish(screen: StreamScreen) -> pd.DataFrame:
+    """현재 구성을 날짜 폴더의 recommendations_intraday 로 저장하고 latest 에 게시"""
+    recs = screen.recommendations()
+    write_and_publish(recs, DATA_DIR, INTRADAY_NAME, BASE_DIR)
+    REPORT.count("stream.publish")
+    return recs
+
+
+def _published_members():
+    """마지막으로 게시된 그날 구성 (장중 게시본, 없으면 아침 배치 recommendations, 둘 다 없으면 None)"""
+    for name in (INTRADAY_NAME, "recommendations"):
+        if has_snapshot(DATA_DIR, name):
+            return set(read_snapshot(DATA_DIR, name)["종목코드"])
+    return None
+
+
+def run(screen: StreamScreen, source, recorder: TickRecorder = None, min_interval: float = PUBLISH_MIN_SEC):
+    """
+    이벤트를 끝까지 처리. 구성이 바뀌면 (직전 게시 후 min_interval 초가 지났을 때) 게시하고,
+    끝날 때 게시 안 된 변경이 있으면 마지막으로 한 번 게시.
+    반환: 게시 횟수
+    """
+    published = _published_members()
+    pending = published != screen.members
+    last_publish, n_publish = None, 0
+
+    for tick in source:
+        t0 = time.perf_counter()
+        if recorder is not None:
+            recorder.write(tick)
+        pending |= screen.on_tick(tick)
+        REPORT.observe("stream.tick", time.perf_counter() - t0)
+
+        now = pd.Timestamp(tick.time)
+        if pending and (last_publish is None or (now - last_publish).total_seconds() >= min_interval):
+            pending = False
+            if screen.members != published:
+                before = published or set()
+                recs = publish(screen)
+                n_publish += 1
+                print(f"[{now:%H:%M:%S}] 추천 {len(recs)}개 게시 "
+                      f"(+{len(screen.members - before)} / -{len(before - screen.members)})")
+                published, last_publish = set(screen.members), now
+
+    if pending and screen.members != published:
+        recs = publish(screen)
+        n_publish += 1
+        print(f"[END] 추천 {len(recs)}개 게시")
+    return n_publish
+
+
+def parse_args():
+    p = argparse.ArgumentParser(description="장중 실시간 추천 데몬")
+    p.add_argument("--date", help="YYYY-MM-DD (기본: 오늘 / PIPELINE_DATE)")
+    p.add_argument("--replay", help="기록된 틱 CSV 재생 (키움 로그인 없음)")
+    p.add_argument("--speed", type=float, default=0.0, help="재생 배속 (0: 대기 없이)")
+    p.add_argument("--record", help="처리한 틱을 CSV 로 기록")
+    p.add_argument("--min-interval", type=float, default=PUBLISH_MIN_SEC, help="게시 최소 간격[초]")
+    return p.parse_args()
+
+
+def main():
+    args = parse_args()
+    REPORT.reset(date, "stream")
+    recorder = TickRecorder(args.record) if args.record else None
+    try:
+        if args.replay:
+            screen = build_screen(date)
+            n = run(screen, ReplaySource(args.replay, args.speed), recorder, args.min_interval)
+        else:
+            from koapy import KiwoomOpenApiPlusEntrypoint
+            with KiwoomOpenApiPlusEntrypoint() as ep:
+                ep.EnsureConnected(credentials)
+                screen = build_screen(date, ep)
+                n = run(screen, KiwoomRealSource(ep, screen, date), recorder, args.min_interval)
+    finally:
+        if recorder is not None:
+            recorder.close()
+    tick = REPORT.to_dict()["latency"].get("stream.tick", {})
+    print(f"[OK] 틱 {tick.get('count', 0)}건 (p50 {tick.get('p50_ms')}ms / p99 {tick.get('p99_ms')}ms), "
+          f"게시 {n}회, 최종 추천 {len(screen.members)}개")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,7 @@
+# -*- coding: utf-8 -*-
+"""collector 모듈은 평면 구조(python main.py 로 실행)라 테스트에서도 같은 폴더를 import 경로에 둔다"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+"""IndicatorState.advance: 하루씩 전진한 값 == 같은 일봉의 batch_indicators 전체 재계산"""
+
+import numpy as np
+import pytest
+
+from fake_entrypoint import FakeKiwoomEntrypoint
+from indicator_state import IndicatorState
+from indicators import batch_indicators
+
+CODES = ["000010", "000020", "000030", "000040"]
+
+
+@pytest.fixture
+def charts():
+    ep = FakeKiwoomEntrypoint(latency=0.0, per_second=10**9, history_days=60, as_of="2025-08-29")
+    return {c: ep.GetDailyStockDataAsDataFrame(c) for c in CODES}   # 최신→과거
+
+
+def until(chart, day):
+    return chart[chart["일자"] <= day].reset_index(drop=True)
+
+
+def assert_same(out, expect):
+    assert sorted(out.index) == sorted(expect.index)
+    np.testing.assert_allclose(out.loc[expect.index, expect.columns].to_numpy(dtype=float),
+                               expect.to_numpy(dtype=float), equal_nan=True)
+
+
+def test_advance_matches_batch(tmp_path, charts):
+    days = list(charts[CODES[0]]["일자"])
+    state = IndicatorState(path=str(tmp_path / "state.npz"))
+    assert_same(state.update({c: until(df, days[10]) for c, df in charts.items()}),
+                batch_indicators({c: until(df, days[10]) for c, df in charts.items()}))
+
+    for day in reversed(days[:10]):
+        last = state.last_days(CODES)
+        bars = {c: until(df, day).loc[lambda d: d["일자"] >= last[c]] for c, df in charts.items()}
+        assert all(len(b) == 2 for b in bars.values())   # 저장된 마지막 봉 + 새 봉
+        out, rebuild = state.advance(bars)
+        assert rebuild == []
+        assert_same(out, batch_indicators({c: until(df, day) for c, df in charts.items()}))
+
+
+def test_adjusted_close_is_rebuilt(tmp_path, charts):
+    days = list(charts[CODES[0]]["일자"])
+    state = IndicatorState(path=str(tmp_path / "state.npz"))
+    state.update({c: until(df, days[1]) for c, df in charts.items()})
+
+    bars = {c: until(df, days[0]).head(2).copy() for c, df in charts.items()}
+    bars[CODES[0]].loc[1, "현재가"] = "1"   # 수정주가: 저장된 마지막 종가와 다름
+    out, rebuild = state.advance(bars)
+    assert rebuild == [CODES[0]]
+    assert CODES[0] not in out.index
+
+    full = {c: until(df, days[0]) for c, df in charts.items()}
+    assert_same(state.update(full), batch_indicators(full))
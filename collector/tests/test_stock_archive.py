@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+import pandas as pd
+
+from stock_archive import StockArchive
+
+COLUMNS = ["일자", "외국인투자자", "기관계"]
+
+
+def frame(days, value=0):
+    """최신→과거 opt10059 형식 (값은 일자 + value 로 구분)"""
+    return pd.DataFrame([[d, int(d[-2:]) + value, -int(d[-2:])] for d in sorted(days, reverse=True)],
+                        columns=COLUMNS)
+
+
+def test_read_returns_stored_snapshot(tmp_path):
+    archive = StockArchive(str(tmp_path / "a.sqlite"))
+    first = frame(["20250103", "20250102", "20250101"])
+    second = frame(["20250106", "20250103", "20250102"], value=10)
+    archive.write("investors", "20250103", "000001", first)
+    archive.write("investors", "20250106", "000001", second)
+    pd.testing.assert_frame_equal(archive.read("investors", "000001", "20250103"), first)
+    pd.testing.assert_frame_equal(archive.read("investors", "000001", "20250106"), second)
+    assert archive.read("investors", "000001", "20250105").equals(first)
+
+
+def test_backfill_does_not_leak_into_later_snapshots(tmp_path):
+    archive = StockArchive(str(tmp_path / "a.sqlite"))
+    day3 = frame(["20250103", "20250102", "20250101"])
+    day5 = frame(["20250105", "20250103", "20250102"])
+    day4 = frame(["20250104", "20250103", "20250102"], value=100)   # 과거 기준일을 나중에 채움 (값도 다름)
+    archive.write("investors", "20250103", "000001", day3)
+    archive.write("investors", "20250105", "000001", day5)
+    archive.write("investors", "20250104", "000001", day4)
+
+    for asof, expected in (("20250103", day3), ("20250104", day4), ("20250105", day5)):
+        pd.testing.assert_frame_equal(archive.read("investors", "000001", asof), expected)
+
+
+def test_missing_day_inside_range_is_hidden(tmp_path):
+    archive = StockArchive(str(tmp_path / "a.sqlite"))
+    archive.write("investors", "20250103", "000001", frame(["20250103", "20250102", "20250101"]))
+    halted = frame(["20250106", "20250103", "20250101"])   # 20250102 빠짐
+    archive.write("investors", "20250106", "000001", halted)
+    pd.testing.assert_frame_equal(archive.read("investors", "000001", "20250106"), halted)
+    assert len(archive.read("investors", "000001", "20250103")) == 3
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+"""TRScheduler: 토큰 버킷 간격, 과부하 재투입, 재시도/2차 시도, 기한 초과 호출 처리"""
+
+import collections
+import threading
+import time
+
+import pytest
+
+import tr_scheduler
+from fake_entrypoint import FakeKiwoomEntrypoint
+from tr_scheduler import RateLimiter, TokenBucket, TRScheduler
+
+CODES = [f"{i:06d}" for i in range(1, 21)]
+
+
+@pytest.fixture(autouse=True)
+def fast_waits(monkeypatch):
+    monkeypatch.setattr(tr_scheduler, "SECOND_PASS_DELAY", 0.0)
+    monkeypatch.setattr(tr_scheduler, "BACKOFF_BASE", 0.01)
+    monkeypatch.setattr(tr_scheduler, "BREAKER_COOLDOWN", 0.05)
+
+
+def test_token_bucket_spaces_tokens():
+    bucket = TokenBucket(5, 1.0)
+    assert bucket.wait_time() == 0.0
+    bucket.take()
+    assert bucket.wait_time() == pytest.approx(0.2, abs=0.02)
+    bucket.penalize(0.5)
+    assert bucket.wait_time() == pytest.approx(0.5, abs=0.02)
+
+
+def test_rate_limiter_holds_rate():
+    limiter = RateLimiter([(20, 1.0, 1)])
+    start = time.monotonic()
+    for _ in range(5):
+        limiter.acquire()
+    # 첫 토큰은 바로, 나머지 4개는 0.05s 간격
+    assert time.monotonic() - start >= 0.18
+
+
+def test_throttled_calls_are_requeued():
+    ep = FakeKiwoomEntrypoint(latency=0.001, per_second=10**6, throttle_prob=0.3, seed=1)
+    scheduler = TRScheduler(limits=[(1000, 1.0, 1000)], throttle_cooldown=0.01, max_requeue=20,
+                            second_pass=False, log_every=100)
+    results, failed = scheduler.map(ep.GetDailyStockDataAsDataFrame, CODES)
+    assert sorted(results) == CODES
+    assert failed == {}
+    assert ep.calls["throttled"] > 0
+    assert scheduler.throttled == ep.calls["throttled"]
+    assert scheduler.retried == 0   # 과부하는 재시도 횟수를 쓰지 않음
+
+
+def test_retry_then_second_pass():
+    calls = collections.Counter()
+    lock = threading.Lock()
+
+    def fn(code):
+        with lock:
+            calls[code] += 1
+            n = calls[code]
+        if code == "000001" and n <= 2:
+            raise RuntimeError("일시 오류")      # 재시도 1회로는 모자라고 2차 시도에서 성공
+        if code == "000002":
+            raise ValueError("잘못된 응답")      # fatal: 다시 보내지 않음
+        return code
+
+    scheduler = TRScheduler(limits=[(1000, 1.0, 1000)], max_retries=1, log_every=100)
+    results, failed = scheduler.map(fn, CODES[:5])
+    assert sorted(results) == ["000001", "000003", "000004", "000005"]
+    assert list(failed) == ["000002"]
+    assert calls["000001"] == 3
+    assert calls["000002"] == 1
+    assert scheduler.retried == 1
+
+
+def test_stalled_calls_time_out_and_reset_pool():
+    reconnects = []
+    stalled = {"000001", "000002"}
+    release = threading.Event()
+
+    def fn(code):
+        if code in stalled:
+            stalled.discard(code)
+            release.wait(5.0)
+        return code
+
+    scheduler = TRScheduler(limits=[(1000, 1.0, 1000)], max_in_flight=2, call_timeout=0.2,
+                            reconnect=lambda: reconnects.append(1), log_every=100)
+    try:
+        results, failed = scheduler.map(fn, CODES[:6])
+    finally:
+        release.set()
+    # 기한을 넘긴 두 호출이 슬롯을 모두 묶음 → 차단기 열고(재연결) 새 풀에서 재시도해 성공
+    assert sorted(results) == CODES[:6]
+    assert failed == {}
+    assert reconnects == [1]
+    assert scheduler.retried == 2
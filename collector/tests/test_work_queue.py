@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+"""WorkQueue: 임대 만료 작업 회수, 재투입 한도"""
+
+import time
+
+import pytest
+
+import work_queue
+from work_queue import WorkQueue
+
+
+@pytest.fixture
+def queue(tmp_path, monkeypatch):
+    monkeypatch.setattr(work_queue, "LEASE_SEC", 0.05)
+    q = WorkQueue(str(tmp_path / "queue.sqlite"))
+    run = q.open_run("2025-08-27")
+    q.enqueue(run, "chart", ["000001", "000002"], priorities=[1, 0])
+    return q, run
+
+
+def test_claim_in_priority_order(queue):
+    q, run = queue
+    jobs = q.claim(run, "w1")
+    assert [j.code for j in jobs] == ["000002", "000001"]
+    assert q.claim(run, "w2") == []
+
+
+def test_expired_lease_is_reclaimed(queue):
+    q, run = queue
+    first = q.claim(run, "w1", n=1)[0]
+    time.sleep(0.1)   # w1 이 하트비트 없이 멈춤 → 임대 만료
+    again = q.claim(run, "w2", n=2)
+    assert [j.id for j in again].count(first.id) == 1
+
+    # 늦게 끝난 w1 의 완료는 무시되고, 새로 가져간 w2 의 완료만 반영
+    q.complete(first.id, "w1", {"rows": 1})
+    assert q.outcomes(run, "chart", [first.code]) == {}
+    q.complete(first.id, "w2", {"rows": 1})
+    assert q.outcomes(run, "chart", [first.code]) == {first.code: ("done", None)}
+
+
+def test_heartbeat_keeps_lease(queue):
+    q, run = queue
+    q.register(run, "w1")
+    q.claim(run, "w1")
+    for _ in range(3):
+        time.sleep(0.03)
+        q.heartbeat(run, "w1")
+    assert q.claim(run, "w2") == []
+
+
+def test_lease_expiry_fails_after_max_attempts(queue, monkeypatch):
+    monkeypatch.setattr(work_queue, "MAX_ATTEMPTS", 2)
+    q, run = queue
+    for worker in ("w1", "w2"):
+        assert len(q.claim(run, worker)) == 2
+        time.sleep(0.1)
+    assert q.claim(run, "w3") == []
+    states = q.outcomes(run, "chart", ["000001", "000002"])
+    assert {state for state, _ in states.values()} == {"failed"}
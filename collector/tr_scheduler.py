@@ -0,0 +1,444 @@
+# -*- coding: utf-8 -*-
+"""
+키움 TR 스케줄러
+
+KiwoomOpenApiPlusEntrypoint 호출 앞단에서
+  - 토큰 버킷으로 키움 조회 TR 제한(초당/시간당)을 지키고
+  - 동시에 진행 중인 요청 수를 제한한 채 스레드 풀로 요청을 파이프라이닝하며
+  - 우선순위(예: 순위)가 높은 종목부터 처리하고 대기열 깊이를 보고한다.
+시세조회 과부하(-200) 응답을 받으면 버킷을 잠시 비우고 해당 종목을 대기열에 다시 넣는다.
+
+장애 대응
+  - 오류 분류(classify_error): throttle / timeout / empty(빈 응답) / disconnected(세션 끊김) / fatal / error
+  - fatal 이 아닌 실패는 지터 백오프 후 재시도, 그래도 실패한 종목은 본 루프가 끝난 뒤 모아서 2차 시도
+  - 호출마다 기한(CALL_TIMEOUT, 워커 스레드가 실제로 호출을 시작한 시각부터) — 넘기면 기다리지 않고
+    timeout 으로 처리해 꼬리 지연을 묶어 둠. 버린 호출은 끝날 때까지 동시 요청 수에 그대로 세고,
+    버린 호출이 MAX_IN_FLIGHT 개에 이르면(세션 먹통) 차단기를 열어 재연결하고 스레드 풀을 새로 만듦
+  - 차단기(CircuitBreaker): 연속 실패/세션 끊김이면 발송을 멈추고 재연결 후 시험 요청 1건으로 재개
+토큰 대기 시간 / 호출 지연 / 과부하 재투입 / 재시도 / 차단기 / 커버리지는 run_report 에 {label}.* 로 기록한다.
+"""
+
+import collections
+import heapq
+import itertools
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import pandas as pd
+
+from run_report import REPORT
+
+# 키움 조회 TR 제한: (허용 건수, 기간[초], 순간 최대 허용 건수)
+TR_LIMITS = [(5, 1.0, 1), (1000, 3600.0, 1000)]
+
+# 동시에 진행할 최대 요청 수
+MAX_IN_FLIGHT = 4
+
+# 과부하 응답 시 버킷 정지 시간[초] / 같은 종목 재투입 최대 횟수
+THROTTLE_COOLDOWN = 1.0
+MAX_REQUEUE = 3
+
+# 과부하 외 실패 재시도 횟수 / 백오프 기본·최대[초]
+MAX_RETRIES = 2
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 8.0
+
+# 호출 1건 기한[초]
+CALL_TIMEOUT = 30.0
+
+# 본 루프 뒤 실패 종목 2차 시도 여부 / 시작 전 대기[초]
+SECOND_PASS = True
+SECOND_PASS_DELAY = 3.0
+
+# 차단기: 연속 실패 횟수 / 첫 정지 시간[초] / 최대 정지 시간[초] / 이 횟수 넘게 열리면 중단
+BREAKER_THRESHOLD = 5
+BREAKER_COOLDOWN = 5.0
+BREAKER_MAX_COOLDOWN = 60.0
+BREAKER_MAX_TRIPS = 3
+PROBE_POLL = 0.1
+
+
+class ThrottleError(RuntimeError):
+    """키움 시세조회 과부하(-200) 응답"""
+
+
+class EmptyResponseError(RuntimeError):
+    """TR 응답에 데이터 행이 없음"""
+
+
+class CallTimeoutError(TimeoutError):
+    """호출이 CALL_TIMEOUT 안에 끝나지 않음"""
+
+
+class CircuitOpenError(RuntimeError):
+    """차단기가 닫히지 않아 요청하지 않음"""
+
+
+def is_throttle_error(e: Exception) -> bool:
+    if isinstance(e, ThrottleError):
+        return True
+    msg = str(e)
+    return "-200" in msg or "과부하" in msg or "OP_ERR_SISE_OVERFLOW" in msg
+
+
+# 키움 접속 오류: -100 사용자정보교환실패, -101 서버접속실패, -102 버전처리실패, -106 통신연결종료
+_DISCONNECT_MARKS = ("-100", "-101", "-102", "-106", "OP_ERR_SOCKET_CLOSED", "OP_ERR_CONNECT",
+                     "연결", "접속", "disconnect", "not connected")
+
+# 코드 오류 — 다시 보내도 같은 결과
+_FATAL_TYPES = (KeyError, TypeError, ValueError, AttributeError, NotImplementedError)
+
+
+def classify_error(e: Exception) -> str:
+    """throttle / timeout / empty / disconnected / fatal / error"""
+    if is_throttle_error(e):
+        return "throttle"
+    if isinstance(e, (CallTimeoutError, TimeoutError)):
+        return "timeout"
+    if isinstance(e, EmptyResponseError):
+        return "empty"
+    msg = str(e)
+    if isinstance(e, (CircuitOpenError, ConnectionError)) or any(m in msg for m in _DISCONNECT_MARKS):
+        return "disconnected"
+    if isinstance(e, _FATAL_TYPES):
+        return "fatal"
+    return "error"
+
+
+class TokenBucket:
+    """per_sec 초마다 count 건씩 고르게 채우는 토큰 버킷, 최대 burst 건 적립 (스레드 안전)"""
+
+    def __init__(self, count: int, per_sec: float, burst: int = 1):
+        self.capacity = float(max(1, burst))
+        self.rate = count / per_sec
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self) -> float:
+        """토큰 1개를 얻기까지 남은 시간 (0이면 즉시 가능)"""
+        with self.lock:
+            now = time.monotonic()
+            self._refill(now)
+            if now < self.blocked_until:
+                return self.blocked_until - now
+            if self.tokens >= 1.0:
+                return 0.0
+            return (1.0 - self.tokens) / self.rate
+
+    def take(self):
+        with self.lock:
+            self._refill(time.monotonic())
+            self.tokens -= 1.0
+
+    def penalize(self, seconds: float):
+        """과부하 응답: seconds 동안 발급 중지"""
+        with self.lock:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+
+class RateLimiter:
+    """여러 토큰 버킷(초당/시간당 등)을 모두 만족할 때까지 대기"""
+
+    def __init__(self, limits=None):
+        # None 이면 생성 시점의 TR_LIMITS 사용 (백필 워커가 모듈 값을 나눠 쓰도록 바꿀 수 있음)
+        self.buckets = [TokenBucket(*lim) for lim in (limits if limits is not None else TR_LIMITS)]
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        with self.lock:
+            while True:
+                delay = max(b.wait_time() for b in self.buckets)
+                if delay <= 0:
+                    break
+                time.sleep(delay)
+            for b in self.buckets:
+                b.take()
+
+    def penalize(self, seconds: float):
+        for b in self.buckets:
+            b.penalize(seconds)
+
+
+class CircuitBreaker:
+    """
+    연속 실패 차단기 (map 루프 스레드에서만 호출)
+      closed    : 정상 발송. 과부하 외 오류가 threshold 번 이어지거나 세션 끊김이면 open
+      open      : cooldown 동안 발송 중지 (열릴 때마다 두 배, 최대 BREAKER_MAX_COOLDOWN). on_open() 으로 재연결 시도
+      half_open : 시험 요청 1건만 발송 → 성공하면 closed, 실패하면 다시 open
+    max_trips 번 넘게 열리면 exhausted — 남은 종목은 보내지 않고 실패 처리
+    """
+
+    def __init__(self, threshold: int = None, cooldown: float = None, max_trips: int = None,
+                 on_open=None, label: str = "TR"):
+        self.threshold = BREAKER_THRESHOLD if threshold is None else threshold
+        self.cooldown = BREAKER_COOLDOWN if cooldown is None else cooldown
+        self.max_trips = BREAKER_MAX_TRIPS if max_trips is None else max_trips
+        self.on_open = on_open
+        self.label = label
+        self.key = label.lower()
+        self.state = "closed"
+        self.failures = 0
+        self.trips = 0
+        self.open_until = 0.0
+        self.probing = False
+
+    @property
+    def exhausted(self) -> bool:
+        return self.trips > self.max_trips
+
+    def wait_time(self) -> float:
+        """발송 가능까지 남은 시간 (0이면 즉시)"""
+        if self.state == "open":
+            left = self.open_until - time.monotonic()
+            if left > 0:
+                return left
+            self.state, self.probing = "half_open", False
+        if self.state == "half_open" and self.probing:
+            return PROBE_POLL
+        return 0.0
+
+    def dispatched(self):
+        if self.state == "half_open":
+            self.probing = True
+
+    def success(self):
+        if self.state != "closed":
+            print(f"[{self.label}] 차단기 닫힘 (시험 요청 성공)")
+        self.state, self.failures, self.probing = "closed", 0, False
+
+    def failure(self, kind: str):
+        if self.state == "open":
+            return   # 열리기 전에 보낸 요청의 실패
+        self.failures += 1
+        if self.state == "half_open" or kind == "disconnected" or self.failures >= self.threshold:
+            self._open(kind)
+
+    def _open(self, kind: str):
+        self.trips += 1
+        wait = min(self.cooldown * 2 ** (self.trips - 1), BREAKER_MAX_COOLDOWN)
+        self.state, self.failures, self.probing = "open", 0, False
+        self.open_until = time.monotonic() + wait
+        REPORT.count(f"{self.key}.breaker_open")
+        if self.exhausted:
+            print(f"[{self.label}] 차단기 {self.trips}회 열림 ({kind}) → 남은 요청 중단")
+            return
+        print(f"[{self.label}] 차단기 열림 ({kind}) → {wait:.1f}s 발송 중지")
+        if self.on_open is not None:
+            try:
+                self.on_open()
+            except Exception as e:
+                print(f"[{self.label}] 재연결 실패: {e}")
+
+
+def backoff_delay(attempt: int) -> float:
+    """attempt 번째 재시도 대기: BACKOFF_BASE * 2^attempt (최대 BACKOFF_MAX) × 0.5~1.5 지터"""
+    return min(BACKOFF_BASE * 2 ** attempt, BACKOFF_MAX) * random.uniform(0.5, 1.5)
+
+
+class TRScheduler:
+    def __init__(self, limits=None, max_in_flight: int = MAX_IN_FLIGHT,
+                 throttle_cooldown: float = THROTTLE_COOLDOWN, max_requeue: int = MAX_REQUEUE,
+                 label: str = "TR", log_every: int = 5, max_retries: int = MAX_RETRIES,
+                 call_timeout: float = CALL_TIMEOUT, second_pass: bool = SECOND_PASS, reconnect=None):
+        self.limiter = RateLimiter(limits)
+        self.max_in_flight = max(1, int(max_in_flight))
+        self.throttle_cooldown = throttle_cooldown
+        self.max_requeue = max_requeue
+        self.max_retries = max_retries
+        self.call_timeout = call_timeout
+        self.second_pass = second_pass
+        self.label = label
+        self.key = label.lower()   # run_report 이름
+        self.log_every = log_every
+        self.breaker = CircuitBreaker(on_open=reconnect, label=label)
+        self.queue_depth = 0
+        self.in_flight = 0
+        self.throttled = 0
+        self.retried = 0
+
+    def _report(self, done: int, total: int):
+        print(f"[{self.label}] 진행: {done}/{total} | 대기열 {self.queue_depth} | 요청중 {self.in_flight} "
+              f"| 과부하 {self.throttled} | 재시도 {self.retried}")
+
+    def map(self, fn, items, priorities=None, on_result=None):
+        """
+        items 각각에 fn(item)을 호출. priorities 값이 작을수록 먼저 보냄.
+        on_result(item, result, error) 콜백은 종목별 최종 결과마다 한 번 호출(메인 스레드)
+        — 성공은 완료 즉시, 실패는 2차 시도까지 끝난 뒤.
+        반환: (results{item: 결과}, errors{item: 예외})
+        """
+        items = list(items)
+        prios = list(priorities) if priorities is not None else [0] * len(items)
+        order = dict(zip(items, prios))
+        results, failed = self._drain(fn, items, order, on_result, self.max_retries)
+
+        # 본 루프에서 재시도까지 실패한 종목: 잠시 쉰 뒤 한 번에 다시 (일시 장애가 지나가도록)
+        retry = [item for item, e in failed.items() if classify_error(e) != "fatal"]
+        recovered = 0
+        if retry and self.second_pass and not self.breaker.exhausted:
+            print(f"[{self.label}] 2차 시도: 실패 {len(retry)}개 ({SECOND_PASS_DELAY:.0f}s 후)")
+            time.sleep(SECOND_PASS_DELAY)
+            REPORT.count(f"{self.key}.second_pass", len(retry))
+            again, still = self._drain(fn, retry, order, on_result, 0)
+            recovered = len(again)
+            REPORT.count(f"{self.key}.recovered", recovered)
+            results.update(again)
+            for item in retry:
+                failed.pop(item)
+            failed.update(still)
+
+        for item, err in failed.items():
+            REPORT.count(f"{self.key}.errors")
+            REPORT.count(f"{self.key}.failed.{classify_error(err)}")
+            if on_result is not None:
+                on_result(item, None, err)
+
+        REPORT.rows(f"{self.key}.coverage", len(items), len(results))
+        if items:
+            kinds = collections.Counter(classify_error(e) for e in failed.values())
+            print(f"[{self.label}] 커버리지 {len(results)}/{len(items)} ({len(results) / len(items):.1%}) "
+                  f"| 재시도 {self.retried} | 2차 복구 {recovered} | 실패 {len(failed)}"
+                  + (f" {dict(kinds)}" if kinds else ""))
+        return results, failed
+
+    @staticmethod
+    def _timed(fn, item, box: dict):
+        """워커 스레드에서 실제 호출 시작 시각을 남기고 fn(item) 실행 (기한은 이 시각부터)"""
+        box["started"] = time.monotonic()
+        return fn(item)
+
+    def _drain(self, fn, items, order, on_result, max_retries):
+        """
+        한 번의 발송 루프. 실패는 오류 종류별로
+          throttle : 버킷 정지 후 바로 재투입 (max_requeue 회까지, 차단기 실패로 세지 않음)
+          fatal    : 재시도 없이 실패
+          그 밖    : 지터 백오프 후 재투입 (max_retries 회까지)
+        호출이 시작 후 call_timeout 을 넘기면 기다리지 않고 timeout 실패로 처리.
+        버린 호출(stuck)은 끝날 때까지 요청 중으로 세어 그만큼 새 요청을 덜 보내고,
+        max_in_flight 개가 모두 묶이면 차단기(disconnected)를 열고 새 스레드 풀로 바꾼다.
+        반환: (results, failed)
+        """
+        seq = itertools.count()
+        heap = [(order[item], next(seq), item, 0, 0) for item in items]   # (우선순위, 순서, 종목, 재시도, 재투입)
+        heapq.heapify(heap)
+        delayed = []   # (재투입 시각, 항목)
+
+        results, failed = {}, {}
+        pending = {}   # future → (항목, {"started": 호출 시작 시각})
+        stuck = set()  # 기한을 넘겨 버렸지만 아직 돌고 있는 호출
+        total, done = len(items), 0
+        pool = ThreadPoolExecutor(max_workers=self.max_in_flight * 2)
+        try:
+            while heap or delayed or pending:
+                late = {fut for fut in stuck if fut.done()}
+                if late:
+                    REPORT.count(f"{self.key}.late_return", len(late))
+                    stuck -= late
+                if len(stuck) >= self.max_in_flight:
+                    # 버린 호출이 슬롯을 다 차지: 세션이 먹통 → 차단기 열고(재연결) 풀을 새로 만듦
+                    print(f"[{self.label}] 응답 없는 호출 {len(stuck)}개 → 스레드 풀 교체")
+                    REPORT.count(f"{self.key}.pool_reset")
+                    self.breaker.failure("disconnected")
+                    pool.shutdown(wait=False)
+                    pool = ThreadPoolExecutor(max_workers=self.max_in_flight * 2)
+                    stuck = set()
+                now = time.monotonic()
+                while delayed and delayed[0][0] <= now:
+                    heapq.heappush(heap, heapq.heappop(delayed)[1])
+                if self.breaker.exhausted and (heap or delayed):
+                    # 세션이 돌아오지 않음: 남은 종목은 보내지 않음
+                    for entry in heap + [d[1] for d in delayed]:
+                        failed[entry[2]] = CircuitOpenError(f"{self.label} 차단기 열림 — 요청하지 않음")
+                        done += 1
+                    heap, delayed = [], []
+
+                # 여유 슬롯만큼 토큰을 받아 요청 발송 (차단기가 열려 있으면 대기)
+                hold = 0.0
+                while heap and len(pending) + len(stuck) < self.max_in_flight:
+                    hold = self.breaker.wait_time()
+                    if hold > 0:
+                        break
+                    entry = heapq.heappop(heap)
+                    t0 = time.perf_counter()
+                    self.limiter.acquire()
+                    REPORT.observe(f"{self.key}.rate_wait", time.perf_counter() - t0)
+                    self.breaker.dispatched()
+                    box = {"started": None}
+                    pending[pool.submit(self._timed, fn, entry[2], box)] = (entry, box)
+                self.queue_depth, self.in_flight = len(heap) + len(delayed), len(pending) + len(stuck)
+                if not (heap or delayed or pending):
+                    break
+
+                # 다음에 깨어날 시각: 가장 이른 호출 기한 / 백오프 재투입 / 차단기 재개 / 버린 호출 확인
+                now = time.monotonic()
+                wake = [box["started"] + self.call_timeout - now
+                        for _, box in pending.values() if box["started"] is not None]
+                if delayed:
+                    wake.append(delayed[0][0] - now)
+                if heap and hold > 0:
+                    wake.append(hold)
+                if stuck:
+                    wake.append(PROBE_POLL)
+                timeout = max(min(wake), 0.0) if wake else None
+                if not pending:
+                    time.sleep(timeout or 0.0)
+                    continue
+                finished, _ = wait(list(pending), timeout=timeout, return_when=FIRST_COMPLETED)
+
+                now = time.monotonic()
+                outcomes = [(fut, fut.exception()) for fut in finished]
+                for fut, (_, box) in list(pending.items()):
+                    started = box["started"]
+                    if fut not in finished and started is not None and now - started >= self.call_timeout:
+                        stuck.add(fut)
+                        REPORT.count(f"{self.key}.abandoned")
+                        outcomes.append((fut, CallTimeoutError(f"{self.call_timeout:.0f}s 안에 응답 없음")))
+
+                for fut, err in outcomes:
+                    (prio, _, item, attempt, requeue), box = pending.pop(fut)
+                    REPORT.observe(f"{self.key}.call", now - (box["started"] or now), error=err is not None)
+                    if err is None:
+                        self.breaker.success()
+                        results[item] = fut.result()
+                        if on_result is not None:
+                            on_result(item, results[item], None)
+                    else:
+                        kind = classify_error(err)
+                        if kind == "throttle" and requeue < self.max_requeue:
+                            # 과부하: 버킷 정지 후 같은 우선순위로 재투입
+                            self.throttled += 1
+                            REPORT.count(f"{self.key}.throttled")
+                            self.limiter.penalize(self.throttle_cooldown)
+                            heapq.heappush(heap, (prio, next(seq), item, attempt, requeue + 1))
+                            continue
+                        self.breaker.failure(kind)
+                        if kind != "fatal" and attempt < max_retries and not self.breaker.exhausted:
+                            self.retried += 1
+                            REPORT.count(f"{self.key}.retried.{kind}")
+                            heapq.heappush(delayed, (now + backoff_delay(attempt),
+                                                     (prio, next(seq), item, attempt + 1, requeue)))
+                            continue
+                        failed[item] = err
+                    done += 1
+                    self.queue_depth, self.in_flight = len(heap) + len(delayed), len(pending) + len(stuck)
+                    if done % self.log_every == 0 or done == total:
+                        self._report(done, total)
+        finally:
+            # 응답 없는 호출이 남았으면 기다리지 않음
+            pool.shutdown(wait=not stuck)
+        return results, failed
+
+
+def rank_priorities(df, col: str = "순위"):
+    """DataFrame의 순위 열을 우선순위로 사용 (없거나 비숫자면 뒤로)"""
+    if col not in df.columns:
+        return None
+    return pd.to_numeric(df[col], errors="coerce").fillna(float("inf")).tolist()
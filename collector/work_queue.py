@@ -0,0 +1,470 @@
+# -*- coding: utf-8 -*-
+"""
+종목별 TR 작업 큐 (SQLite) — 여러 워커 프로세스/계정으로 조회 분산
+
+main.py --mode queue 는 step2 일봉(chart) / step3 투자자(investor) 조회를 종목별 작업으로 큐에 넣고,
+워커 프로세스 N개가 각자 키움 세션(계정)으로 작업을 가져가 실행한다.
+  - 워커는 작업을 임대(lease)해 가져가고, 하트비트 스레드가 LEASE_SEC 임대를 계속 연장
+    → 워커가 죽으면 임대가 끝난 작업을 다른 워커가 다시 가져감 (MAX_ATTEMPTS 회까지)
+  - 작업 결과는 일봉/투자자 로컬 캐시(SQLite, 프로세스 간 공유)에 채워지고,
+    조정자(main)는 완료된 종목을 캐시에서 읽어 기존 step2/step3 계산으로 metrics_all / recommendations 를 만든다
+  - 워커 안에서는 TRScheduler 가 그 세션의 TR 제한·재시도·차단기를 그대로 맡는다
+계정마다 세션 TR 제한이 따로라, 계정 N개면 조회 처리량도 N배가 된다.
+(같은 계정을 여러 워커가 나눠 쓰면 TR 제한도 워커끼리 나눔)
+
+사용 예)
+  python main.py --mode queue --queue-workers 3 --accounts accounts.json
+  python main.py --mode queue --queue-workers 4 --fake-kiwoom      # 가짜 키움으로 확인 (리눅스 가능)
+  python work_queue.py status                                      # 실행별 작업 상태
+accounts.json: [{"user_id": ..., "user_password": ..., "cert_password": ..., "is_simulation": true, ...}, ...]
+"""
+
+import argparse
+import contextlib
+import json
+import multiprocessing
+import os
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime
+
+from common import connect_sqlite
+from price_cache import CACHE_DIR, DailyBarCache
+from run_report import REPORT
+from tr_scheduler import TRScheduler, classify_error
+
+QUEUE_DB = os.path.join(CACHE_DIR, "work_queue.sqlite")
+
+# 임대 시간 / 하트비트 주기 / 빈 큐 확인 주기[초]
+LEASE_SEC = 60.0
+HEARTBEAT_SEC = 15.0
+POLL_SEC = 0.5
+
+# 워커가 한 번에 가져가는 작업 수 (워커 안 TRScheduler 로 파이프라이닝)
+CLAIM_BATCH = 20
+
+# 한 작업을 워커에 넘기는 최대 횟수 (임대 만료/세션 오류 재투입 포함)
+MAX_ATTEMPTS = 3
+
+# 조정자: 이 시간 동안 완료되는 작업이 없고 살아 있는 워커도 없으면 남은 작업 실패 처리[초]
+STALL_SEC = 300.0
+
+# 완료된 실행 기록 보관 기간[일]
+KEEP_DAYS = 7
+
+# 워커를 다른 워커에 다시 넘길 오류 종류 (세션/일시 장애) — 나머지는 실패 확정
+REQUEUE_KINDS = ("timeout", "disconnected", "error")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id          INTEGER PRIMARY KEY,
+    run         TEXT NOT NULL,                  -- 실행 식별자 (기준일@시작시각)
+    kind        TEXT NOT NULL,                  -- chart / investor
+    code        TEXT NOT NULL,
+    params      TEXT,                           -- JSON
+    priority    REAL DEFAULT 0,
+    state       TEXT NOT NULL DEFAULT 'queued', -- queued / leased / done / failed
+    attempts    INTEGER DEFAULT 0,
+    worker      TEXT,
+    lease_until REAL,
+    result      TEXT,
+    error       TEXT,
+    updated     REAL,
+    UNIQUE (run, kind, code)
+);
+CREATE INDEX IF NOT EXISTS jobs_claim ON jobs (run, state, priority);
+CREATE TABLE IF NOT EXISTS workers (
+    worker    TEXT PRIMARY KEY,
+    run       TEXT,
+    pid       INTEGER,
+    heartbeat REAL,
+    done      INTEGER DEFAULT 0,
+    failed    INTEGER DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS runs (
+    run     TEXT PRIMARY KEY,
+    created REAL,
+    closed  INTEGER DEFAULT 0
+);
+"""
+
+Job = namedtuple("Job", ["id", "kind", "code", "params", "priority"])
+
+
+# ====== 작업 종류 (워커에서 실행: 결과는 로컬 캐시에 채움) ======
+def _chart_job(ep, code: str, params: dict):
+    chart = DailyBarCache().fetch(ep, code, limit=1, until=params.get("until"))
+    return {"rows": len(chart)}
+
+
+def _investor_job(ep, code: str, params: dict):
+    from investor_cache import InvestorFlowCache
+    data = InvestorFlowCache(bar_cache=DailyBarCache()).fetch(ep, code, params["fromdate"])
+    return {"rows": len(data)}
+
+
+JOB_KINDS = {
+    "chart": _chart_job,
+    "investor": _investor_job,
+}
+
+
+# ====== 큐 ======
+class WorkQueue:
+    def __init__(self, path: str = QUEUE_DB):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        con = self._connect()
+        try:
+            con.executescript(_SCHEMA)
+        finally:
+            con.close()
+
+    def _connect(self):
+        # 트랜잭션은 직접 관리 (autocommit 연결 + BEGIN IMMEDIATE)
+        return connect_sqlite(self.path, isolation_level=None)
+
+    @contextlib.contextmanager
+    def _txn(self):
+        """BEGIN IMMEDIATE … COMMIT (쓰기 잠금을 먼저 잡아 작업 임대가 워커끼리 겹치지 않게)"""
+        con = self._connect()
+        try:
+            con.execute("BEGIN IMMEDIATE")
+            yield con
+            con.execute("COMMIT")
+        except BaseException:
+            con.execute("ROLLBACK")
+            raise
+        finally:
+            con.close()
+
+    # ----- 실행 -----
+    def open_run(self, date: str) -> str:
+        """새 실행 등록 (오래된 완료 실행 정리). 반환: 실행 식별자"""
+        run = f"{date}@{datetime.now().strftime('%H%M%S%f')}"
+        now = time.time()
+        with self._txn() as con:
+            old = [r[0] for r in con.execute("SELECT run FROM runs WHERE closed=1 AND created<?",
+                                             (now - KEEP_DAYS * 86400,))]
+            for r in old:
+                con.execute("DELETE FROM jobs WHERE run=?", (r,))
+                con.execute("DELETE FROM workers WHERE run=?", (r,))
+                con.execute("DELETE FROM runs WHERE run=?", (r,))
+            con.execute("INSERT INTO runs (run, created) VALUES (?, ?)", (run, now))
+        return run
+
+    def close_run(self, run: str):
+        """워커에게 종료 신호 (남은 작업이 없으면 워커가 빠져나감)"""
+        with self._txn() as con:
+            con.execute("UPDATE runs SET closed=1 WHERE run=?", (run,))
+
+    def closed(self, run: str) -> bool:
+        con = self._connect()
+        try:
+            row = con.execute("SELECT closed FROM runs WHERE run=?", (run,)).fetchone()
+        finally:
+            con.close()
+        return row is None or bool(row[0])
+
+    # ----- 조정자 -----
+    def enqueue(self, run: str, kind: str, codes, priorities=None, params: dict = None) -> int:
+        """종목별 작업 추가 (이미 있는 작업은 그대로, 실패한 작업은 다시 대기)"""
+        codes = list(codes)
+        prios = list(priorities) if priorities is not None else [0] * len(codes)
+        payload = json.dumps(params or {})
+        now = time.time()
+        with self._txn() as con:
+            con.executemany(
+                "INSERT OR IGNORE INTO jobs (run, kind, code, params, priority, updated) VALUES (?, ?, ?, ?, ?, ?)",
+                [(run, kind, c, payload, float(p), now) for c, p in zip(codes, prios)],
+            )
+            con.executemany(
+                "UPDATE jobs SET state='queued', attempts=0, error=NULL, updated=? "
+                "WHERE run=? AND kind=? AND code=? AND state='failed'",
+                [(now, run, kind, c) for c in codes],
+            )
+        return len(codes)
+
+    def outcomes(self, run: str, kind: str, codes) -> dict:
+        """{종목: (상태, 오류)} — 끝난(done/failed) 작업만"""
+        con = self._connect()
+        try:
+            rows = con.execute(
+                "SELECT code, state, error FROM jobs WHERE run=? AND kind=? AND state IN ('done', 'failed')",
+                (run, kind),
+            ).fetchall()
+        finally:
+            con.close()
+        wanted = set(codes)
+        return {code: (state, error) for code, state, error in rows if code in wanted}
+
+    def live_workers(self, run: str) -> int:
+        """최근 임대 시간 안에 하트비트를 보낸 워커 수"""
+        con = self._connect()
+        try:
+            row = con.execute("SELECT COUNT(*) FROM workers WHERE run=? AND heartbeat>?",
+                              (run, time.time() - LEASE_SEC)).fetchone()
+        finally:
+            con.close()
+        return int(row[0])
+
+    def fail_pending(self, run: str, kind: str, reason: str) -> int:
+        with self._txn() as con:
+            cur = con.execute("UPDATE jobs SET state='failed', error=?, updated=? "
+                              "WHERE run=? AND kind=? AND state IN ('queued', 'leased')",
+                              (reason, time.time(), run, kind))
+            return cur.rowcount
+
+    def status(self, run: str = None) -> list:
+        """[(실행, 종류, 상태, 개수)]"""
+        con = self._connect()
+        try:
+            sql = "SELECT run, kind, state, COUNT(*) FROM jobs"
+            args = ()
+            if run:
+                sql += " WHERE run=?"
+                args = (run,)
+            return con.execute(sql + " GROUP BY run, kind, state ORDER BY run, kind, state", args).fetchall()
+        finally:
+            con.close()
+
+    # ----- 워커 -----
+    def register(self, run: str, worker: str):
+        with self._txn() as con:
+            con.execute("INSERT OR REPLACE INTO workers (worker, run, pid, heartbeat) VALUES (?, ?, ?, ?)",
+                        (worker, run, os.getpid(), time.time()))
+
+    def claim(self, run: str, worker: str, n: int = CLAIM_BATCH) -> list:
+        """대기 작업(또는 임대가 끝난 작업) 최대 n개를 우선순위 순으로 임대"""
+        now = time.time()
+        with self._txn() as con:
+            # 임대가 끝났는데 이미 MAX_ATTEMPTS 번 넘겨진 작업은 실패 확정
+            con.execute("UPDATE jobs SET state='failed', error='임대 만료 (워커 응답 없음)', updated=? "
+                        "WHERE run=? AND state='leased' AND lease_until<? AND attempts>=?",
+                        (now, run, now, MAX_ATTEMPTS))
+            rows = con.execute(
+                "SELECT id, kind, code, params, priority FROM jobs "
+                "WHERE run=? AND (state='queued' OR (state='leased' AND lease_until<?)) "
+                "ORDER BY priority, id LIMIT ?",
+                (run, now, int(n)),
+            ).fetchall()
+            con.executemany(
+                "UPDATE jobs SET state='leased', worker=?, lease_until=?, attempts=attempts+1, updated=? WHERE id=?",
+                [(worker, now + LEASE_SEC, now, r[0]) for r in rows],
+            )
+        return [Job(*r) for r in rows]
+
+    def heartbeat(self, run: str, worker: str):
+        """워커 생존 표시 + 이 워커가 가진 임대 연장"""
+        now = time.time()
+        with self._txn() as con:
+            con.execute("UPDATE workers SET heartbeat=? WHERE worker=?", (now, worker))
+            con.execute("UPDATE jobs SET lease_until=? WHERE run=? AND worker=? AND state='leased'",
+                        (now + LEASE_SEC, run, worker))
+
+    def complete(self, job_id: int, worker: str, result=None):
+        with self._txn() as con:
+            con.execute("UPDATE jobs SET state='done', result=?, error=NULL, updated=? WHERE id=? AND worker=?",
+                        (json.dumps(result, default=str), time.time(), job_id, worker))
+            con.execute("UPDATE workers SET done=done+1 WHERE worker=?", (worker,))
+
+    def fail(self, job_id: int, worker: str, error: Exception):
+        """세션/일시 장애면 다른 워커가 가져가도록 대기로 되돌림 (MAX_ATTEMPTS 까지), 아니면 실패 확정"""
+        kind = classify_error(error)
+        with self._txn() as con:
+            row = con.execute("SELECT attempts FROM jobs WHERE id=?", (job_id,)).fetchone()
+            retry = row is not None and row[0] < MAX_ATTEMPTS and kind in REQUEUE_KINDS
+            con.execute("UPDATE jobs SET state=?, error=?, worker=NULL, updated=? WHERE id=? AND worker=?",
+                        ("queued" if retry else "failed", f"{kind}: {error}", time.time(), job_id, worker))
+            if not retry:
+                con.execute("UPDATE workers SET failed=failed+1 WHERE worker=?", (worker,))
+
+
+# ====== 조정자 쪽 스케줄러 ======
+class QueueScheduler:
+    """
+    TRScheduler.map 과 같은 인터페이스. 종목별 작업을 큐에 넣고, 워커가 끝낸 종목마다
+    fn(item)을 여기서 호출(보통 워커가 채운 로컬 캐시 읽기)해 결과로 돌려준다.
+    """
+
+    def __init__(self, queue: WorkQueue, run: str, kind: str, params: dict = None, label: str = "Queue"):
+        self.queue = queue
+        self.run = run
+        self.kind = kind
+        self.params = params or {}
+        self.label = label
+        self.key = label.lower()
+
+    def map(self, fn, items, priorities=None, on_result=None):
+        items = list(items)
+        if not items:
+            return {}, {}
+        self.queue.enqueue(self.run, self.kind, items, priorities, self.params)
+        results, errors = {}, {}
+        left = set(items)
+        last_progress = time.monotonic()
+        while left:
+            finished = self.queue.outcomes(self.run, self.kind, left)
+            for item, (state, error) in finished.items():
+                left.discard(item)
+                if state == "done":
+                    try:
+                        results[item] = fn(item)
+                    except Exception as e:
+                        errors[item] = e
+                else:
+                    errors[item] = RuntimeError(f"작업 실패: {error}")
+                if on_result is not None:
+                    on_result(item, results.get(item), errors.get(item))
+            if finished:
+                last_progress = time.monotonic()
+                print(f"[{self.label}] 큐 진행: {len(items) - len(left)}/{len(items)} "
+                      f"| 워커 {self.queue.live_workers(self.run)}")
+                continue
+            if time.monotonic() - last_progress > STALL_SEC and self.queue.live_workers(self.run) == 0:
+                n = self.queue.fail_pending(self.run, self.kind, f"워커 없음 ({STALL_SEC:.0f}s 동안 진행 없음)")
+                print(f"[WARN] {self.label}: 살아 있는 워커가 없어 남은 작업 {n}개 실패 처리")
+                last_progress = time.monotonic()
+                continue
+            time.sleep(POLL_SEC)
+
+        for e in errors.values():
+            REPORT.count(f"{self.key}.errors")
+        REPORT.rows(f"{self.key}.coverage", len(items), len(results))
+        print(f"[{self.label}] 커버리지 {len(results)}/{len(items)} ({len(results) / len(items):.1%}) | 실패 {len(errors)}")
+        return results, errors
+
+
+class RunQueue:
+    """실행 하나(기준일)의 큐 손잡이 — step2/step3 run(queue=...) 에 넘김"""
+
+    def __init__(self, date: str, path: str = QUEUE_DB):
+        self.queue = WorkQueue(path)
+        self.date = date
+        self.run = self.queue.open_run(date)
+
+    def scheduler(self, kind: str, params: dict = None, label: str = "Queue") -> QueueScheduler:
+        return QueueScheduler(self.queue, self.run, kind, params, label)
+
+    def close(self):
+        self.queue.close_run(self.run)
+
+
+# ====== 워커 ======
+def _entrypoint(worker_id: int, fake: bool, date: str):
+    if fake:
+        from fake_entrypoint import FakeKiwoomEntrypoint
+        return FakeKiwoomEntrypoint(as_of=date, seed=0)
+    from koapy import KiwoomOpenApiPlusEntrypoint
+    # 워커마다 별도 서버 포트 (한 PC 에서 세션 여러 개)
+    return KiwoomOpenApiPlusEntrypoint(port=5943 + worker_id)
+
+
+def worker_main(path: str, run: str, worker_id: int, credentials: dict, fake: bool, date: str, tr_share: int = 1):
+    """
+    워커 프로세스 본체: 로그인 → (작업 임대 → TRScheduler 로 실행 → 완료/실패 기록) 반복.
+    실행이 닫히고(close_run) 남은 작업이 없으면 종료. tr_share: 같은 계정을 쓰는 워커 수 (TR 제한을 나눔)
+    """
+    import tr_scheduler
+    if tr_share > 1:
+        tr_scheduler.TR_LIMITS = [(count / tr_share, per_sec, burst) for count, per_sec, burst in tr_scheduler.TR_LIMITS]
+    queue = WorkQueue(path)
+    worker = f"w{worker_id}-{os.getpid()}"
+    queue.register(run, worker)
+
+    stop = threading.Event()
+
+    def beat():
+        while not stop.wait(HEARTBEAT_SEC):
+            try:
+                queue.heartbeat(run, worker)
+            except sqlite3.Error as e:
+                print(f"[{worker}] 하트비트 실패: {e}")
+
+    threading.Thread(target=beat, daemon=True).start()
+    with _entrypoint(worker_id, fake, date) as ep:
+        ep.EnsureConnected(credentials)
+        scheduler = TRScheduler(label=f"Worker{worker_id}", log_every=CLAIM_BATCH,
+                                reconnect=lambda: ep.EnsureConnected(credentials))
+
+        def on_result(job, result, error):
+            if error is None:
+                queue.complete(job.id, worker, result)
+            else:
+                queue.fail(job.id, worker, error)
+
+        done = 0
+        try:
+            while True:
+                jobs = queue.claim(run, worker)
+                if not jobs:
+                    if queue.closed(run):
+                        break
+                    time.sleep(POLL_SEC)
+                    continue
+                scheduler.map(lambda job: JOB_KINDS[job.kind](ep, job.code, json.loads(job.params or "{}")),
+                              jobs, priorities=[j.priority for j in jobs], on_result=on_result)
+                done += len(jobs)
+        finally:
+            stop.set()
+    print(f"[{worker}] 종료 (처리 {done}건)")
+
+
+def load_accounts(path: str = None) -> list:
+    """계정 목록 JSON (없으면 common.credentials 하나)"""
+    if path:
+        with open(path, encoding="utf-8") as f:
+            accounts = json.load(f)
+        if accounts:
+            return accounts
+    from common import credentials
+    return [credentials]
+
+
+def start_workers(rq: RunQueue, workers: int, accounts: list, fake: bool = False) -> list:
+    """워커 프로세스 시작 (계정을 돌려 가며 배정, 같은 계정을 쓰는 워커끼리 TR 제한을 나눔)"""
+    procs = []
+    for i in range(workers):
+        share = len(range(i % len(accounts), workers, len(accounts)))
+        p = multiprocessing.Process(
+            target=worker_main, name=f"queue-worker-{i}",
+            args=(rq.queue.path, rq.run, i, accounts[i % len(accounts)], fake, rq.date, share),
+        )
+        p.start()
+        procs.append(p)
+    print(f"[QUEUE] 실행 {rq.run}: 워커 {workers}개 / 계정 {min(workers, len(accounts))}개")
+    return procs
+
+
+def stop_workers(rq: RunQueue, procs: list, timeout: float = 30.0):
+    rq.close()
+    for p in procs:
+        p.join(timeout)
+        if p.is_alive():
+            print(f"[WARN] {p.name} 종료 지연 → 강제 종료")
+            p.terminate()
+
+
+def main():
+    p = argparse.ArgumentParser(description="TR 작업 큐")
+    sub = p.add_subparsers(dest="cmd")
+    sub.add_parser("status", help="실행별 작업 상태")
+    w = sub.add_parser("worker", help="열린 실행에 워커 하나 붙이기")
+    w.add_argument("--run", required=True)
+    w.add_argument("--id", type=int, default=100)
+    w.add_argument("--accounts", default=None)
+    w.add_argument("--fake-kiwoom", action="store_true")
+    args = p.parse_args()
+
+    if args.cmd == "worker":
+        worker_main(QUEUE_DB, args.run, args.id, load_accounts(args.accounts)[0], args.fake_kiwoom,
+                    args.run.split("@")[0])
+        return
+    for run, kind, state, n in WorkQueue().status():
+        print(f"{run:<26} {kind:<9} {state:<7} {n}")
+
+
+if __name__ == "__main__":
+    main()